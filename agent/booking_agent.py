@@ -3,277 +3,784 @@ Conversational AI agent for booking Google Calendar appointments.
 Uses Langchain to understand user intent, check availability, and create events via direct tool calls.
 """
 
+import logging
 import os
-from langchain.agents import initialize_agent, Tool, AgentType
-from backend.calendar_utils import check_availability, create_event
-from langchain_google_genai import ChatGoogleGenerativeAI
+import re
+import threading
+from backend.calendar_utils import (
+    check_availability, create_event, search_free_slots, book_if_free,
+    asearch_free_slots, abook_if_free, calendars_for,
+    book_recurring_if_free, abook_recurring_if_free, parse_in_zone,
+)
 from dotenv import load_dotenv
-from dateutil import parser, tz
-from langchain_core.prompts import ChatPromptTemplate
+from agent.fast_parser import try_fast_path
+from agent.extraction_cache import extraction_cache
+from agent.llm_gateway import llm_gateway, LLMUnavailable
+from agent.extraction_schema import (
+    EventDetails, decode_json_object, extraction_stats, parse_event_details, raw_text,
+)
+from backend import calendar_utils
+from backend.idempotency import booking_event_id
+from backend.logging_config import log_payload
+from backend.metrics import metrics
+from backend.timezones import get_zone, local_datetime, resolve_timezone, today_in
+
+logger = logging.getLogger(__name__)
+
+# Langchain, the Gemini client and the ReAct agent are imported and built on first use
+# (see get_llm / get_agent), so importing this module stays cheap at cold start.
 
 # 1. Define tools for the agent
 
+def _tool_times(start_time, end_time, timezone=None):
+    """
+    Parses the tool's start and end strings once, as aware datetimes in the query's time zone
+    (DEFAULT_TIMEZONE when the agent leaves it out). Returns (start_dt, end_dt, timezone).
+    """
+    timezone = resolve_timezone(timezone)
+    zone = get_zone(timezone)
+    return parse_in_zone(start_time.strip(), zone), parse_in_zone(end_time.strip(), zone), timezone
+
 def tool_check_availability(query: str) -> str:
     """Check if a time slot is available. Expects query to be 'start_time|end_time|timezone'"""
-    print("tool_check_availability called with:", query)
+    logger.debug("tool_check_availability called with: %s", query)
     try:
-        start_time, end_time, *_ = query.split('|')
-        # Always use Asia/Kolkata timezone
-        ist = tz.gettz('Asia/Kolkata')
-        if "T" not in start_time:
-            start_time = parser.parse(start_time).replace(tzinfo=ist).strftime('%Y-%m-%dT%H:%M:%S')
-        if "T" not in end_time:
-            end_time = parser.parse(end_time).replace(tzinfo=ist).strftime('%Y-%m-%dT%H:%M:%S')
-        timezone = 'Asia/Kolkata'
-        print("Parsed times:", start_time, end_time, timezone)
-        is_free, busy_info = check_availability(start_time, end_time, timezone)
-        print("tool_check_availability result:", is_free, busy_info)
+        start_time, end_time, *rest = query.split('|')
+        start_dt, end_dt, timezone = _tool_times(start_time, end_time, rest[0] if rest else None)
+        is_free, busy_info = check_availability(start_dt, end_dt, timezone)
+        log_payload(logger, "tool_check_availability result: %s %s", is_free, busy_info)
         if is_free:
             return "The time slot is available."
         else:
             return f"The time slot is busy. Busy slots: {busy_info}"
     except Exception as e:
-        print("tool_check_availability exception:", repr(e))
+        logger.warning("tool_check_availability failed: %r", e)
         return f"Error checking availability: {e}"
 
 def tool_create_event(query: str) -> str:
     """Create a calendar event. Expects query to be 'start_time|end_time|summary|description|timezone'"""
-    print("tool_create_event called with:", query)
+    logger.debug("tool_create_event called with: %s", query)
     try:
-        start_time, end_time, summary, description, *_ = query.split('|')
-        # Always use Asia/Kolkata timezone
-        ist = tz.gettz('Asia/Kolkata')
-        if "T" not in start_time:
-            start_time = parser.parse(start_time).replace(tzinfo=ist).strftime('%Y-%m-%dT%H:%M:%S')
-        if "T" not in end_time:
-            end_time = parser.parse(end_time).replace(tzinfo=ist).strftime('%Y-%m-%dT%H:%M:%S')
-        timezone = 'Asia/Kolkata'
-        print("Parsed times:", start_time, end_time, summary, description, timezone)
-        event = create_event(start_time, end_time, summary, description, timezone)
-        print("tool_create_event result:", event)
+        start_time, end_time, summary, description, *rest = query.split('|')
+        start_dt, end_dt, timezone = _tool_times(start_time, end_time, rest[0] if rest else None)
+        event = create_event(start_dt, end_dt, summary, description, timezone)
+        log_payload(logger, "tool_create_event result: %s", event)
         if isinstance(event, dict) and event.get("htmlLink"):
             return f"Event created successfully! Link: {event['htmlLink']}"
         else:
             return "Event creation failed."
     except Exception as e:
-        print("tool_create_event exception:", repr(e))
+        logger.warning("tool_create_event failed: %r", e)
         return f"Error creating event: {e}"
 
+def tool_find_free_slots(query: str) -> str:
+    """Find the earliest free slots. Expects query to be 'range_start|range_end|duration_minutes|timezone'"""
+    logger.debug("tool_find_free_slots called with: %s", query)
+    try:
+        range_start, range_end, duration, *rest = query.split('|')
+        start_dt, end_dt, timezone = _tool_times(range_start, range_end, rest[0] if rest else None)
+        slots = search_free_slots(start_dt, end_dt, int(duration), timezone)
+        log_payload(logger, "tool_find_free_slots result: %s", slots)
+        if not slots:
+            return "No free slots found in that range."
+        return "Free slots: " + ", ".join(f"{slot['start']} to {slot['end']}" for slot in slots)
+    except Exception as e:
+        logger.warning("tool_find_free_slots failed: %r", e)
+        return f"Error finding free slots: {e}"
+
 # 2. Register tools
 
-tools = [
-    Tool(
-        name="CheckAvailability",
-        func=tool_check_availability,
-        description="Check if a time slot is available. Input: 'start_time|end_time|timezone'"
-    ),
-    Tool(
-        name="CreateEvent",
-        func=tool_create_event,
-        description="Create a calendar event. Input: 'start_time|end_time|summary|description|timezone'"
-    )
-]
+def build_tools() -> list:
+    """
+    Wraps the tool functions as Langchain tools for the ReAct agent.
+    """
+    from langchain.agents import Tool
+    return [
+        Tool(
+            name="CheckAvailability",
+            func=tool_check_availability,
+            description="Check if a time slot is available. Input: 'start_time|end_time|timezone'"
+        ),
+        Tool(
+            name="CreateEvent",
+            func=tool_create_event,
+            description="Create a calendar event. Input: 'start_time|end_time|summary|description|timezone'"
+        ),
+        Tool(
+            name="FindFreeSlots",
+            func=tool_find_free_slots,
+            description="Find the earliest free slots of a given length. Input: 'range_start|range_end|duration_minutes|timezone'"
+        )
+    ]
 
-# 3. Initialize the Gemini LLM and agent (using a model you have access to)
+# 3. Initialize the Gemini LLM and agent lazily (using a model you have access to)
 
 load_dotenv()
 # Update Gemini API key and model
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "models/gemini-2.0-flash"
 
-llm = ChatGoogleGenerativeAI(google_api_key=GEMINI_API_KEY, model="models/gemini-2.0-flash")
+_llm = None
+_agent = None
+_init_lock = threading.RLock()
+
+def get_llm():
+    """
+    Returns the shared Gemini chat model, constructing it on first use.
+    """
+    global _llm
+    if _llm is None:
+        with _init_lock:
+            if _llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                _llm = ChatGoogleGenerativeAI(google_api_key=GEMINI_API_KEY, model=GEMINI_MODEL)
+    return _llm
+
+def set_llm(model) -> None:
+    """
+    Replaces the shared chat model (e.g. with a stub for benchmarks).
+    """
+    global _llm
+    with _init_lock:
+        _llm = model
 
-agent = initialize_agent(
-    tools,
-    llm,
-    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True
+def get_agent():
+    """
+    Returns the ReAct agent over the calendar tools, built on first use.
+    run_agent_conversation calls the tools directly, so the request path never needs it.
+    """
+    global _agent
+    if _agent is None:
+        with _init_lock:
+            if _agent is None:
+                from langchain.agents import initialize_agent, AgentType
+                _agent = initialize_agent(
+                    build_tools(),
+                    get_llm(),
+                    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                    verbose=True
+                )
+    return _agent
+
+def __getattr__(name):
+    # Keep `booking_agent.llm`, `.agent` and `.tools` working without building them at import time
+    if name == "llm":
+        return get_llm()
+    if name == "agent":
+        return get_agent()
+    if name == "tools":
+        return build_tools()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 4. Functions to extract event parameters from conversation history
+
+def safe_extract_json(text: str) -> dict:
+    """
+    Extracts the first JSON object from Gemini's text output, which may be wrapped in a code
+    block or prose and may contain nested objects.
+    """
+    try:
+        return decode_json_object(text)
+    except ValueError as e:
+        logger.warning("safe_extract_json failed: %s", e)
+        raise
+
+EXTRACTION_SYSTEM_PROMPT = (
+    "You are a helpful assistant that extracts event details from a chat transcript for Google Calendar booking. "
+    "Today's date is {today}. Always return ONLY a valid JSON object with keys: summary, date (YYYY-MM-DD), start_time (HH:MM, 24h), end_time (HH:MM, 24h), description, and recurrence. "
+    "date is the first occurrence; recurrence is an RFC 5545 RRULE without the 'RRULE:' prefix if the event repeats "
+    "(e.g. 'every weekday for a month' -> FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;UNTIL=YYYYMMDD), otherwise an empty string. "
+    "Do not include any explanation, markdown, or formatting—just the JSON. "
+    "If any field is missing or ambiguous, set its value to 'MISSING'. Infer missing details from the conversation context if possible."
 )
 
-# 4. Function to extract event parameters from conversation history
-def extract_event_parameters(conversation_history: list) -> tuple:
+_prompts = None
+
+def get_prompts() -> dict:
     """
-    Uses Gemini to extract event parameters from the conversation history.
-    Always returns a tuple: (params_dict, raw_gemini_output_or_error_message)
+    The extraction prompt templates, compiled once and filled in per call: 'transcript' (a whole
+    conversation), 'session' (known fields plus new turns) and 'repair' (appended after an answer
+    that did not fit the schema).
+    """
+    global _prompts
+    if _prompts is None:
+        with _init_lock:
+            if _prompts is None:
+                from langchain_core.prompts import ChatPromptTemplate
+                _prompts = {
+                    "transcript": ChatPromptTemplate.from_messages([
+                        ("system", EXTRACTION_SYSTEM_PROMPT),
+                        ("human", "Here is the chat transcript:\n{transcript}\nExtract the event details as JSON."),
+                    ]),
+                    "session": ChatPromptTemplate.from_messages([
+                        ("system", EXTRACTION_SYSTEM_PROMPT),
+                        ("human", "Event details known so far: {known}\nNew messages:\n{delta}\n"
+                                  "Apply any changes the new messages ask for and return the complete event details as JSON."),
+                    ]),
+                    "repair": ChatPromptTemplate.from_messages([
+                        ("ai", "{answer}"),
+                        ("human", "That answer is not valid: {error}\n"
+                                  "Return the complete event details again, correcting only what is wrong."),
+                    ]),
+                }
+    return _prompts
+
+def extraction_system_prompt(today=None) -> str:
+    """
+    today is the date in the user's time zone (the default zone's when None).
+    """
+    return EXTRACTION_SYSTEM_PROMPT.format(today=(today or today_in()).isoformat())
+
+def build_extraction_prompt(conversation_history: list, transcript: str = None, today=None) -> list:
+    """
+    Formats the extraction prompt messages for the given conversation history,
+    or for an already formatted transcript (e.g. a session's incrementally kept one).
+    """
+    if transcript is None:
+        transcript = "\n".join([
+            ("User: " + m["content"]) if m["role"] == "user" else ("Assistant: " + m["content"]) for m in conversation_history
+        ])
+    return get_prompts()["transcript"].format_messages(today=(today or today_in()).isoformat(), transcript=transcript)
+
+def build_session_prompt(session, today=None) -> list:
+    """
+    Extraction prompt for a session turn: only the messages since the last extraction plus the
+    fields already known, instead of the whole transcript.
     """
-    from datetime import datetime
     import json
-    import re
 
-    def safe_extract_json(text: str) -> dict:
-        """
-        Attempts to safely extract a JSON object from Gemini's text output.
-        Handles code blocks and extra whitespace.
-        """
-        import re
-        import json
+    known = json.dumps(session.params) if session.params else "none yet"
+    return get_prompts()["session"].format_messages(today=(today or today_in()).isoformat(), known=known,
+                                                    delta="\n".join(session.delta()))
+
+def build_repair_prompt(prompt: list, answer: str, error) -> list:
+    """
+    The extraction prompt followed by the rejected answer and why it was rejected.
+    """
+    return prompt + get_prompts()["repair"].format_messages(answer=answer, error=error)
+
+_extractor = None
 
+def get_extractor():
+    """
+    The shared chat model bound to the EventDetails schema through its structured-output mode,
+    answering {"raw", "parsed", "parsing_error"}; the plain model (answering text) if it has none.
+    """
+    global _extractor
+    llm = get_llm()
+    extractor = _extractor
+    if extractor is None or extractor[0] is not llm:
+        with _init_lock:
+            try:
+                bound = llm.with_structured_output(EventDetails, include_raw=True)
+            except (AttributeError, NotImplementedError):
+                bound = llm
+            extractor = _extractor = (llm, bound)
+    return extractor[1]
+
+def _read_extraction(response) -> tuple:
+    """
+    Returns (details, raw, error): the EventDetails of a model answer, or None and the reason it
+    does not fit the schema, with the answer as text.
+    """
+    structured = isinstance(response, dict) and "raw" in response
+    message = response["raw"] if structured else response
+    extraction_stats.record_call(message)
+    raw = raw_text(message)
+    log_payload(logger, "Gemini raw output: %s", raw)
+    details, error = (response.get("parsed"), response.get("parsing_error")) if structured else (None, None)
+    if details is None and error is None:
+        # Plain text answers, and structured calls answered in text instead of a function call
         try:
-            print("\n--- Raw Gemini Response Start ---")
-            print(text)
-            print("--- Raw Gemini Response End ---\n")
+            details = parse_event_details(raw)
+        except ValueError as e:
+            error = e
+    if details is None:
+        logger.warning("Extraction answer does not fit the schema: %s", error)
+    return details, raw, error
+
+def _finish_extraction(details, raw, error, repaired, message, session, today):
+    extraction_stats.record("failed" if details is None else "repaired" if repaired else "parsed")
+    if details is None:
+        return {}, f"[extract_event_parameters Exception] {error}"
+    params = details.model_dump()
+    log_payload(logger, "Extracted params: %s", params)
+    extraction_cache.store(message, params, today)
+    return _finish_session_extraction(session, (params, raw))
+
+def _fast_path_for(conversation_history, session, today):
+    if session is not None:
+        conversation_history = [{"role": "user", "content": session.latest_user_message() or ""}]
+    return try_fast_path(conversation_history, today)
+
+def _cacheable_message(conversation_history, session):
+    """
+    The user message when the extraction depends on it alone (single-turn history, or a session
+    with nothing known yet and no earlier turns), else None.
+    """
+    if session is not None:
+        delta = session.delta()
+        if session.params or len(delta) != 1 or len(session.lines) != 1:
+            return None
+        return session.latest_user_message()
+    if conversation_history and len(conversation_history) == 1 and conversation_history[0]["role"] == "user":
+        return conversation_history[0]["content"]
+    return None
+
+def _cached_extraction(message, session, today):
+    params = extraction_cache.lookup(message, today) if message else None
+    if params is None:
+        return None
+    logger.debug("Extraction cache hit")
+    return _finish_session_extraction(session, (params, "[extraction-cache hit]"))
+
+def _extraction_prompt(conversation_history, session, today):
+    """
+    For a session, only the new turns and the known fields; else the whole conversation.
+    """
+    if session is None:
+        return build_extraction_prompt(conversation_history, today=today)
+    return build_session_prompt(session, today)
+
+def _finish_session_extraction(session, result):
+    params, raw = result
+    if session is None:
+        return result
+    session.mark_extracted()
+    return session.update_params(params), raw
+
+def _extraction_shortcut(conversation_history, session, today):
+    """
+    (params, raw) from the fast path or the extraction cache, or None if Gemini has to be asked.
+    """
+    fast = _fast_path_for(conversation_history, session, today)
+    if fast:
+        return _finish_session_extraction(session, fast)
+    return _cached_extraction(_cacheable_message(conversation_history, session), session, today)
+
+def _ask_extractor(prompt, span):
+    with metrics.span(span):
+        response = llm_gateway.invoke(get_extractor(), prompt)
+    with metrics.span("json_parse"):
+        return _read_extraction(response)
+
+async def _aask_extractor(prompt, span):
+    with metrics.span(span):
+        response = await llm_gateway.ainvoke(get_extractor(), prompt)
+    with metrics.span("json_parse"):
+        return _read_extraction(response)
+
+def extract_event_parameters(conversation_history: list, session=None, timezone=None) -> tuple:
+    """
+    Uses Gemini to extract event parameters from the conversation history.
+    Well-formed messages are handled by the deterministic fast path without calling Gemini, and
+    repeated single messages are answered from the extraction cache.
+    With a session (backend.sessions.Session), only the new turns and the known fields are sent,
+    and the result is merged into the session's params.
+    Relative dates ("tomorrow") are resolved against today in timezone (DEFAULT_TIMEZONE when None).
+    The answer is validated against EventDetails; if it does not fit, Gemini is asked once to
+    repair it before the turn gives up. Calls go through the LLM gateway, which raises
+    LLMUnavailable when Gemini is overloaded or too slow.
+    Always returns a tuple: (params_dict, raw_gemini_output_or_error_message)
+    """
+    today = today_in(timezone)
+    shortcut = _extraction_shortcut(conversation_history, session, today)
+    if shortcut:
+        return shortcut
+    message = _cacheable_message(conversation_history, session)
+    try:
+        prompt = _extraction_prompt(conversation_history, session, today)
+        details, raw, error = _ask_extractor(prompt, "llm_extraction")
+        repaired = details is None
+        if repaired:
+            details, raw, error = _ask_extractor(build_repair_prompt(prompt, raw, error), "llm_repair")
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("Extraction failed")
+        return {}, f"[extract_event_parameters Exception] {e}"
+    return _finish_extraction(details, raw, error, repaired, message, session, today)
+
+async def aextract_event_parameters(conversation_history: list, session=None, timezone=None) -> tuple:
+    """
+    Async variant of extract_event_parameters using ainvoke.
+    """
+    today = today_in(timezone)
+    shortcut = _extraction_shortcut(conversation_history, session, today)
+    if shortcut:
+        return shortcut
+    message = _cacheable_message(conversation_history, session)
+    try:
+        prompt = _extraction_prompt(conversation_history, session, today)
+        details, raw, error = await _aask_extractor(prompt, "llm_extraction")
+        repaired = details is None
+        if repaired:
+            details, raw, error = await _aask_extractor(build_repair_prompt(prompt, raw, error), "llm_repair")
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("Extraction failed")
+        return {}, f"[extract_event_parameters Exception] {e}"
+    return _finish_extraction(details, raw, error, repaired, message, session, today)
+
 
-            # Strip code block markers and extra spaces
-            text = re.sub(r"^```(json)?", "", text.strip(), flags=re.IGNORECASE | re.MULTILINE)
-            text = re.sub(r"```$", "", text.strip(), flags=re.MULTILINE)
-            text = text.strip()
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
 
-            # Extract just the first JSON object (non-greedy match)
-            match = re.search(r"\{[\s\S]*?\}", text)
-            if not match:
-                raise ValueError("No JSON object found in Gemini output.")
+def extract_attendees(text) -> list:
+    """
+    Email addresses mentioned in a message ("with alice@example.com and bob@example.com"), in order.
+    """
+    return list(dict.fromkeys(match.rstrip('.') for match in EMAIL_RE.findall(text or "")))
 
-            json_str = match.group(0).strip()
-            print("[Clean JSON string]:", json_str)
-            return json.loads(json_str)
+def resolve_attendees(user_message, attendees=None, session=None) -> list:
+    """
+    Attendees for this turn: those passed by the client, those mentioned in the message and, in a
+    session, those named in earlier turns of the same booking. They are kept in the session until
+    the booking is made.
+    """
+    known = session.params.get('attendees', []) if session is not None else []
+    merged = list(dict.fromkeys([*known, *(attendees or ()), *extract_attendees(user_message)]))
+    if session is not None and merged:
+        session.params['attendees'] = merged
+    return merged
 
-        except Exception as e:
-            print("[safe_extract_json Error]", e)
-            raise
+def suggestion_range(start_dt, end_dt, days=7) -> tuple:
+    """
+    Returns (range_start, range_end, duration_minutes) for alternative slots to a busy request.
+    """
+    from datetime import timedelta
+    duration = int((end_dt - start_dt).total_seconds() // 60)
+    return start_dt.isoformat(), (start_dt + timedelta(days=days)).isoformat(), duration
 
+def format_slot_suggestions(slots: list) -> str:
+    """
+    Formats free slots so a busy reply can offer alternatives instead of making the user guess again.
+    """
+    if not slots:
+        return ""
+    lines = [f"- {slot['start'][:10]} from {slot['start'][11:16]} to {slot['end'][11:16]}" for slot in slots]
+    return "**Next free slots:**\n" + "\n".join(lines) + "\n\n"
 
+def suggest_free_slots(start_dt, end_dt, timezone, limit=3, attendees=None) -> str:
     try:
-        today = datetime.now().strftime('%Y-%m-%d')
-        transcript = "\n".join([
-            ("User: " + m["content"]) if m["role"] == "user" else ("Assistant: " + m["content"]) for m in conversation_history
-        ])
+        slots = search_free_slots(*suggestion_range(start_dt, end_dt), timezone, limit=limit, include_weekends=True,
+                                  calendar_ids=calendars_for(attendees))
+    except Exception as e:
+        logger.warning("Could not compute free slot suggestions: %r", e)
+        return ""
+    return format_slot_suggestions(slots)
 
-        system_prompt = (
-            f"You are a helpful assistant that extracts event details from a chat transcript for Google Calendar booking. "
-            f"Today's date is {today}. Always return ONLY a valid JSON object with keys: summary, date (YYYY-MM-DD), start_time (HH:MM, 24h), end_time (HH:MM, 24h), and description. "
-            "Do not include any explanation, markdown, or formatting—just the JSON. "
-            "If any field is missing or ambiguous, set its value to 'MISSING'. Infer missing details from the conversation context if possible."
+async def asuggest_free_slots(start_dt, end_dt, timezone, limit=3, attendees=None) -> str:
+    try:
+        slots = await asearch_free_slots(*suggestion_range(start_dt, end_dt), timezone, limit=limit,
+                                         include_weekends=True, calendar_ids=calendars_for(attendees))
+    except Exception as e:
+        logger.warning("Could not compute free slot suggestions: %r", e)
+        return ""
+    return format_slot_suggestions(slots)
+
+# 5. Main functions to handle the workflow
+
+def validate_params(params, raw_gemini):
+    """
+    Returns a reply asking the user for more details if params can't be booked, else None.
+    """
+    required = ["summary", "date", "start_time", "end_time"]
+    # Robust type and key checks
+    if not isinstance(params, dict):
+        return (
+            "Sorry, I couldn't understand the details from your message.\n"
+            f"Extracted parameters (not a dict): {params}\n"
+            f"Raw Gemini output: {raw_gemini}\n"
+            "Please try rephrasing your request or provide more details."
         )
+    missing = [k for k in required if not params.get(k) or params[k] == 'MISSING']
+    if missing:
+        pretty = {
+            "summary": "what the event is about",
+            "date": "the date of the event",
+            "start_time": "when the event starts",
+            "end_time": "when the event ends"
+        }
+        missing_pretty = [pretty.get(k, k) for k in missing]
+
+        field_list = ", ".join(missing_pretty[:-1])
+        if len(missing_pretty) > 1:
+            field_list += f" and {missing_pretty[-1]}"
+        else:
+            field_list = missing_pretty[0]
 
-        from langchain_core.prompts import ChatPromptTemplate
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", f"Here is the chat transcript:\n{transcript}\nExtract the event details as JSON.")
-        ])
+        return (
+            f"⚠️ I couldn't get all the necessary details to book your appointment.\n\n"
+            f"Please rewrite your message including **{field_list}**.\n\n"
+            "For example: `Book a doctor appointment tomorrow from 3pm to 4pm for stomach ache.`"
+        )
 
-        formatted_prompt = prompt.format_messages(transcript=transcript)
-        response = llm.invoke(formatted_prompt)
+    # Extra key checks before using params fields
+    for k in required:
+        if k not in params or not params[k] or params[k] == 'MISSING':
+            return (
+                f"Sorry, the '{k}' field is missing or invalid.\n"
+                f"Extracted parameters: {params}\n"
+                f"Raw Gemini output: {raw_gemini}\n"
+                "Please try rephrasing your request or provide more details."
+            )
+    return None
 
-        # ✅ Extract only the clean content
-        raw = response.content if hasattr(response, 'content') else str(response)
+def recurrence_of(params):
+    """
+    The extracted RRULE, or '' for a one-off event (the LLM may answer 'MISSING' or 'none').
+    """
+    value = params.get('recurrence') or ''
+    return '' if value.strip().upper() in ('', 'MISSING', 'NONE', 'NULL') else value.strip()
+
+def recurrence_error_reply(params, error) -> str:
+    return (
+        "Sorry, I couldn't understand how often the event repeats.\n"
+        f"Recurrence: {params.get('recurrence')}\n"
+        f"Error: {error}\n"
+        "Please say it differently, e.g. `every weekday until 30 November`."
+    )
 
-        print("[Gemini Raw Output]:", raw)
+def compose_datetimes(params, zone) -> tuple:
+    """
+    Composes aware start/end datetimes in zone from the extracted params. They are passed on to
+    the calendar calls as they are, without being formatted and parsed again.
+    """
+    return (local_datetime(params['date'], params['start_time'], zone),
+            local_datetime(params['date'], params['end_time'], zone))
+
+def datetime_error_reply(params, raw_gemini, dt_err) -> str:
+    return (
+        f"Sorry, there was an error parsing the date or time.\n"
+        f"Extracted parameters: {params}\n"
+        f"Raw Gemini output: {raw_gemini}\n"
+        f"Error: {dt_err}"
+    )
+
+CONTESTED_HEADLINE = "❌ **Sorry, the time slot is being booked by another request.**"
+
+def busy_reply(params, busy_info, suggestions, contested=False, timezone=None) -> str:
+    headline = CONTESTED_HEADLINE if contested else "❌ **Sorry, the time slot is already booked.**"
+    return (
+        f"{headline}\n\n"
+        f"**Busy from:** {busy_info[0]['start'][11:16]} to {busy_info[0]['end'][11:16]} on {params['date']} ({resolve_timezone(timezone)} timezone)\n"
+        f"**Your request:** {params['summary']} on {params['date']} from {params['start_time']} to {params['end_time']}\n\n"
+        f"{suggestions}"
+        "👉 Please try a different time or rewrite your message with a new slot."
+    )
+
+def recurring_busy_reply(params, result, contested=False, timezone=None) -> str:
+    if contested:
+        return busy_reply(params, result['busy_slots'], "", contested=True, timezone=timezone)
+    lines = [f"- {slot['start'][:10]} from {slot['start'][11:16]} to {slot['end'][11:16]}" for slot in result['conflicts']]
+    return (
+        "❌ **Sorry, some occurrences of this series are already booked.**\n\n"
+        f"**{result['message']}** Busy occurrences:\n" + "\n".join(lines) + "\n\n"
+        f"**Your request:** {params['summary']} from {params['start_time']} to {params['end_time']}, "
+        f"starting {params['date']} ({params['recurrence']})\n\n"
+        "👉 Please pick a different time or rewrite your message with a new slot."
+    )
+
+def booked_reply(params, event, raw_gemini, attendees=None, timezone=None) -> str:
+    if isinstance(event, dict) and event.get("htmlLink"):
+        return (
+            "✅ **Success! Your event has been booked.**\n\n"
+            f"**Summary:** {params['summary']}\n"
+            f"**Date:** {params['date']}\n"
+            f"**Time:** {params['start_time']} – {params['end_time']} ({resolve_timezone(timezone)})\n"
+            + (f"**Repeats:** {params['recurrence']}\n" if params.get('recurrence') else "") +
+            f"**Description:** {params.get('description', '') or 'No description'}\n"
+            + (f"**Attendees:** {', '.join(attendees)}\n" if attendees else "") +
+            f"\n[🗓️ Add to Calendar]({event['htmlLink']})"
+        )
+    return f"Sorry, there was an error booking your event.\nExtracted parameters: {params}\nRaw Gemini output: {raw_gemini}"
+
+def booking_error_reply(params, raw_gemini, api_err) -> str:
+    return (
+        f"Sorry, something went wrong during booking.\n"
+        f"Extracted parameters: {params}\n"
+        f"Raw Gemini output: {raw_gemini}\n"
+        f"Error: {api_err}"
+    )
 
-        params = safe_extract_json(raw)
-        print("[Extracted Params]:", params)
-        return params, raw
+def understood_text(params, attendees=None) -> str:
+    """
+    Progress text shown while a booking is checked: what the request was understood as.
+    """
+    text = f"Understood: {params['summary']} on {params['date']} from {params['start_time']} to {params['end_time']}"
+    if params.get('recurrence'):
+        text += f", repeating {params['recurrence']}"
+    return text + (f" with {', '.join(attendees)}" if attendees else "")
+
+def report_progress(progress, stage, text):
+    """
+    Calls progress(stage, text) if the caller streams progress; a failing callback never fails the turn.
+    """
+    if progress is None:
+        return
+    try:
+        progress(stage, text)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {}, f"[extract_event_parameters Exception] {e}"
+        logger.warning("Progress callback failed: %r", e)
 
+def is_retryable_reply(reply) -> bool:
+    """
+    True for replies a retry of the same message may change: failed Calendar or LLM calls
+    (booking_error_reply, llm_unavailable_reply, unexpected_error_reply) and slots contested by an
+    in-flight booking.
+    """
+    return reply.startswith(("Sorry, something went wrong", CONTESTED_HEADLINE))
+
+def llm_unavailable_reply(e) -> str:
+    logger.warning("LLM unavailable: %s", e)
+    return (
+        "Sorry, something went wrong: the assistant is busy right now.\n"
+        f"Error: {e}\n"
+        "Please send your message again in a moment."
+    )
 
-# 5. Main function to handle the workflow
+def unexpected_error_reply(params, raw_gemini, e) -> str:
+    logger.exception("Unexpected agent error: %s", e)
+    return (
+        f"Sorry, something went wrong.\nError: {e}\n"
+        f"Extracted parameters: {params}\n"
+        f"Raw Gemini output: {raw_gemini}"
+    )
 
-def run_agent_conversation(user_message: str, conversation_history: list = None) -> str:
-    print(f"[Agent] Received user message: {user_message}")
+def _turn_inputs(user_message, conversation_history, session, attendees) -> tuple:
+    """
+    (conversation_history, attendees) for a turn: a single-turn history if none was given.
+    """
+    log_payload(logger, "Received user message: %s", user_message)
     if conversation_history is None:
         # Fallback to single-turn if no history is provided
         conversation_history = [{"role": "user", "content": user_message}]
-    params, raw_gemini = {}, ""
-    try:
-        params, raw_gemini = extract_event_parameters(conversation_history)
-        print(f"[Agent] (DEBUG) params: {params}")
-        print(f"[Agent] (DEBUG) raw_gemini: {raw_gemini}")
-        required = ["summary", "date", "start_time", "end_time"]
-        # Robust type and key checks
-        if not isinstance(params, dict):
-            return (
-                "Sorry, I couldn't understand the details from your message.\n"
-                f"Extracted parameters (not a dict): {params}\n"
-                f"Raw Gemini output: {raw_gemini}\n"
-                "Please try rephrasing your request or provide more details."
-            )
-        missing = [k for k in required if not params.get(k) or params[k] == 'MISSING']
-        if missing:
-            pretty = {
-                "summary": "what the event is about",
-                "date": "the date of the event",
-                "start_time": "when the event starts",
-                "end_time": "when the event ends"
-            }
-            missing_pretty = [pretty.get(k, k) for k in missing]
-
-            field_list = ", ".join(missing_pretty[:-1])
-            if len(missing_pretty) > 1:
-                field_list += f" and {missing_pretty[-1]}"
-            else:
-                field_list = missing_pretty[0]
+    return conversation_history, resolve_attendees(user_message, attendees, session)
 
-            return (
-                f"⚠️ I couldn't get all the necessary details to book your appointment.\n\n"
-                f"Please rewrite your message including **{field_list}**.\n\n"
-                "For example: `Book a doctor appointment tomorrow from 3pm to 4pm for stomach ache.`"
-            )
+def _turn_timezone(timezone, session) -> str:
+    return resolve_timezone(timezone or (session.timezone if session is not None else None))
 
-        # Extra key checks before using params fields
-        for k in required:
-            if k not in params or not params[k] or params[k] == 'MISSING':
-                return (
-                    f"Sorry, the '{k}' field is missing or invalid.\n"
-                    f"Extracted parameters: {params}\n"
-                    f"Raw Gemini output: {raw_gemini}\n"
-                    "Please try rephrasing your request or provide more details."
-                )
-        # Compose datetime strings in Asia/Kolkata
-        from datetime import datetime
-        from dateutil import tz
+def _booking_datetimes(params, raw_gemini, timezone, attendees, progress):
+    """
+    Validates the extracted params and composes the aware (start_dt, end_dt) to book in the user's
+    time zone, or returns the reply asking for what is missing or unreadable.
+    """
+    logger.debug("Extracted params: %s; raw output: %s", params, raw_gemini)
+    reply = validate_params(params, raw_gemini)
+    if reply:
+        return reply
+    params['recurrence'] = recurrence_of(params)
+    try:
+        with metrics.span("compose_datetimes"):
+            start_dt, end_dt = compose_datetimes(params, get_zone(timezone))
+    except Exception as dt_err:
+        return datetime_error_reply(params, raw_gemini, dt_err)
+    report_progress(progress, "understood", understood_text(params, attendees))
+    return start_dt, end_dt
+
+def _booking_args(params, start_dt, end_dt, timezone, attendees) -> tuple:
+    """
+    Arguments for book_recurring_if_free (a series) or book_if_free.
+    """
+    # From the booking itself, not the message: a later turn repeating an earlier message can
+    # ask for another event, and a retry of this one finds its event under the same id
+    event_id = booking_event_id(calendar_utils.current_calendar_id(), start_dt, end_dt, params['summary'],
+                                params['recurrence'])
+    if params['recurrence']:
+        return (start_dt, end_dt, params['summary'], params.get('description', ''), timezone, params['recurrence'],
+                event_id, attendees)
+    return start_dt, end_dt, params['summary'], params.get('description', ''), timezone, event_id, attendees
+
+def _wants_suggestions(params, result) -> bool:
+    # A busy one-off event gets alternative slots; a series lists its busy occurrences instead
+    return result['status'] != 'booked' and not params['recurrence']
+
+def _result_reply(params, raw_gemini, result, suggestions, session, attendees, timezone) -> str:
+    if result['status'] != 'booked' and params['recurrence']:
+        return recurring_busy_reply(params, result, contested=result['status'] == 'contested', timezone=timezone)
+    if result['status'] != 'booked':
+        return busy_reply(params, result['busy_slots'], suggestions, contested=result['status'] == 'contested',
+                          timezone=timezone)
+    if session is not None:
+        session.reset_params()
+    return booked_reply(params, result['event'], raw_gemini, attendees, timezone)
+
+def _rule_error_reply(params, raw_gemini, rule_err) -> str:
+    if not params['recurrence']:
+        return booking_error_reply(params, raw_gemini, rule_err)
+    return recurrence_error_reply(params, rule_err)
+
+def run_agent_conversation(user_message: str, conversation_history: list = None, session=None,
+                           attendees: list = None, progress=None, timezone: str = None) -> str:
+    """
+    Handles one chat turn. With a session whose transcript already ends with user_message,
+    extraction uses the session state instead of conversation_history. The slot must also be free
+    for the attendees (given, or mentioned by email in the conversation).
+    progress(stage, text), if given, is called as the turn moves on: 'understood' once the details
+    are extracted, 'checking' before the calendar calls, then the booking status.
+    Dates and times are in timezone, else the session's, else DEFAULT_TIMEZONE.
+    """
+    conversation_history, attendees = _turn_inputs(user_message, conversation_history, session, attendees)
+    params, raw_gemini = {}, ""
+    try:
+        timezone = _turn_timezone(timezone, session)
+        params, raw_gemini = extract_event_parameters(conversation_history, session, timezone)
+        booking = _booking_datetimes(params, raw_gemini, timezone, attendees, progress)
+        if isinstance(booking, str):
+            return booking
+        start_dt, end_dt = booking
+        # Check availability and book, under a reservation lease on the slot
         try:
-            ist = tz.gettz('Asia/Kolkata')
-            start_dt = datetime.strptime(params['date'] + ' ' + params['start_time'], '%Y-%m-%d %H:%M').replace(tzinfo=ist)
-            end_dt = datetime.strptime(params['date'] + ' ' + params['end_time'], '%Y-%m-%d %H:%M').replace(tzinfo=ist)
-            start_str = start_dt.strftime('%Y-%m-%dT%H:%M:%S')
-            end_str = end_dt.strftime('%Y-%m-%dT%H:%M:%S')
-        except Exception as dt_err:
-            return (
-                f"Sorry, there was an error parsing the date or time.\n"
-                f"Extracted parameters: {params}\n"
-                f"Raw Gemini output: {raw_gemini}\n"
-                f"Error: {dt_err}"
-            )
-        timezone = 'Asia/Kolkata'
-        # Check availability and book
+            report_progress(progress, "checking", "Checking availability…")
+            book = book_recurring_if_free if params['recurrence'] else book_if_free
+            result = book(*_booking_args(params, start_dt, end_dt, timezone, attendees))
+            report_progress(progress, result['status'], result['message'])
+            suggestions = ""
+            if _wants_suggestions(params, result):
+                suggestions = suggest_free_slots(start_dt, end_dt, timezone, attendees=attendees)
+            return _result_reply(params, raw_gemini, result, suggestions, session, attendees, timezone)
+        except ValueError as rule_err:
+            return _rule_error_reply(params, raw_gemini, rule_err)
+        except Exception as api_err:
+            return booking_error_reply(params, raw_gemini, api_err)
+    except LLMUnavailable as e:
+        return llm_unavailable_reply(e)
+    except Exception as e:
+        return unexpected_error_reply(params, raw_gemini, e)
+
+async def arun_agent_conversation(user_message: str, conversation_history: list = None, session=None,
+                                  attendees: list = None, progress=None, timezone: str = None) -> str:
+    """
+    Async variant of run_agent_conversation: the LLM call uses ainvoke and the calendar calls
+    run on the bounded calendar executor, so the event loop is never blocked.
+    """
+    conversation_history, attendees = _turn_inputs(user_message, conversation_history, session, attendees)
+    params, raw_gemini = {}, ""
+    try:
+        timezone = _turn_timezone(timezone, session)
+        params, raw_gemini = await aextract_event_parameters(conversation_history, session, timezone)
+        booking = _booking_datetimes(params, raw_gemini, timezone, attendees, progress)
+        if isinstance(booking, str):
+            return booking
+        start_dt, end_dt = booking
         try:
-            is_free, busy_info = check_availability(start_str, end_str, timezone)
-            if not is_free:
-                return (
-                    "❌ **Sorry, the time slot is already booked.**\n\n"
-                    f"**Busy from:** {busy_info[0]['start'][-8:]} to {busy_info[0]['end'][-8:]} on {params['date']} (Asia/Kolkata timezone)\n"
-                    f"**Your request:** {params['summary']} on {params['date']} from {params['start_time']} to {params['end_time']}\n\n"
-                    "👉 Please try a different time or rewrite your message with a new slot."
-                )
-            event = create_event(start_str, end_str, params['summary'], params.get('description', ''), timezone)
-            if isinstance(event, dict) and event.get("htmlLink"):
-                return (
-                    "✅ **Success! Your event has been booked.**\n\n"
-                    f"**Summary:** {params['summary']}\n"
-                    f"**Date:** {params['date']}\n"
-                    f"**Time:** {params['start_time']} – {params['end_time']} (Asia/Kolkata)\n"
-                    f"**Description:** {params.get('description', '') or 'No description'}\n\n"
-                    f"[🗓️ Add to Calendar]({event['htmlLink']})"
-                )
-            else:
-                return f"Sorry, there was an error booking your event.\nExtracted parameters: {params}\nRaw Gemini output: {raw_gemini}"
+            report_progress(progress, "checking", "Checking availability…")
+            book = abook_recurring_if_free if params['recurrence'] else abook_if_free
+            result = await book(*_booking_args(params, start_dt, end_dt, timezone, attendees))
+            report_progress(progress, result['status'], result['message'])
+            suggestions = ""
+            if _wants_suggestions(params, result):
+                suggestions = await asuggest_free_slots(start_dt, end_dt, timezone, attendees=attendees)
+            return _result_reply(params, raw_gemini, result, suggestions, session, attendees, timezone)
+        except ValueError as rule_err:
+            return _rule_error_reply(params, raw_gemini, rule_err)
         except Exception as api_err:
-            return (
-                f"Sorry, something went wrong during booking.\n"
-                f"Extracted parameters: {params}\n"
-                f"Raw Gemini output: {raw_gemini}\n"
-                f"Error: {api_err}"
-            )
+            return booking_error_reply(params, raw_gemini, api_err)
+    except LLMUnavailable as e:
+        return llm_unavailable_reply(e)
     except Exception as e:
-        print(f"[Agent] Exception: {e}")
-        import traceback
-        traceback.print_exc()
-        return (
-            f"Sorry, something went wrong.\nError: {e}\n"
-            f"Extracted parameters: {params}\n"
-            f"Raw Gemini output: {raw_gemini}"
-        )
+        return unexpected_error_reply(params, raw_gemini, e)
 
 # Example usage (for testing)
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+"""
+Cache of LLM extractions for repeated and near-duplicate booking messages.
+Entries are keyed on the normalized message plus the reference date, since "tomorrow" depends on
+today. In template mode explicit dates and unambiguous times are also replaced by placeholders, so
+"book standup tomorrow 10:00-10:30" and "book standup tomorrow 11:00-11:30" share one extraction
+and the new values are substituted back in. Set EXTRACTION_CACHE_FILE to persist entries in SQLite.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from dotenv import load_dotenv
+
+from agent.fast_parser import parse_time_token, to_minutes, is_ambiguous
+
+load_dotenv()
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+EXTRACTION_CACHE_TEMPLATES = os.getenv("EXTRACTION_CACHE_TEMPLATES", "true").lower() not in ("0", "false", "no")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+EXTRACTION_CACHE_FILE = os.getenv("EXTRACTION_CACHE_FILE")
+# Bump when the extraction prompt or GEMINI_MODEL changes, so persisted entries are not reused
+CACHE_VERSION = "v2"
+
+TOKEN_RE = re.compile(
+    r"(?<![\w:.])(?:(\d{4}-\d{1,2}-\d{1,2})|(\d{1,2}(?::\d{2})?\s*[ap]\.?m\.?|\d{1,2}:\d{2}))(?![\w:])", re.I)
+TIME_FIELDS = ("start_time", "end_time")
+
+
+def normalize_message(message):
+    return re.sub(r"\s+", " ", message).strip().strip(" .!").lower()
+
+
+def _canonical_time(token):
+    """
+    'HH:MM' for a time token that means the same thing in any message, else None ('3:00' could be pm).
+    """
+    parsed = parse_time_token(token)
+    if parsed is None or is_ambiguous(parsed[0], parsed[2]):
+        return None
+    minutes = to_minutes(*parsed)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _canonical_date(token):
+    try:
+        year, month, day = (int(part) for part in token.split('-'))
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def templatize(normalized):
+    """
+    Returns (template, tokens): dates become <d>, unambiguous times <t>; tokens holds
+    (kind, raw text, canonical value) in order of appearance.
+    """
+    tokens = []
+
+    def replace(match):
+        if match.group(1):
+            value, kind = _canonical_date(match.group(1)), "d"
+        else:
+            value, kind = _canonical_time(match.group(2)), "t"
+        if value is None:
+            return match.group(0)
+        tokens.append((kind, match.group(0), value))
+        return f"<{kind}>"
+
+    return TOKEN_RE.sub(replace, normalized), tokens
+
+
+def to_template_params(params, tokens):
+    """
+    Rewrites date/time values as references to message tokens, e.g. {'start_time': '<1>'}.
+    Returns None when the extraction can't safely be reused for other token values: a field
+    that doesn't come from a token while tokens of its kind exist (e.g. an end time computed
+    from "for 2 hours"), or a token copied into the summary or description.
+    """
+    template = dict(params)
+    kinds = {kind for kind, _, _ in tokens}
+    for field in ("date",) + TIME_FIELDS:
+        kind = "d" if field == "date" else "t"
+        refs = [i for i, (k, _, value) in enumerate(tokens) if k == kind and value == params.get(field)]
+        if refs:
+            template[field] = f"<{refs[0]}>"
+        elif kind in kinds:
+            return None
+    text = f"{params.get('summary', '')} {params.get('description', '')}".lower()
+    if any(raw.lower() in text for _, raw, _ in tokens):
+        return None
+    return template
+
+
+def from_template_params(template, tokens):
+    params = dict(template)
+    for field in ("date",) + TIME_FIELDS:
+        match = re.fullmatch(r"<(\d+)>", str(params.get(field, '')))
+        if match:
+            index = int(match.group(1))
+            if index >= len(tokens):
+                return None
+            params[field] = tokens[index][2]
+    return params
+
+
+class ExtractionCache:
+    """
+    LRU of key -> params in memory, optionally backed by a SQLite file that survives restarts.
+    """
+
+    def __init__(self, max_entries=EXTRACTION_CACHE_MAX_ENTRIES, path=EXTRACTION_CACHE_FILE,
+                 templates=EXTRACTION_CACHE_TEMPLATES, enabled=EXTRACTION_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.path = path
+        self.templates = templates
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stores = 0
+        self.hits = 0
+        self.template_hits = 0
+        self.misses = 0
+        if path:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS extractions ("
+                             " key TEXT PRIMARY KEY, params TEXT NOT NULL, last_used REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _keys(self, message, today):
+        """
+        Returns [(key, tokens)]: the exact key first, then the template key if it differs.
+        """
+        normalized = normalize_message(message)
+        keys = [(f"{CACHE_VERSION}|{today.isoformat()}|exact|{normalized}", None)]
+        if self.templates:
+            template, tokens = templatize(normalized)
+            if tokens:
+                keys.append((f"{CACHE_VERSION}|{today.isoformat()}|template|{template}", tokens))
+        return keys
+
+    def _get(self, key):
+        with self._lock:
+            params = self._entries.get(key)
+            if params is not None:
+                self._entries.move_to_end(key)
+                return params
+        if not self.path:
+            return None
+        row = self._connect().execute("SELECT params FROM extractions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        params = json.loads(row[0])
+        self._put(key, params, persist=False)
+        return params
+
+    def _put(self, key, params, persist=True):
+        with self._lock:
+            self._entries[key] = params
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._stores += 1
+            trim = self._stores % 100 == 0
+        if persist and self.path:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO extractions (key, params, last_used) VALUES (?, ?, ?)",
+                         (key, json.dumps(params), time.time()))
+            if trim:
+                conn.execute("DELETE FROM extractions WHERE key NOT IN "
+                             "(SELECT key FROM extractions ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+
+    def lookup(self, message, today=None):
+        """
+        Returns a copy of the cached params for message, or None.
+        """
+        if not self.enabled or not message:
+            return None
+        today = today or date.today()
+        for key, tokens in self._keys(message, today):
+            params = self._get(key)
+            if params is None:
+                continue
+            if tokens is not None:
+                params = from_template_params(params, tokens)
+                if params is None:
+                    continue
+                with self._lock:
+                    self.template_hits += 1
+            else:
+                params = dict(params)
+            with self._lock:
+                self.hits += 1
+            return params
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, message, params, today=None):
+        if not self.enabled or not message or not isinstance(params, dict):
+            return
+        today = today or date.today()
+        for key, tokens in self._keys(message, today):
+            if tokens is None:
+                self._put(key, dict(params))
+            else:
+                template = to_template_params(params, tokens)
+                if template is not None:
+                    self._put(key, template)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "template_hits": self.template_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+extraction_cache = ExtractionCache()
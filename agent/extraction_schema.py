@@ -0,0 +1,167 @@
+"""
+Typed schema of the event details extracted from a booking conversation.
+Gemini is asked for EventDetails through its structured-output (function calling) mode, so its
+answer is validated field by field instead of being scraped out of free text. Models without that
+mode (such as the benchmark stub) answer in text, which is decoded with a JSON scanner that copes
+with code fences, surrounding prose and nested objects. ExtractionStats counts parse failures,
+repairs and tokens per extraction for /metrics and the benchmarks.
+"""
+
+import datetime
+import json
+import re
+import threading
+
+from pydantic import BaseModel, Field, field_validator
+
+MISSING = 'MISSING'
+
+TIME_RE = re.compile(r"(\d{1,2}):(\d{2})")
+
+
+class EventDetails(BaseModel):
+    """
+    One booking: fields that are not known (yet) are 'MISSING'; description and recurrence are
+    empty when there is none.
+    """
+
+    summary: str = Field(MISSING, description="What the event is about")
+    date: str = Field(MISSING, description="Date of the event (the first occurrence if it repeats), YYYY-MM-DD")
+    start_time: str = Field(MISSING, description="Start time, HH:MM (24h)")
+    end_time: str = Field(MISSING, description="End time, HH:MM (24h)")
+    description: str = Field("", description="Extra details, or an empty string")
+    recurrence: str = Field("", description="RFC 5545 RRULE without the 'RRULE:' prefix if the event repeats, "
+                                            "e.g. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20261130, else an empty string")
+
+    @field_validator("summary", "date", "start_time", "end_time", mode="before")
+    @classmethod
+    def _missing_if_empty(cls, value):
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return MISSING
+        return value
+
+    @field_validator("description", "recurrence", mode="before")
+    @classmethod
+    def _empty_if_missing(cls, value):
+        if value is None or (isinstance(value, str) and value.strip().upper() in (MISSING, "NONE", "NULL")):
+            return ""
+        return value
+
+    @field_validator("date")
+    @classmethod
+    def _check_date(cls, value):
+        value = value.strip()
+        if value != MISSING:
+            datetime.date.fromisoformat(value)
+        return value
+
+    @field_validator("start_time", "end_time")
+    @classmethod
+    def _check_time(cls, value):
+        value = value.strip()
+        if value == MISSING:
+            return value
+        match = TIME_RE.fullmatch(value)
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            raise ValueError(f"{value!r} is not an HH:MM time")
+        return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+def decode_json_object(text):
+    """
+    The first JSON object in text, which may be wrapped in a code fence or prose.
+    Raises ValueError if there is none.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+        start = text.find("{", start + 1)
+    raise ValueError("No JSON object found in the model output.")
+
+
+def parse_event_details(text):
+    """
+    EventDetails from a text answer. Raises ValueError (or pydantic's ValidationError, a subclass)
+    if it holds no JSON object or the object does not fit the schema.
+    """
+    return EventDetails.model_validate(decode_json_object(text))
+
+
+def raw_text(message):
+    """
+    What the model answered, as text: the function call arguments in structured-output mode,
+    otherwise the message content.
+    """
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        return json.dumps(tool_calls[0].get("args", {}))
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        content = "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return str(content)
+
+
+def usage_tokens(message):
+    """
+    (input_tokens, output_tokens) reported with a model answer, zeros when it reports none.
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+class ExtractionStats:
+    """
+    Counts LLM extractions: how often the first answer did not fit the schema, how many of those
+    the repair attempt fixed, and the tokens spent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.extractions = 0
+        self.calls = 0
+        self.repaired = 0
+        self.failed = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def record_call(self, message):
+        input_tokens, output_tokens = usage_tokens(message)
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def record(self, outcome):
+        """
+        outcome of one extraction: 'parsed' first time, 'repaired', or 'failed'.
+        """
+        with self._lock:
+            self.extractions += 1
+            if outcome == "repaired":
+                self.repaired += 1
+            elif outcome == "failed":
+                self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self.extractions
+            return {
+                "extractions": n,
+                "llm_calls": self.calls,
+                "parse_failures": self.repaired + self.failed,
+                "repaired": self.repaired,
+                "failed": self.failed,
+                "parse_failure_rate": (self.repaired + self.failed) / n if n else 0.0,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "tokens_per_extraction": (self.input_tokens + self.output_tokens) / n if n else 0.0,
+            }
+
+
+extraction_stats = ExtractionStats()
@@ -0,0 +1,302 @@
+"""
+Deterministic fast-path extractor for well-formed booking messages.
+Handles explicit dates, relative days ("tomorrow", "next Monday"), time ranges and durations with
+precompiled patterns and dateutil, so messages like "Book team sync 2025-07-10 15:00-16:00" never
+reach Gemini. Anything it is not confident about falls back to the LLM.
+"""
+
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+from dateutil import parser as date_parser
+from dateutil.relativedelta import relativedelta, MO, TU, WE, TH, FR, SA, SU
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() not in ("0", "false", "no")
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+WEEKDAYS = {
+    "monday": MO, "tuesday": TU, "wednesday": WE, "thursday": TH,
+    "friday": FR, "saturday": SA, "sunday": SU,
+}
+MONTHS = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+          r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+TIME = r"(?:\d{1,2}(?:[:.]\d{2})?\s*(?:[ap]\.?m\.?)?|noon)"
+
+ISO_DATE_RE = re.compile(r"\b(?:on\s+)?(\d{4})-(\d{1,2})-(\d{1,2})\b", re.I)
+MONTH_DATE_RE = re.compile(
+    rf"\b(?:on\s+)?(?:\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?(?:{MONTHS})\.?|(?:{MONTHS})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?)"
+    rf"(?:,?\s+\d{{4}})?\b", re.I)
+NUMERIC_DATE_RE = re.compile(r"\b\d{1,2}[/.]\d{1,2}(?:[/.]\d{2,4})?\b")
+RELATIVE_DATE_RE = re.compile(
+    r"\b(?:on\s+)?(today|tonight|(?:the\s+)?day after tomorrow|tomorrow|"
+    r"(?:(next|this|coming)\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday))\b", re.I)
+DURATION_RE = re.compile(
+    r"\bfor\s+(?:(\d+(?:\.\d+)?)|(an?|one|half an?))\s*(h(?:ou)?rs?|hour|mins?|minutes?)\b", re.I)
+RANGE_RE = re.compile(
+    rf"(?:\b(?:from|between)\s+)?(?<![\w:.])({TIME})\s*(?:-|–|—|\bto\b|\buntil\b|\btill\b|\band\b)\s*({TIME})(?![\w:])",
+    re.I)
+AT_TIME_RE = re.compile(rf"(?:\b(?:at|from)\s+|@\s*)({TIME})(?![\w:])", re.I)
+BARE_TIME_RE = re.compile(r"(?<![\w:.])(\d{1,2}(?::\d{2})?\s*[ap]\.?m\.?|\d{1,2}:\d{2}|noon)(?![\w:])", re.I)
+TIME_TOKEN_RE = re.compile(r"^(\d{1,2})(?:[:.](\d{2}))?\s*([ap])?\.?m?\.?$", re.I)
+
+QUESTION_RE = re.compile(r"^\s*(?:what|when|where|which|who|why|how|is|am|are|do|does|did)\b|\?\s*$", re.I)
+OTHER_INTENT_RE = re.compile(r"\b(?:cancel|reschedule|move|delete|remove|change|instead|every|each|weekly|daily|"
+                             r"weekdays|monthly|recurring|repeat(?:ing|s)?)\b", re.I)
+LEADING_FILLER_RE = re.compile(
+    r"^\s*(?:(?:please|kindly|hey|hi|can you|could you|would you)[\s,]+)*"
+    r"(?:book|schedule|set up|setup|create|add|arrange|put|plan|organi[sz]e)?\s*(?:me\s+|in\s+)?"
+    r"(?:an?\s+|the\s+|my\s+)?", re.I)
+# "for stomach ache" is a description, "for the client" is part of the summary
+DESCRIPTION_SPLIT_RE = re.compile(
+    r"\s+(?:for(?!\s+(?:the|a|an|my|our|your|his|her|their)\b)|about|regarding|to discuss)\s+", re.I)
+DANGLING_RE = re.compile(r"^(?:on|at|from|between|for|and|with|,)\s+|\s+(?:on|at|from|between|for|and|with)$", re.I)
+LEFTOVER_TIME_RE = re.compile(
+    rf"\d|\b(?:am|pm|hours?|hrs?|minutes?|mins?|noon|midnight|morning|afternoon|evening|night|o'?clock|"
+    rf"today|tomorrow|yesterday|week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday|{MONTHS})\b",
+    re.I)
+
+
+def _blank(text, match):
+    """
+    Replaces a matched span with spaces so later patterns can't see it but offsets stay valid.
+    """
+    return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+
+def _parse_date(text, today):
+    """
+    Returns (date or None, remaining text, ambiguous) for the single date mentioned in text.
+    """
+    found = []
+    for match in ISO_DATE_RE.finditer(text):
+        try:
+            found.append((match, date(int(match.group(1)), int(match.group(2)), int(match.group(3)))))
+        except ValueError:
+            return None, text, True
+    for match in MONTH_DATE_RE.finditer(text):
+        raw = re.sub(r"^on\s+", "", match.group(0), flags=re.I)
+        try:
+            parsed = date_parser.parse(raw, default=datetime(today.year, today.month, today.day)).date()
+        except (ValueError, OverflowError):
+            return None, text, True
+        if not re.search(r"\d{4}", raw) and parsed < today:
+            parsed = parsed.replace(year=parsed.year + 1)
+        found.append((match, parsed))
+    for match in RELATIVE_DATE_RE.finditer(text):
+        word = match.group(1).lower()
+        if word in ("today", "tonight"):
+            parsed = today
+        elif word.endswith("day after tomorrow"):
+            parsed = today + timedelta(days=2)
+        elif word == "tomorrow":
+            parsed = today + timedelta(days=1)
+        else:
+            weekday = WEEKDAYS[match.group(3).lower()]
+            start = today + timedelta(days=1) if (match.group(2) or "").lower() == "next" else today
+            parsed = start + relativedelta(weekday=weekday(+1))
+        found.append((match, parsed))
+    if len(found) != 1 or NUMERIC_DATE_RE.search(text):
+        # No date, several dates, or day/month order we can't be sure of
+        return None, text, len(found) > 1 or bool(NUMERIC_DATE_RE.search(text))
+    match, parsed = found[0]
+    return parsed, _blank(text, match), False
+
+
+def parse_time_token(token):
+    """
+    Returns (hour, minute, meridiem or None) for a time token like '3pm', '15:00' or 'noon'.
+    """
+    token = token.strip().lower()
+    if token == "noon":
+        return 12, 0, "p"
+    match = TIME_TOKEN_RE.match(token)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    if hour > 23 or minute > 59 or (match.group(3) and not 1 <= hour <= 12):
+        return None
+    return hour, minute, match.group(3)
+
+
+def to_minutes(hour, minute, meridiem):
+    """
+    Minutes since midnight for a parse_time_token result.
+    """
+    if meridiem == "a":
+        hour = 0 if hour == 12 else hour
+    elif meridiem == "p":
+        hour = hour if hour == 12 else hour + 12
+    return hour * 60 + minute
+
+
+def is_ambiguous(hour, meridiem):
+    """
+    True if a time without am/pm could mean either: "3" or "3:00" with no 24h hint (most such
+    messages mean pm). Shared with the extraction cache, which only templatizes unambiguous times.
+    """
+    return meridiem is None and 1 <= hour <= 7
+
+
+def _resolve_range(start_token, end_token):
+    """
+    Resolves two time tokens into (start_minutes, end_minutes, ambiguous); None if unusable.
+    """
+    start, end = parse_time_token(start_token), parse_time_token(end_token)
+    if not start or not end:
+        return None
+    (sh, sm, sap), (eh, em, eap) = start, end
+    if sap is None and eap is not None and sh <= 12:
+        # "3 to 4pm" -> 15:00-16:00, but "11 to 1pm" -> 11:00-13:00
+        sap = eap if to_minutes(sh, sm, eap) < to_minutes(eh, em, eap) else "a"
+    if eap is None and sap is not None and eh <= 12:
+        eap = sap if to_minutes(eh, em, sap) > to_minutes(sh, sm, sap) else "p"
+    ambiguous = is_ambiguous(sh, sap) or is_ambiguous(eh, eap)
+    return to_minutes(sh, sm, sap), to_minutes(eh, em, eap), ambiguous
+
+
+def _parse_duration(match):
+    number, word, unit = match.group(1), (match.group(2) or "").lower(), match.group(3).lower()
+    if number:
+        value = float(number)
+    elif word.startswith("half"):
+        value = 0.5
+    else:
+        value = 1.0
+    return timedelta(hours=value) if unit.startswith("h") else timedelta(minutes=value)
+
+
+def _clean_summary(text):
+    text = re.sub(r"\s+", " ", text).strip(" ,.;:!-–")
+    text = LEADING_FILLER_RE.sub("", text, count=1)
+    previous = None
+    while previous != text:
+        previous = text
+        text = DANGLING_RE.sub("", text).strip(" ,.;:!-–")
+    return text
+
+
+def parse_booking_message(message: str, today: date = None) -> tuple:
+    """
+    Extracts booking params from a single message without calling the LLM.
+    Returns (params, confidence); params has the same keys as the Gemini extraction
+    (summary, date, start_time, end_time, description) or is None if something is missing.
+    """
+    today = today or date.today()
+    if not message or QUESTION_RE.search(message) or OTHER_INTENT_RE.search(message):
+        return None, 0.0
+    confidence = 1.0
+
+    day, text, date_ambiguous = _parse_date(message, today)
+    if day is None:
+        return None, 0.0
+
+    durations = list(DURATION_RE.finditer(text))
+    if len(durations) > 1:
+        return None, 0.0
+    duration = None
+    if durations:
+        duration = _parse_duration(durations[0])
+        text = _blank(text, durations[0])
+
+    ranges = list(RANGE_RE.finditer(text))
+    if len(ranges) > 1 or (ranges and duration):
+        return None, 0.0
+    if ranges:
+        resolved = _resolve_range(ranges[0].group(1), ranges[0].group(2))
+        if resolved is None:
+            return None, 0.0
+        start, end, ambiguous = resolved
+        text = _blank(text, ranges[0])
+    else:
+        singles = list(AT_TIME_RE.finditer(text)) or list(BARE_TIME_RE.finditer(text))
+        if len(singles) != 1 or duration is None:
+            return None, 0.0
+        parsed = parse_time_token(singles[0].group(1))
+        if parsed is None:
+            return None, 0.0
+        start = to_minutes(*parsed)
+        end = start + int(duration.total_seconds() // 60)
+        ambiguous = is_ambiguous(parsed[0], parsed[2])
+        text = _blank(text, singles[0])
+    if not 0 <= start < end <= 24 * 60 - 1:
+        return None, 0.0
+    if ambiguous or date_ambiguous:
+        confidence -= 0.5
+
+    text = _clean_summary(text)
+    parts = DESCRIPTION_SPLIT_RE.split(text, maxsplit=1)
+    summary = _clean_summary(parts[0])
+    description = _clean_summary(parts[1]) if len(parts) > 1 else ""
+    if not summary:
+        return None, 0.0
+    if LEFTOVER_TIME_RE.search(summary) or LEFTOVER_TIME_RE.search(description):
+        # Something time-like was left unparsed; let the LLM read it
+        confidence -= 0.5
+    if len(summary.split()) > 8:
+        confidence -= 0.3
+
+    params = {
+        "summary": summary[0].upper() + summary[1:],
+        "date": day.isoformat(),
+        "start_time": f"{start // 60:02d}:{start % 60:02d}",
+        "end_time": f"{end // 60:02d}:{end % 60:02d}",
+        "description": description,
+    }
+    return params, max(confidence, 0.0)
+
+
+class FastPathStats:
+    """
+    Counts how many messages the fast path handled on its own vs. handed to the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handled = 0
+        self.fallback = 0
+
+    def record(self, handled: bool):
+        with self._lock:
+            if handled:
+                self.handled += 1
+            else:
+                self.fallback += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.handled + self.fallback
+            return {
+                "handled": self.handled,
+                "fallback": self.fallback,
+                "share": self.handled / total if total else 0.0,
+            }
+
+
+fast_path_stats = FastPathStats()
+
+
+def try_fast_path(conversation_history: list, today: date = None):
+    """
+    Runs the rule-based extractor on the latest user message.
+    Returns (params, raw) shaped like extract_event_parameters when confident, else None.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    message = next((m["content"] for m in reversed(conversation_history) if m["role"] == "user"), None)
+    params, confidence = parse_booking_message(message, today)
+    handled = params is not None and confidence >= FAST_PATH_MIN_CONFIDENCE
+    fast_path_stats.record(handled)
+    if not handled:
+        return None
+    stats = fast_path_stats.snapshot()
+    logger.debug("Fast path handled message without LLM (confidence %.2f); share so far %d/%d (%.0f%%)",
+                 confidence, stats['handled'], stats['handled'] + stats['fallback'], stats['share'] * 100)
+    return params, f"[fast-path confidence={confidence:.2f}]"
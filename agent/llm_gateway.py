@@ -0,0 +1,282 @@
+"""
+Gateway for every Gemini call.
+Calls are admitted through a bounded number of in-flight slots; callers beyond that wait in an
+admission queue, bounded in length and in time, and are turned away with LLMOverloaded rather than
+piling up behind a slow model. Identical prompts in flight at the same time share one call. A call
+still running past the observed p95 latency gets a hedged duplicate if a slot is free, and the
+first answer wins. Every call has a timeout, and a caller that goes away cancels its call unless
+others are waiting on it.
+The gateway runs its calls on its own event loop thread, so the sync and async request paths share
+the same slots, in-flight calls and latency history.
+"""
+
+import asyncio
+import collections
+import hashlib
+import os
+import threading
+import time
+
+import dotenv
+from backend.metrics import metrics
+dotenv.load_dotenv()
+
+# Gemini calls in flight at once, hedges included
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Calls waiting for a slot before new ones are rejected, and how long one may wait
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "256"))
+LLM_QUEUE_DEADLINE = float(os.getenv("LLM_QUEUE_DEADLINE", "10"))
+# Seconds a call may run, hedge included, before it is cancelled
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Seconds before a hedge is sent; 0 uses the p95 of recent call latencies
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+# Most calls that may be hedged, as a share of all calls, so a slow model is not hit twice as hard
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+# Latencies kept for the p95, and how many are needed before hedging starts
+LLM_LATENCY_WINDOW = 500
+LLM_HEDGE_MIN_SAMPLES = 20
+
+
+class LLMUnavailable(Exception):
+    """
+    An LLM call that was not answered: rejected at admission or timed out.
+    """
+
+
+class LLMOverloaded(LLMUnavailable):
+    """
+    No slot for the call before its admission deadline, or the admission queue is full.
+    """
+
+
+class LLMTimeout(LLMUnavailable):
+    """
+    The call (and its hedge) did not answer within the timeout.
+    """
+
+
+def prompt_key(model, messages):
+    """
+    Coalescing key of a call: the model object and the role and content of every message.
+    """
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{getattr(message, 'type', '')}\0{getattr(message, 'content', message)}\0".encode())
+    return id(model), digest.hexdigest()
+
+
+class LLMGateway:
+    """
+    Admission control, coalescing, hedging and timeouts around chat model calls.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queued=LLM_MAX_QUEUED,
+                 queue_deadline=LLM_QUEUE_DEADLINE, timeout=LLM_TIMEOUT, hedge=LLM_HEDGE_ENABLED,
+                 hedge_after=LLM_HEDGE_AFTER, hedge_budget=LLM_HEDGE_BUDGET):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.queue_deadline = queue_deadline
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.hedge_budget = hedge_budget
+        self._latencies = collections.deque(maxlen=LLM_LATENCY_WINDOW)
+        self._inflight = {}
+        self._loop = None
+        self._slots = None
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _get_loop(self):
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._slots = asyncio.Semaphore(self.max_concurrency)
+                    threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def invoke(self, model, messages, coalesce=True):
+        """
+        model.invoke(messages) through the gateway, for sync callers.
+        Raises LLMOverloaded or LLMTimeout, or what the model raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._call(model, messages, coalesce), self._get_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def ainvoke(self, model, messages, coalesce=True):
+        """
+        model.ainvoke(messages) through the gateway. Cancelling the caller cancels the call unless
+        a coalesced caller still waits for it.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._call(model, messages, coalesce), self._get_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _call(self, model, messages, coalesce):
+        with self._lock:
+            self.calls += 1
+        if not coalesce:
+            return await self._admit(model, messages)
+        key = prompt_key(model, messages)
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = [asyncio.ensure_future(self._admit(model, messages)), 0]
+            entry[0].add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # The last caller went away
+                entry[0].cancel()
+
+    async def _admit(self, model, messages):
+        if self._slots.locked():
+            with self._lock:
+                if self.waiting >= self.max_queued:
+                    self.rejected += 1
+                    raise LLMOverloaded(f"LLM overloaded: {self.waiting} calls already waiting")
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_deadline)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.rejected += 1
+                raise LLMOverloaded(f"LLM overloaded: no slot within {self.queue_deadline:g}s") from None
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            metrics.observe("llm_queue_wait", time.monotonic() - started)
+        else:
+            await self._slots.acquire()
+        try:
+            return await self._hedged(model, messages)
+        finally:
+            self._slots.release()
+
+    def hedge_delay(self):
+        """
+        Seconds after which a hedge may be sent, or None while hedging is off or has too little history.
+        """
+        if not self.hedge:
+            return None
+        if self.hedge_after > 0:
+            return self.hedge_after
+        with self._lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def _take_hedge(self):
+        """
+        True (holding a slot) if a hedge may be sent now: within budget and without queueing.
+        """
+        with self._lock:
+            if self.hedged + 1 > self.hedge_budget * self.calls or self._slots.locked():
+                return False
+            self.hedged += 1
+        # A slot is free, so this returns at once
+        await self._slots.acquire()
+        return True
+
+    async def _attempt(self, model, messages):
+        started = time.monotonic()
+        with self._lock:
+            self.running += 1
+        try:
+            if hasattr(model, "ainvoke"):
+                result = await model.ainvoke(messages)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(None, model.invoke, messages)
+        finally:
+            with self._lock:
+                self.running -= 1
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._latencies.append(elapsed)
+        metrics.observe("llm_call", elapsed)
+        return result
+
+    async def _hedged_attempt(self, model, messages):
+        try:
+            return await self._attempt(model, messages)
+        finally:
+            self._slots.release()
+
+    async def _hedged(self, model, messages):
+        """
+        Runs the call, plus a hedge if it is slow, until the first success, all fail, or the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        first = asyncio.ensure_future(self._attempt(model, messages))
+        tasks = [first]
+        errors = []
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < self.timeout:
+                await asyncio.wait(tasks, timeout=delay)
+                if not first.done() and await self._take_hedge():
+                    tasks.append(asyncio.ensure_future(self._hedged_attempt(model, messages)))
+            pending = [task for task in tasks if not task.done()]
+            while True:
+                for task in tasks:
+                    if task.done() and task not in errors:
+                        if task.exception() is None:
+                            if task is not first:
+                                with self._lock:
+                                    self.hedge_wins += 1
+                            return task.result()
+                        errors.append(task)
+                if not pending:
+                    raise errors[0].exception()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise LLMTimeout(f"LLM call timed out after {self.timeout:g}s")
+                _, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                pending = list(pending)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            ordered = sorted(self._latencies)
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000 if ordered else None,
+            }
+
+
+llm_gateway = LLMGateway()
@@ -0,0 +1,208 @@
+"""
+In-process cache of busy intervals per calendar, used in front of freebusy queries.
+Busy intervals and the windows they were fetched for are kept as sorted, disjoint bisect arrays
+(epoch seconds), so overlap questions inside a fresh window are answered locally in O(log n).
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import dotenv
+dotenv.load_dotenv()
+
+# Seconds a fetched freebusy window stays valid; 0 disables the cache
+BUSY_CACHE_TTL = float(os.getenv("BUSY_CACHE_TTL", "60"))
+BUSY_CACHE_MAX_CALENDARS = int(os.getenv("BUSY_CACHE_MAX_CALENDARS", "256"))
+BUSY_CACHE_MAX_INTERVALS = int(os.getenv("BUSY_CACHE_MAX_INTERVALS", "5000"))
+
+
+def _remove_range(starts, ends, start, end, extra=None):
+    """
+    Removes [start, end) from a list of disjoint intervals, clipping intervals that cross its edges.
+    extra is an optional parallel list (e.g. fetch times) kept in step with starts/ends.
+    """
+    i = bisect_right(ends, start)
+    j = bisect_left(starts, end)
+    if i >= j:
+        return
+    keep = []
+    if starts[i] < start:
+        keep.append((starts[i], start, extra[i] if extra is not None else None))
+    if ends[j - 1] > end:
+        keep.append((end, ends[j - 1], extra[j - 1] if extra is not None else None))
+    del starts[i:j], ends[i:j]
+    if extra is not None:
+        del extra[i:j]
+    for offset, (s, e, x) in enumerate(keep):
+        starts.insert(i + offset, s)
+        ends.insert(i + offset, e)
+        if extra is not None:
+            extra.insert(i + offset, x)
+
+
+class BusyIntervalIndex:
+    """
+    Merged busy intervals for one calendar plus the windows that have been fetched from Google.
+    All times are epoch seconds; intervals are half-open [start, end).
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._cov_starts = []
+        self._cov_ends = []
+        self._cov_fetched = []
+
+    def __len__(self):
+        return len(self._starts) + len(self._cov_starts)
+
+    def covers(self, start, end, min_fetched):
+        """
+        True if [start, end) lies entirely inside windows fetched at or after min_fetched.
+        """
+        i = bisect_right(self._cov_ends, start)
+        cursor = start
+        while cursor < end:
+            if i >= len(self._cov_starts) or self._cov_starts[i] > cursor or self._cov_fetched[i] < min_fetched:
+                return False
+            cursor = self._cov_ends[i]
+            i += 1
+        return True
+
+    def overlaps(self, start, end):
+        """
+        Returns the busy intervals overlapping [start, end), clipped to it.
+        """
+        i = bisect_right(self._ends, start)
+        j = bisect_left(self._starts, end)
+        return [(max(self._starts[k], start), min(self._ends[k], end)) for k in range(i, j)]
+
+    def add_busy(self, start, end):
+        """
+        Inserts a busy interval, merging it with any intervals it touches.
+        """
+        i = bisect_left(self._ends, start)
+        j = bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def drop_window(self, start, end):
+        _remove_range(self._starts, self._ends, start, end)
+        _remove_range(self._cov_starts, self._cov_ends, start, end, self._cov_fetched)
+
+    def replace_window(self, start, end, busy, fetched_at):
+        """
+        Records the result of a freebusy fetch for [start, end), replacing what was known there.
+        """
+        self.drop_window(start, end)
+        for s, e in busy:
+            self.add_busy(max(s, start), min(e, end))
+        i = bisect_left(self._cov_starts, start)
+        self._cov_starts.insert(i, start)
+        self._cov_ends.insert(i, end)
+        self._cov_fetched.insert(i, fetched_at)
+
+    def is_covered_anywhere(self, start, end):
+        i = bisect_right(self._cov_ends, start)
+        return i < len(self._cov_starts) and self._cov_starts[i] < end
+
+    def expire(self, min_fetched, max_intervals):
+        """
+        Drops windows fetched before min_fetched, then the oldest windows until under max_intervals.
+        """
+        stale = [(s, e) for s, e, f in zip(self._cov_starts, self._cov_ends, self._cov_fetched) if f < min_fetched]
+        for s, e in stale:
+            self.drop_window(s, e)
+        while len(self) > max_intervals and self._cov_starts:
+            oldest = min(range(len(self._cov_fetched)), key=self._cov_fetched.__getitem__)
+            self.drop_window(self._cov_starts[oldest], self._cov_ends[oldest])
+        if not self._cov_starts or len(self) > max_intervals:
+            self.__init__()
+
+
+class BusyCache:
+    """
+    Thread-safe, LRU-bounded map of calendar id -> BusyIntervalIndex with TTL-based eviction.
+    """
+
+    def __init__(self, ttl=BUSY_CACHE_TTL, max_calendars=BUSY_CACHE_MAX_CALENDARS,
+                 max_intervals=BUSY_CACHE_MAX_INTERVALS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_calendars = max_calendars
+        self.max_intervals = max_intervals
+        self._clock = clock
+        self._calendars = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def lookup(self, calendar_id, start, end):
+        """
+        Returns the clipped busy intervals in [start, end), or None if the window is not cached.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._calendars.get(calendar_id)
+            if index is not None and index.covers(start, end, self._clock() - self.ttl):
+                self._calendars.move_to_end(calendar_id)
+                self.hits += 1
+                return index.overlaps(start, end)
+            self.misses += 1
+            return None
+
+    def store(self, calendar_id, start, end, busy):
+        """
+        Stores the busy intervals Google returned for the fetched window [start, end).
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self._clock()
+            index = self._calendars.get(calendar_id)
+            if index is None:
+                index = self._calendars[calendar_id] = BusyIntervalIndex()
+            self._calendars.move_to_end(calendar_id)
+            index.replace_window(start, end, busy, now)
+            index.expire(now - self.ttl, self.max_intervals)
+            while len(self._calendars) > self.max_calendars:
+                self._calendars.popitem(last=False)
+
+    def add_busy(self, calendar_id, start, end):
+        """
+        Write-through for a newly created event, so it is visible without another freebusy call.
+        """
+        with self._lock:
+            index = self._calendars.get(calendar_id)
+            if index is not None and index.is_covered_anywhere(start, end):
+                index.add_busy(start, end)
+
+    def invalidate(self, calendar_id=None):
+        with self._lock:
+            if calendar_id is None:
+                self._calendars.clear()
+            else:
+                self._calendars.pop(calendar_id, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "calendars": len(self._calendars),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+busy_cache = BusyCache()
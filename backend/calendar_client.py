@@ -0,0 +1,196 @@
+"""
+Process-wide pooled Google Calendar client.
+Service account credentials and the Calendar discovery document are loaded once per process,
+and authorized service objects (each with its own keep-alive HTTP connection) are handed out
+from a thread-safe pool, so individual API calls no longer pay for auth and client construction.
+"""
+
+import copy
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import dotenv
+from backend.tenants import current_pool
+dotenv.load_dotenv()
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE", 'service_account.json')
+# Optional override of the API root (e.g. a local fake Calendar server for benchmarks)
+CALENDAR_API_ROOT = os.getenv("CALENDAR_API_ROOT")
+CALENDAR_POOL_SIZE = int(os.getenv("CALENDAR_POOL_SIZE", "8"))
+CALENDAR_HTTP_TIMEOUT = float(os.getenv("CALENDAR_HTTP_TIMEOUT", "30"))
+# Refresh the access token this long before it actually expires
+CREDENTIALS_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("CREDENTIALS_REFRESH_MARGIN", "300")))
+
+
+def load_discovery_document(api_root=None):
+    """
+    Returns the parsed Calendar v3 discovery document bundled with googleapiclient.
+    If api_root is given, the document's rootUrl is pointed at it (batch requests included).
+    """
+    import json
+    from googleapiclient import discovery_cache
+
+    document = json.loads(discovery_cache.get_static_doc('calendar', 'v3'))
+    if api_root:
+        document = copy.deepcopy(document)
+        document['rootUrl'] = api_root if api_root.endswith('/') else api_root + '/'
+        document.pop('mtlsRootUrl', None)
+    return document
+
+
+class CalendarClientPool:
+    """
+    Thread-safe pool of authorized Calendar service objects.
+
+    googleapiclient service objects and their httplib2 transports are not safe to share
+    between threads, so each pooled service owns one AuthorizedHttp with a persistent
+    connection. All of them share a single credentials object, which is refreshed under a
+    lock shortly before it expires instead of on the first 401.
+    """
+
+    def __init__(self, credentials=None, api_root=CALENDAR_API_ROOT, size=CALENDAR_POOL_SIZE,
+                 timeout=CALENDAR_HTTP_TIMEOUT, refresh_margin=CREDENTIALS_REFRESH_MARGIN,
+                 service_account_file=SERVICE_ACCOUNT_FILE):
+        self._credentials = credentials
+        self._service_account_file = service_account_file
+        self._api_root = api_root
+        self._size = size
+        self._timeout = timeout
+        self._refresh_margin = refresh_margin
+        self._document = None
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def credentials(self):
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    from google.oauth2 import service_account
+                    self._credentials = service_account.Credentials.from_service_account_file(
+                        self._service_account_file, scopes=SCOPES)
+        return self._credentials
+
+    @property
+    def discovery_document(self):
+        if self._document is None:
+            with self._lock:
+                if self._document is None:
+                    self._document = load_discovery_document(self._api_root)
+        return self._document
+
+    def ensure_fresh_credentials(self):
+        """
+        Refreshes the shared credentials if they are missing a token or close to expiry.
+        Only one thread refreshes; the others wait and reuse the new token.
+        """
+        credentials = self.credentials
+        if not self._needs_refresh(credentials):
+            return
+        with self._refresh_lock:
+            if not self._needs_refresh(credentials):
+                return
+            import httplib2
+            import google_auth_httplib2
+            credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=self._timeout)))
+
+    def _needs_refresh(self, credentials):
+        if not getattr(credentials, 'valid', True):
+            return True
+        expiry = getattr(credentials, 'expiry', None)
+        if expiry is None:
+            return False
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return expiry - now <= self._refresh_margin
+
+    def build_service(self):
+        """
+        Builds a new authorized service object from the cached discovery document.
+        """
+        import httplib2
+        import google_auth_httplib2
+        from googleapiclient.discovery import build_from_document
+
+        http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self._timeout))
+        return build_from_document(self.discovery_document, http=http)
+
+    def _acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self.build_service()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Timed out waiting for a pooled Calendar client.")
+
+    @contextmanager
+    def service(self, timeout=None):
+        """
+        Context manager yielding a pooled service object, returned to the pool on exit.
+        """
+        self.ensure_fresh_credentials()
+        service = self._acquire(timeout)
+        try:
+            yield service
+        finally:
+            self._idle.put(service)
+
+    def stats(self):
+        return {"size": self._size, "created": self._created, "idle": self._idle.qsize()}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool():
+    """
+    Returns the current tenant's CalendarClientPool, or the process-wide one (created on first use)
+    when there is no tenant.
+    """
+    global _pool
+    pool = current_pool()
+    if pool is not None:
+        return pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = CalendarClientPool()
+    return _pool
+
+
+def set_client_pool(pool):
+    """
+    Replaces the process-wide pool (used by benchmarks to point at a fake server).
+    """
+    global _pool
+    with _pool_lock:
+        _pool = pool
+
+
+def pool_stats():
+    """
+    Stats of the process-wide pool without creating it (empty until the first Calendar call).
+    """
+    pool = _pool
+    return pool.stats() if pool is not None else {}
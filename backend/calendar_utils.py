@@ -1,99 +1,801 @@
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from datetime import datetime, timezone
+from datetime import datetime
+import contextvars
+import logging
 import os
-import pytz
+import uuid
 import dotenv
+from backend.calendar_client import get_client_pool
+from backend.reservations import ledger
+from backend.metrics import metrics
+from backend.rate_limit import rate_limiter, deadline, is_retryable, RateLimitExceeded
+from backend.logging_config import log_payload
+from backend.tenants import current_busy_cache, current_mirror, current_tenant, tenant_registry
+from backend.timezones import get_zone, wall_clock
 dotenv.load_dotenv()
 
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-SERVICE_ACCOUNT_FILE = 'service_account.json'
+logger = logging.getLogger(__name__)
+
 CALENDAR_ID = os.getenv("CALENDAR_ID")
+# Inserts per Calendar batch HTTP request
+CALENDAR_BATCH_SIZE = int(os.getenv("CALENDAR_BATCH_SIZE", "50"))
+# Threads available to the async request path for blocking Calendar calls
+CALENDAR_MAX_WORKERS = int(os.getenv("CALENDAR_MAX_WORKERS", os.getenv("CALENDAR_POOL_SIZE", "8")))
+# Calendars per freebusy query (the API's item limit); more are split into parallel queries
+FREEBUSY_MAX_CALENDARS = int(os.getenv("FREEBUSY_MAX_CALENDARS", "50"))
+# Add attendees to created events as guests; service accounts need domain-wide delegation for this,
+# so by default attendees are only used for the availability check
+INVITE_ATTENDEES = os.getenv("INVITE_ATTENDEES", "false").lower() in ("1", "true", "yes")
+
+_executor = None
+_freebusy_executor = None
 
 def get_calendar_service():
     """
-    Authenticates and returns the Google Calendar service object.
+    Returns a dedicated Google Calendar service object for the caller to keep.
+    Credentials and the discovery document come from the shared client pool;
+    API calls in this module borrow pooled services instead.
+    """
+    return get_client_pool().build_service()
+
+def parse_in_zone(value, zone):
+    """
+    Parses an ISO/RFC3339 string (or passes a datetime through) as an aware datetime in zone.
+    Naive values are taken to be wall-clock time in zone, matching how create_event sends them.
+    """
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            from dateutil import parser
+            dt = parser.parse(value)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=zone)
+    return dt if dt.tzinfo is zone else dt.astimezone(zone)
+
+def _day_window(start_dt, end_dt):
+    """
+    Widens [start_dt, end_dt) to whole local days so one freebusy fetch serves later
+    questions about the same days from the busy cache.
     """
-    credentials = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    service = build('calendar', 'v3', credentials=credentials)
-    return service
+    from datetime import timedelta
+    day_start = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end = end_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if day_end < end_dt:
+        day_end += timedelta(days=1)
+    return day_start, day_end
 
-def check_availability(start_time, end_time, timezone='UTC'):
+def current_calendar_id():
     """
-    Checks if the calendar is free between start_time and end_time.
-    start_time and end_time should be in RFC3339 (with timezone info).
+    The current tenant's calendar, or CALENDAR_ID when there is no tenant.
+    """
+    tenant = current_tenant()
+    return tenant.calendar_id if tenant is not None else CALENDAR_ID
+
+def calendars_for(attendees=None):
+    """
+    The current calendar followed by the attendees' calendars (their email addresses), without duplicates.
+    """
+    return list(dict.fromkeys([current_calendar_id(), *(attendees or ())]))
+
+def get_freebusy_executor():
+    """
+    Returns the thread pool running the parallel freebusy queries of a multi-calendar lookup.
+    It is separate from the calendar executor, whose threads wait on these queries.
+    """
+    global _freebusy_executor
+    if _freebusy_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _freebusy_executor = ThreadPoolExecutor(max_workers=CALENDAR_MAX_WORKERS, thread_name_prefix="freebusy")
+    return _freebusy_executor
+
+def _query_freebusy(calendar_ids, window_start, window_end, timezone):
     """
-    print("Checking availability between:", start_time, end_time, "Timezone:", timezone)
+    One freebusy query for up to FREEBUSY_MAX_CALENDARS calendars; returns {calendar_id: [(start, end)]}.
+    Attendee calendars Google can't read (unknown, or not shared) are left out of the result and so
+    count as free; an error on the current calendar itself is raised.
+    """
+    from dateutil import parser
+    body = {
+        "timeMin": window_start.isoformat(),
+        "timeMax": window_end.isoformat(),
+        "timeZone": timezone,
+        "items": [{"id": calendar_id} for calendar_id in calendar_ids]
+    }
+    log_payload(logger, "Freebusy request body: %s", body)
+    primary = current_calendar_id()
+    with metrics.span("freebusy"), get_client_pool().service() as service:
+        events_result = rate_limiter.call(service.freebusy().query(body=body).execute, primary)
+    log_payload(logger, "Freebusy response: %s", events_result)
+    busy_by_calendar = {}
+    for calendar_id, calendar in events_result['calendars'].items():
+        if calendar.get('errors'):
+            if calendar_id == primary:
+                raise RuntimeError(f"Freebusy error for {calendar_id}: {calendar['errors']}")
+            logger.info("No free/busy information for %s: %s", calendar_id, calendar['errors'])
+            continue
+        busy_by_calendar[calendar_id] = [
+            (parser.isoparse(b['start']).timestamp(), parser.isoparse(b['end']).timestamp())
+            for b in calendar.get('busy', [])
+        ]
+    return busy_by_calendar
+
+def fetch_busy_by_calendar(calendar_ids, start_dt, end_dt, timezone='UTC'):
+    """
+    Returns {calendar_id: busy intervals in [start_dt, end_dt)} as (start, end) epoch-second pairs,
+    clipped to the window. Each calendar is served from the event mirror when it is fresh (never for
+    a tenant, see current_mirror), then from the busy cache when a fresh fetched window covers it; all
+    remaining calendars are fetched together, FREEBUSY_MAX_CALENDARS per freebusy query with the
+    queries running in parallel, and stored.
+    """
+    start_ts, end_ts = start_dt.timestamp(), end_dt.timestamp()
+    cache, mirror = current_busy_cache(), current_mirror()
+    busy_by_calendar = {}
+    missing = []
+    for calendar_id in dict.fromkeys(calendar_ids):
+        if mirror is not None and mirror.is_fresh(calendar_id):
+            busy_by_calendar[calendar_id] = mirror.busy(calendar_id, start_ts, end_ts)
+            continue
+        cached = cache.lookup(calendar_id, start_ts, end_ts)
+        if cached is not None:
+            busy_by_calendar[calendar_id] = cached
+        else:
+            missing.append(calendar_id)
+    if not missing:
+        return busy_by_calendar
+
+    window_start, window_end = _day_window(start_dt, end_dt) if cache.enabled else (start_dt, end_dt)
+    chunks = [missing[i:i + FREEBUSY_MAX_CALENDARS] for i in range(0, len(missing), FREEBUSY_MAX_CALENDARS)]
+    if len(chunks) == 1:
+        answers = [_query_freebusy(chunks[0], window_start, window_end, timezone)]
+    else:
+        # Each query runs in a copy of this context, so it goes through the same tenant's client pool
+        contexts = [contextvars.copy_context() for _ in chunks]
+        answers = list(get_freebusy_executor().map(
+            lambda chunk, context: context.run(_query_freebusy, chunk, window_start, window_end, timezone),
+            chunks, contexts))
+    for answer in answers:
+        for calendar_id, busy in answer.items():
+            cache.store(calendar_id, window_start.timestamp(), window_end.timestamp(), busy)
+            busy_by_calendar[calendar_id] = [(max(s, start_ts), min(e, end_ts))
+                                             for s, e in busy if s < end_ts and e > start_ts]
+    return busy_by_calendar
+
+def fetch_busy(start_dt, end_dt, timezone='UTC', calendar_ids=None):
+    """
+    Returns busy intervals in [start_dt, end_dt) as (start, end) epoch-second pairs, clipped to
+    the window: those of the current calendar, or the merged busy times of every calendar in calendar_ids
+    (see fetch_busy_by_calendar).
+    """
+    from backend.slots import merge_intervals
+    busy_by_calendar = fetch_busy_by_calendar(calendar_ids or [current_calendar_id()], start_dt, end_dt, timezone)
+    if len(busy_by_calendar) == 1:
+        return next(iter(busy_by_calendar.values()))
+    return merge_intervals(interval for busy in busy_by_calendar.values() for interval in busy)
+
+def check_availability(start_time, end_time, timezone='UTC', calendar_ids=None):
+    """
+    Checks if the calendar (or every one of calendar_ids) is free between start_time and end_time.
+    start_time and end_time are RFC3339 strings; values without an offset are read in timezone.
+    Returns (is_free, busy_times) with busy_times formatted like the freebusy API response.
+    """
+    logger.debug("Checking availability between %s and %s (%s)", start_time, end_time, timezone)
     try:
-        service = get_calendar_service()
-
-        # ✅ Convert to RFC3339 with explicit timezone
-        from dateutil import parser, tz
-        ist = tz.gettz(timezone)
-        start_rfc3339 = parser.parse(start_time).astimezone(ist).isoformat()
-        end_rfc3339 = parser.parse(end_time).astimezone(ist).isoformat()
-
-        body = {
-            "timeMin": start_rfc3339,
-            "timeMax": end_rfc3339,
-            "timeZone": timezone,
-            "items": [{"id": CALENDAR_ID}]
-        }
-
-        print("Google Calendar API request body:", body)
-        events_result = service.freebusy().query(body=body).execute()
-        print("Google Calendar API response:", events_result)
-        busy_times = events_result['calendars'][CALENDAR_ID]['busy']
+        zone = get_zone(timezone)
+        start_dt = parse_in_zone(start_time, zone)
+        end_dt = parse_in_zone(end_time, zone)
+        busy = fetch_busy(start_dt, end_dt, timezone, calendar_ids)
+        busy_times = [
+            {"start": datetime.fromtimestamp(s, zone).isoformat(), "end": datetime.fromtimestamp(e, zone).isoformat()}
+            for s, e in busy
+        ]
         is_free = len(busy_times) == 0
         return is_free, busy_times
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print("Google Calendar API error:", repr(e))
+    except Exception:
+        logger.exception("Google Calendar API error (check_availability)")
         raise
 
 
-def create_event(start_time, end_time, summary, description='', timezone='UTC'):
+def search_free_slots(range_start, range_end, duration_minutes, timezone='UTC', work_start='09:00',
+                      work_end='18:00', granularity_minutes=15, limit=5, include_weekends=False,
+                      calendar_ids=None):
+    """
+    Finds the earliest free slots of duration_minutes between range_start and range_end, free on
+    every calendar of calendar_ids (default the current calendar).
+    Busy times come from one freebusy window covering the whole range (or the busy cache).
+    Returns a list of {"start": ..., "end": ...} RFC3339 strings in timezone.
+    """
+    from datetime import time as dt_time, timedelta
+    from backend.slots import find_free_slots
+    zone = get_zone(timezone)
+    start_dt = parse_in_zone(range_start, zone)
+    end_dt = parse_in_zone(range_end, zone)
+    if start_dt >= end_dt:
+        raise ValueError("Range start must be before range end.")
+    busy = fetch_busy(start_dt, end_dt, timezone, calendar_ids)
+    slots = find_free_slots(
+        busy, start_dt, end_dt, timedelta(minutes=duration_minutes),
+        work_start=dt_time.fromisoformat(work_start), work_end=dt_time.fromisoformat(work_end),
+        granularity=timedelta(minutes=granularity_minutes), limit=limit, include_weekends=include_weekends,
+    )
+    return [
+        {"start": datetime.fromtimestamp(s, zone).isoformat(), "end": datetime.fromtimestamp(e, zone).isoformat()}
+        for s, e in slots
+    ]
+
+
+def list_events(start_time, end_time, timezone='UTC', limit=250):
+    """
+    Returns the events overlapping [start_time, end_time) in start order, from the event mirror
+    when it is fresh (never for a tenant), otherwise with a live events.list call.
+    """
+    zone = get_zone(timezone)
+    start_dt = parse_in_zone(start_time, zone)
+    end_dt = parse_in_zone(end_time, zone)
+    if start_dt >= end_dt:
+        raise ValueError("Range start must be before range end.")
+    calendar_id, mirror = current_calendar_id(), current_mirror()
+    if mirror is not None and mirror.is_fresh(calendar_id):
+        return mirror.events(calendar_id, start_dt.timestamp(), end_dt.timestamp(), limit)
+    with metrics.span("list"), get_client_pool().service() as service:
+        result = rate_limiter.call(service.events().list(
+            calendarId=calendar_id, timeMin=start_dt.isoformat(), timeMax=end_dt.isoformat(),
+            singleEvents=True, orderBy='startTime', maxResults=limit).execute, calendar_id)
+    return result.get('items', [])
+
+
+def iter_event_pages(start_time, end_time, timezone='UTC', page_size=250):
+    """
+    Lazily yields the events overlapping [start_time, end_time) one events.list page at a time, in
+    start order with recurring events expanded into instances. Each page is its own rate-limited
+    call, and no pooled client is held between pages.
+    """
+    zone = get_zone(timezone)
+    start_dt = parse_in_zone(start_time, zone)
+    end_dt = parse_in_zone(end_time, zone)
+    if start_dt >= end_dt:
+        raise ValueError("Range start must be before range end.")
+    calendar_id = current_calendar_id()
+    page_token = None
+    while True:
+        with metrics.span("list"), get_client_pool().service() as service:
+            page = rate_limiter.call(service.events().list(
+                calendarId=calendar_id, timeMin=start_dt.isoformat(), timeMax=end_dt.isoformat(),
+                singleEvents=True, orderBy='startTime', maxResults=page_size, pageToken=page_token).execute,
+                calendar_id)
+        yield page.get('items', [])
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def build_event_body(start_time, end_time, summary, description='', timezone='UTC', attendees=None,
+                     recurrence=None):
+    """
+    Returns the events().insert request body for a single event, or for a series with recurrence
+    (an "RRULE:..." line); attendees are only added as guests with INVITE_ATTENDEES.
+    start_time and end_time are RFC3339 strings, sent as they are, or aware datetimes, sent as
+    wall-clock time in timezone.
+    """
+    if isinstance(start_time, datetime):
+        start_time = wall_clock(start_time, get_zone(timezone))
+    if isinstance(end_time, datetime):
+        end_time = wall_clock(end_time, get_zone(timezone))
+    body = {
+        'summary': summary,
+        'description': description,
+        'start': {
+            'dateTime': start_time,
+            'timeZone': timezone,
+        },
+        'end': {
+            'dateTime': end_time,
+            'timeZone': timezone,
+        },
+    }
+    if attendees and INVITE_ATTENDEES:
+        body['attendees'] = [{'email': attendee} for attendee in attendees]
+    if recurrence:
+        body['recurrence'] = [recurrence]
+    return body
+
+class EventIdConflict(Exception):
+    """
+    The client-chosen id of an insert belongs to an event with other details (e.g. an
+    Idempotency-Key reused for a different booking), so nothing was booked.
+    """
+
+def _instant(time_field):
+    value = time_field.get('dateTime') or time_field['date']
+    return parse_in_zone(value, get_zone(time_field.get('timeZone') or 'UTC')).timestamp()
+
+def same_booking(event, body):
+    """
+    True if an existing event is the booking an insert body describes: not cancelled, with the same
+    summary, start and end instants and recurrence.
+    """
+    if event.get('status') == 'cancelled':
+        return False
+    try:
+        return (event.get('summary') == body.get('summary')
+                and _instant(event['start']) == _instant(body['start'])
+                and _instant(event['end']) == _instant(body['end'])
+                and list(event.get('recurrence') or ()) == list(body.get('recurrence') or ()))
+    except (KeyError, ValueError):
+        return False
+
+def resolve_id_conflict(service, calendar_id, body):
+    """
+    The event for an insert of body that failed with 409 because its id exists: the existing event
+    if it is the same booking (a retry), or the cancelled one restored with body if that booking was
+    deleted since (Calendar keeps the ids of deleted events).
+    Raises:
+        EventIdConflict: If the id belongs to another event
+    """
+    event_id = body['id']
+    existing = rate_limiter.call(service.events().get(calendarId=calendar_id, eventId=event_id).execute, calendar_id)
+    if same_booking(existing, body):
+        logger.info("Event id %s already exists, returning the existing event", event_id)
+        return existing
+    if existing.get('status') != 'cancelled':
+        raise EventIdConflict(f"Event id {event_id} already belongs to another event.")
+    logger.info("Event id %s was deleted, restoring it", event_id)
+    return rate_limiter.call(service.events().update(calendarId=calendar_id, eventId=event_id,
+                                                     body={**body, 'status': 'confirmed'}).execute, calendar_id)
+
+def new_event_id():
+    """
+    A random event id for an insert whose caller chose none (lowercase hex, like event_id_for).
+    """
+    return uuid.uuid4().hex
+
+def own_event(event_id, body):
+    """
+    The event an earlier attempt of the booking described by body created under event_id, or None.
+    """
+    existing = get_event(event_id) if event_id else None
+    return existing if existing is not None and same_booking(existing, body) else None
+
+def is_conflict(error):
+    """
+    True if a Calendar API error is HTTP 409, which events.insert returns for an existing event id.
+    """
+    from googleapiclient.errors import HttpError
+    return isinstance(error, HttpError) and error.resp.status == 409
+
+def get_event(event_id):
+    """
+    Returns the event with this id, or None if it does not exist or was cancelled.
+    """
+    from googleapiclient.errors import HttpError
+    calendar_id = current_calendar_id()
+    with get_client_pool().service() as service:
+        try:
+            event = rate_limiter.call(service.events().get(calendarId=calendar_id, eventId=event_id).execute,
+                                      calendar_id)
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                return None
+            raise
+    return None if event.get('status') == 'cancelled' else event
+
+def create_event(start_time, end_time, summary, description='', timezone='UTC', event_id=None, attendees=None,
+                 recurrence=None):
     """
     Creates a new event on the calendar.
     Args:
-        start_time (str): ISO format string, e.g., '2024-06-01T10:00:00Z'
-        end_time (str): ISO format string, e.g., '2024-06-01T11:00:00Z'
+        start_time (str or datetime): ISO format string, e.g., '2024-06-01T10:00:00Z', or an aware datetime
+        end_time (str or datetime): ISO format string, e.g., '2024-06-01T11:00:00Z', or an aware datetime
         summary (str): Event title
         description (str): Event description
         timezone (str): Timezone string, default 'UTC'
+        event_id (str): Optional client-chosen event id; if an event with this id already exists
+            (a retried request), that event is returned instead of creating a duplicate
+            (see resolve_id_conflict). Without one a random id is used, so an insert retried after
+            a 5xx that did go through is not created twice either
+        attendees (list): Optional guest emails (see INVITE_ATTENDEES)
+        recurrence (str): Optional "RRULE:..." line making the event a series (see backend.recurrence)
     Returns:
         dict: The created event object
     Raises:
+        EventIdConflict: If event_id belongs to another event
         Exception: If the API call fails
     """
-    print("Creating event:", start_time, end_time, summary, description, timezone)
+    logger.debug("Creating event %s - %s (%s)", start_time, end_time, timezone)
     try:
-        service = get_calendar_service()
-        event = {
-            'summary': summary,
-            'description': description,
-            'start': {
-                'dateTime': start_time,
-                'timeZone': timezone,
-            },
-            'end': {
-                'dateTime': end_time,
-                'timeZone': timezone,
-            },
-        }
-        print("Google Calendar API create event body:", event)
-        created_event = service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
-        print("Google Calendar API create event response:", created_event)
+        event = build_event_body(start_time, end_time, summary, description, timezone, attendees, recurrence)
+        event['id'] = event_id or new_event_id()
+        log_payload(logger, "Create event body: %s", event)
+        primary = current_calendar_id()
+        with get_client_pool().service() as service:
+            try:
+                with metrics.span("insert"):
+                    created_event = rate_limiter.call(
+                        service.events().insert(calendarId=primary, body=event).execute, primary)
+            except Exception as e:
+                if not is_conflict(e):
+                    raise
+                created_event = resolve_id_conflict(service, primary, event)
+        log_payload(logger, "Create event response: %s", created_event)
+        zone = get_zone(timezone)
+        start_dt, end_dt = parse_in_zone(start_time, zone), parse_in_zone(end_time, zone)
+        if recurrence:
+            from backend.recurrence import iter_occurrences
+            intervals = iter_occurrences(recurrence, start_dt, end_dt, series_horizon(start_dt))
+        else:
+            intervals = [(start_dt.timestamp(), end_dt.timestamp())]
+        cache = current_busy_cache()
+        for start_ts, end_ts in intervals:
+            for calendar_id in (calendars_for(attendees) if INVITE_ATTENDEES else [primary]):
+                cache.add_busy(calendar_id, start_ts, end_ts)
+        mirror = current_mirror()
+        if mirror is not None and recurrence:
+            # The mirror holds expanded instances, which only a sync brings in
+            mirror.mark_dirty(primary)
+        elif mirror is not None:
+            mirror.upsert(primary, created_event, timezone)
         return created_event
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print("Google Calendar API error (create_event):", repr(e))
+    except Exception:
+        logger.exception("Google Calendar API error (create_event)")
         raise
 
-print("Imports successful!")
+def contested_result(interval, zone):
+    """
+    Result dict for a slot that another in-flight (or just committed) booking holds a lease on.
+    """
+    start, end = interval[:2]
+    return {
+        "status": "contested",
+        "busy_slots": [{"start": datetime.fromtimestamp(start, zone).isoformat(),
+                        "end": datetime.fromtimestamp(end, zone).isoformat()}],
+        "message": "Time slot is being booked by another request.",
+    }
+
+def book_if_free(start_time, end_time, summary, description='', timezone='UTC', event_id=None, attendees=None):
+    """
+    Checks availability and creates the event while holding a reservation lease on the slot,
+    so two concurrent requests for overlapping times cannot both see it free and both book it.
+    With attendees, the slot must be free on each of their calendars too (one freebusy query).
+    All Calendar calls share one CALENDAR_DEADLINE for queueing behind the rate limiter and retries.
+    Args:
+        start_time, end_time, summary, description, timezone, event_id, attendees: as for create_event
+    Returns:
+        dict: status 'booked' (with event), 'busy' or 'contested' (with busy_slots), and a message
+    Raises:
+        RateLimitExceeded: If the Calendar API stays rate limited past the deadline
+        Exception: If a Calendar API call fails
+    """
+    with deadline():
+        return _book_if_free(start_time, end_time, summary, description, timezone, event_id, attendees)
+
+def _book_if_free(start_time, end_time, summary, description, timezone, event_id, attendees):
+    zone = get_zone(timezone)
+    start = parse_in_zone(start_time, zone).timestamp()
+    end = parse_in_zone(end_time, zone).timestamp()
+    body = build_event_body(start_time, end_time, summary, description, timezone, attendees)
+    lease, contested = ledger.reserve(current_calendar_id(), start, end, owner=event_id)
+    if lease is None:
+        # A retry of a request whose booking was already committed finds its own lease
+        existing = own_event(event_id, body) if contested[2] == event_id else None
+        if existing is not None:
+            return {"status": "booked", "event": existing, "message": "Event booked successfully."}
+        logger.info("Slot %s - %s contested by another booking", start_time, end_time)
+        return contested_result(contested, zone)
+    try:
+        is_free, busy_times = check_availability(start_time, end_time, timezone, calendars_for(attendees))
+        if not is_free:
+            # A retry whose first attempt already booked the slot finds its own event busy
+            existing = own_event(event_id, body)
+            if existing is not None:
+                return {"status": "booked", "event": existing, "message": "Event booked successfully."}
+            return {"status": "busy", "busy_slots": busy_times, "message": "Time slot is busy."}
+        event = create_event(start_time, end_time, summary, description, timezone, event_id, attendees)
+        ledger.commit(lease)
+        return {"status": "booked", "event": event, "message": "Event booked successfully."}
+    finally:
+        ledger.release(lease)
+
+def series_horizon(start_dt):
+    """
+    Occurrences of a series starting before this are checked for conflicts.
+    """
+    from datetime import timedelta
+    from backend.recurrence import RECURRENCE_HORIZON_DAYS
+    return start_dt + timedelta(days=RECURRENCE_HORIZON_DAYS)
+
+def book_recurring_if_free(start_time, end_time, summary, description='', timezone='UTC', recurrence=None,
+                           event_id=None, attendees=None):
+    """
+    Books a recurring series if none of its occurrences (up to RECURRENCE_HORIZON_DAYS ahead) is busy.
+    Occurrences are expanded lazily from the RRULE, leased like single bookings, and checked against
+    one freebusy window covering all of them; the series is then created with one recurring insert.
+    Args:
+        start_time, end_time: The first occurrence, as for create_event
+        recurrence (str): RRULE, with or without the "RRULE:" prefix
+        summary, description, timezone, event_id, attendees: as for book_if_free
+    Returns:
+        dict: as for book_if_free, plus 'occurrences' (the number checked) and, when busy,
+        'conflicts' (the first conflicting occurrences) with busy_slots overlapping them
+    Raises:
+        ValueError: If the recurrence rule is invalid
+        RateLimitExceeded: If the Calendar API stays rate limited past the deadline
+    """
+    with deadline():
+        return _book_recurring_if_free(start_time, end_time, summary, description, timezone, recurrence,
+                                       event_id, attendees)
+
+def _book_recurring_if_free(start_time, end_time, summary, description, timezone, recurrence, event_id, attendees):
+    from backend.recurrence import normalize_rrule, iter_occurrences, find_conflicts, RECURRENCE_MAX_REPORTED
+    from backend.slots import merge_intervals
+    zone = get_zone(timezone)
+    start_dt, end_dt = parse_in_zone(start_time, zone), parse_in_zone(end_time, zone)
+    rule = normalize_rrule(recurrence, zone)
+    horizon = series_horizon(start_dt)
+    calendar_id = current_calendar_id()
+    body = build_event_body(start_time, end_time, summary, description, timezone, attendees, rule)
+
+    leases = []
+    try:
+        window_end = end_dt.timestamp()
+        for start, end in iter_occurrences(rule, start_dt, end_dt, horizon):
+            lease, contested = ledger.reserve(calendar_id, start, end, owner=event_id)
+            if lease is None:
+                existing = own_event(event_id, body) if contested[2] == event_id else None
+                if existing is not None:
+                    return {"status": "booked", "event": existing, "message": "Event booked successfully."}
+                logger.info("Occurrence %s of series %s contested by another booking", start, rule)
+                return contested_result(contested, zone)
+            leases.append(lease)
+            window_end = end
+        # One busy list for the whole series, swept against the occurrences in a single pass
+        busy = merge_intervals(fetch_busy(start_dt, datetime.fromtimestamp(window_end, zone), timezone,
+                                          calendars_for(attendees)))
+        conflicts = list(find_conflicts(iter_occurrences(rule, start_dt, end_dt, horizon), busy))
+        if conflicts:
+            existing = own_event(event_id, body)
+            if existing is not None:
+                return {"status": "booked", "event": existing, "occurrences": len(leases),
+                        "message": "Event booked successfully."}
+            reported = conflicts[:RECURRENCE_MAX_REPORTED]
+            fmt = lambda ts: datetime.fromtimestamp(ts, zone).isoformat()
+            return {
+                "status": "busy",
+                "occurrences": len(leases),
+                "conflicts": [{"start": fmt(s), "end": fmt(e)} for (s, e), _ in reported],
+                "busy_slots": [{"start": fmt(s), "end": fmt(e)}
+                               for _, hits in reported for s, e in hits],
+                "message": f"{len(conflicts)} of {len(leases)} occurrences are busy.",
+            }
+        event = create_event(start_time, end_time, summary, description, timezone, event_id, attendees, rule)
+        for lease in leases:
+            ledger.commit(lease)
+        return {"status": "booked", "event": event, "occurrences": len(leases),
+                "message": "Recurring event booked successfully."}
+    finally:
+        for lease in leases:
+            ledger.release(lease)
+
+def _execute_batches(service, requests):
+    """
+    Sends requests (HttpRequest objects built on service) through Calendar batch HTTP requests,
+    CALENDAR_BATCH_SIZE per round-trip. Returns a list aligned with requests holding either the
+    response or the exception raised for it. Every part counts against the rate limiter, and parts
+    rejected with a retryable error are resent together in the next round.
+    """
+    results = [None] * len(requests)
+    batch_deadline = rate_limiter.current_deadline()
+    calendar_id = current_calendar_id()
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    pending = list(range(len(requests)))
+    attempt = 0
+    while pending:
+        for offset in range(0, len(pending), CALENDAR_BATCH_SIZE):
+            chunk = pending[offset:offset + CALENDAR_BATCH_SIZE]
+            batch = service.new_batch_http_request(callback=callback)
+            for i in chunk:
+                batch.add(requests[i], request_id=str(i))
+            try:
+                rate_limiter.call(batch.execute, calendar_id, cost=len(chunk))
+            except RateLimitExceeded as e:
+                # Out of time: the rest of the batch fails per item and can be retried by the client
+                for i in pending[offset:]:
+                    results[i] = e
+                break
+        # Parts that were rate limited are resent; they keep their error if that can't happen in time
+        retryable = [i for i in pending if is_retryable(results[i])]
+        try:
+            if not retryable or not rate_limiter.retry_wait(results[retryable[0]], attempt, calendar_id,
+                                                            batch_deadline):
+                break
+        except RateLimitExceeded:
+            break
+        pending = retryable
+        attempt += 1
+    return results
+
+def insert_events_batch(bodies):
+    """
+    Inserts event bodies through Calendar batch HTTP requests (see _execute_batches).
+    Returns a list aligned with bodies holding either the created event or the exception raised for it.
+    Bodies without an 'id' get a random one, since parts are resent after retryable errors; a
+    body whose 'id' already exists resolves as in resolve_id_conflict.
+    """
+    bodies = [body if body.get('id') else {**body, 'id': new_event_id()} for body in bodies]
+    calendar_id = current_calendar_id()
+    with get_client_pool().service() as service:
+        with metrics.span("insert_batch"):
+            results = _execute_batches(
+                service, [service.events().insert(calendarId=calendar_id, body=body) for body in bodies])
+        # Bodies whose id already exists were inserted by an earlier attempt (or run)
+        for i, result in enumerate(results):
+            if is_conflict(result):
+                try:
+                    results[i] = resolve_id_conflict(service, calendar_id, bodies[i])
+                except Exception as e:
+                    results[i] = e
+    return results
+
+def get_events_batch(event_ids):
+    """
+    Looks up many events by id through Calendar batch HTTP requests (see _execute_batches).
+    Returns a list aligned with event_ids holding the event, None if it does not exist or was
+    cancelled, or the exception raised for it.
+    """
+    from googleapiclient.errors import HttpError
+    calendar_id = current_calendar_id()
+    with get_client_pool().service() as service, metrics.span("get_batch"):
+        results = _execute_batches(
+            service, [service.events().get(calendarId=calendar_id, eventId=event_id) for event_id in event_ids])
+    return [None if (isinstance(result, HttpError) and result.resp.status in (404, 410))
+            or (isinstance(result, dict) and result.get('status') == 'cancelled') else result
+            for result in results]
+
+def book_events_batch(bookings, timezone='UTC', event_ids=None):
+    """
+    Books many events with one freebusy query covering all of them and batched inserts.
+    Args:
+        bookings (list): dicts with start_time, end_time, summary, description and optionally
+            attendees, as for create_event; all calendars of the batch share one freebusy lookup
+        timezone (str): Timezone of the bookings, unless one has its own 'timezone'
+        event_ids (list): Optional client-chosen event ids aligned with bookings (see create_event)
+    Returns:
+        list: One result dict per booking, in order, with status 'booked', 'busy' (overlaps an
+        existing event), 'conflict' (overlaps an earlier booking in the same batch), 'contested'
+        (overlaps a booking another request is making) or 'error'.
+    """
+    from backend.busy_cache import BusyIntervalIndex
+    from backend.slots import merge_intervals
+    if not bookings:
+        return []
+    zone = get_zone(timezone)
+    timezones = [b.get('timezone') or timezone for b in bookings]
+    zones = [get_zone(name) for name in timezones]
+    windows = [(parse_in_zone(b['start_time'], z).timestamp(), parse_in_zone(b['end_time'], z).timestamp())
+               for b, z in zip(bookings, zones)]
+    range_start = datetime.fromtimestamp(min(start for start, _ in windows), zone)
+    range_end = datetime.fromtimestamp(max(end for _, end in windows), zone)
+    primary, cache, mirror = current_calendar_id(), current_busy_cache(), current_mirror()
+    calendar_ids = calendars_for([a for b in bookings for a in b.get('attendees') or ()])
+    existing = {}
+    for calendar_id, intervals in fetch_busy_by_calendar(calendar_ids, range_start, range_end, timezone).items():
+        index = existing[calendar_id] = BusyIntervalIndex()
+        for start, end in intervals:
+            index.add_busy(start, end)
+
+    # Earlier items in the batch win; conflicts are detected locally without any API call
+    accepted = BusyIntervalIndex()
+    results = []
+    to_insert = []
+    for i, (start, end) in enumerate(windows):
+        busy = merge_intervals(interval for calendar_id in calendars_for(bookings[i].get('attendees'))
+                               if calendar_id in existing for interval in existing[calendar_id].overlaps(start, end))
+        # Only a busy interval covering the whole slot can be this booking's own event
+        covered = event_ids and any(s <= start and e >= end for s, e in busy)
+        existing_event = own_event(event_ids[i], build_event_body(
+            bookings[i]['start_time'], bookings[i]['end_time'], bookings[i]['summary'],
+            bookings[i].get('description') or '', timezones[i], bookings[i].get('attendees'))) if covered else None
+        if existing_event is not None:
+            # A retry (or a rerun job) whose earlier attempt already inserted this booking
+            results.append({"status": "booked", "event": existing_event, "message": "Event booked successfully."})
+        elif busy:
+            results.append({
+                "status": "busy",
+                "busy_slots": [{"start": datetime.fromtimestamp(s, zones[i]).isoformat(),
+                                "end": datetime.fromtimestamp(e, zones[i]).isoformat()} for s, e in busy],
+                "message": "Time slot is busy.",
+            })
+        elif accepted.overlaps(start, end):
+            results.append({"status": "conflict", "message": "Overlaps an earlier booking in this batch."})
+        else:
+            lease, contested = ledger.reserve(primary, start, end, owner=event_ids[i] if event_ids else None)
+            if lease is None:
+                results.append(contested_result(contested, zones[i]))
+                continue
+            accepted.add_busy(start, end)
+            results.append(None)
+            to_insert.append((i, lease))
+
+    bodies = [build_event_body(bookings[i]['start_time'], bookings[i]['end_time'], bookings[i]['summary'],
+                               bookings[i].get('description') or '', timezones[i], bookings[i].get('attendees'))
+              for i, _ in to_insert]
+    if event_ids:
+        for body, (i, _) in zip(bodies, to_insert):
+            body['id'] = event_ids[i]
+    logger.info("Batch booking: %d to insert, %d rejected locally", len(to_insert), len(bookings) - len(to_insert))
+    try:
+        for (i, lease), created in zip(to_insert, insert_events_batch(bodies)):
+            if isinstance(created, Exception):
+                results[i] = {"status": "error", "message": str(created)}
+            else:
+                ledger.commit(lease)
+                cache.add_busy(primary, *windows[i])
+                if mirror is not None:
+                    mirror.upsert(primary, created, timezones[i])
+                results[i] = {"status": "booked", "event": created, "message": "Event booked successfully."}
+    finally:
+        for _, lease in to_insert:
+            ledger.release(lease)
+    return results
+
+def get_calendar_executor():
+    """
+    Returns the bounded thread pool that async callers use for blocking Calendar API calls.
+    """
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=CALENDAR_MAX_WORKERS, thread_name_prefix="calendar")
+    return _executor
+
+async def run_in_calendar_executor(func, *args, **kwargs):
+    """
+    Runs a blocking Calendar call on the calendar executor without blocking the event loop.
+    The call runs in a copy of the caller's context (deadline, tenant), and a tenant's calls wait
+    for one of its max_concurrency slots first, so one tenant cannot occupy every executor thread.
+    """
+    import asyncio
+    import functools
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    tenant = current_tenant()
+    if tenant is None:
+        return await loop.run_in_executor(get_calendar_executor(), call)
+    async with tenant_registry.limit(tenant):
+        return await loop.run_in_executor(get_calendar_executor(), call)
+
+async def acheck_availability(start_time, end_time, timezone='UTC', calendar_ids=None):
+    return await run_in_calendar_executor(check_availability, start_time, end_time, timezone, calendar_ids)
+
+async def acreate_event(start_time, end_time, summary, description='', timezone='UTC', event_id=None,
+                        attendees=None):
+    return await run_in_calendar_executor(create_event, start_time, end_time, summary, description, timezone,
+                                          event_id, attendees)
+
+async def abook_if_free(start_time, end_time, summary, description='', timezone='UTC', event_id=None,
+                        attendees=None):
+    return await run_in_calendar_executor(book_if_free, start_time, end_time, summary, description, timezone,
+                                          event_id, attendees)
+
+async def abook_recurring_if_free(start_time, end_time, summary, description='', timezone='UTC', recurrence=None,
+                                  event_id=None, attendees=None):
+    return await run_in_calendar_executor(book_recurring_if_free, start_time, end_time, summary, description,
+                                          timezone, recurrence, event_id, attendees)
+
+async def abook_events_batch(bookings, timezone='UTC', event_ids=None):
+    return await run_in_calendar_executor(book_events_batch, bookings, timezone, event_ids)
+
+async def alist_events(start_time, end_time, timezone='UTC', limit=250):
+    return await run_in_calendar_executor(list_events, start_time, end_time, timezone, limit)
+
+async def asearch_free_slots(range_start, range_end, duration_minutes, timezone='UTC', **kwargs):
+    return await run_in_calendar_executor(search_free_slots, range_start, range_end, duration_minutes, timezone,
+                                          **kwargs)
+
+logger.debug("Imports successful!")
 
 if __name__ == "__main__":
     try:
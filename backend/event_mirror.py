@@ -0,0 +1,308 @@
+"""
+Local mirror of each calendar's events in SQLite, indexed by start and end time.
+A background task keeps it current with incremental events.list syncs (only changes since the last
+syncToken come over the wire; a 410 Gone triggers a full resync). While a calendar's last sync is
+within EVENT_MIRROR_MAX_STALENESS, availability checks, slot searches and event listings are served
+from the mirror instead of live Calendar calls. Bookings made through this process are written to
+the mirror immediately, so they are visible before the next sync. A calendar with a live push
+notification channel (see webhooks) stays trusted beyond that bound until a change is announced.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import dotenv
+from backend.metrics import metrics
+from backend.rate_limit import rate_limiter
+from backend.timezones import find_zone
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EVENT_MIRROR_ENABLED = os.getenv("EVENT_MIRROR_ENABLED", "false").lower() in ("1", "true", "yes")
+# SQLite path; the default keeps the mirror in memory for the life of the process
+EVENT_MIRROR_DB = os.getenv("EVENT_MIRROR_DB", ":memory:")
+# Seconds between background syncs, and the age after which the mirror is no longer trusted
+EVENT_MIRROR_SYNC_INTERVAL = float(os.getenv("EVENT_MIRROR_SYNC_INTERVAL", "30"))
+EVENT_MIRROR_MAX_STALENESS = float(os.getenv("EVENT_MIRROR_MAX_STALENESS", "120"))
+EVENT_MIRROR_PAGE_SIZE = 2500
+
+
+def _event_bounds(event, default_tz):
+    """
+    (start, end) epoch seconds of an event; all-day events span whole days in default_tz.
+    """
+    from dateutil import parser
+
+    bounds = []
+    for key in ("start", "end"):
+        value = event.get(key) or {}
+        if "dateTime" in value:
+            dt = parser.isoparse(value["dateTime"])
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=find_zone(value.get("timeZone") or default_tz))
+        elif "date" in value:
+            dt = parser.isoparse(value["date"]).replace(tzinfo=find_zone(value.get("timeZone") or default_tz))
+        else:
+            return None
+        bounds.append(dt.timestamp())
+    return tuple(bounds)
+
+
+class EventMirror:
+    """
+    SQLite store of (calendar, event) rows plus a sync token and last sync time per calendar.
+    One connection is shared under a lock: reads are single indexed range queries, and writes
+    come from the sync task and from local bookings.
+    """
+
+    def __init__(self, path=EVENT_MIRROR_DB, enabled=EVENT_MIRROR_ENABLED,
+                 max_staleness=EVENT_MIRROR_MAX_STALENESS, clock=time.time):
+        self.path = path
+        self.enabled = enabled
+        self.max_staleness = max_staleness
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sync_locks = {}
+        self._conn = None
+        # calendar id -> expiry of its push channel; calendars with unsynced announced changes
+        self._watched = {}
+        self._dirty = set()
+        self._sync_tasks = {}
+        self.hits = 0
+        self.stale = 0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.resyncs = 0
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS events ("
+                         " calendar_id TEXT NOT NULL, id TEXT NOT NULL, start REAL NOT NULL, end REAL NOT NULL,"
+                         " busy INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (calendar_id, id))")
+            conn.execute("CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start)")
+            conn.execute("CREATE INDEX IF NOT EXISTS events_end ON events (calendar_id, end)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sync_state ("
+                         " calendar_id TEXT PRIMARY KEY, sync_token TEXT, synced_at REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(calendar_id, event, default_tz):
+        bounds = _event_bounds(event, default_tz)
+        if bounds is None:
+            return None
+        busy = int(event.get("transparency") != "transparent")
+        return (calendar_id, event["id"], bounds[0], bounds[1], busy, json.dumps(event))
+
+    def _apply(self, conn, calendar_id, events, default_tz):
+        for event in events:
+            row = self._row(calendar_id, event, default_tz) if event.get("status") != "cancelled" else None
+            if row is None:
+                conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event["id"]))
+            else:
+                conn.execute("INSERT OR REPLACE INTO events (calendar_id, id, start, end, busy, data)"
+                             " VALUES (?, ?, ?, ?, ?, ?)", row)
+
+    def upsert(self, calendar_id, event, default_tz="UTC"):
+        """
+        Records an event created or changed by this process, ahead of the next sync.
+        """
+        if not self.enabled or not isinstance(event, dict) or not event.get("id"):
+            return
+        with self._lock:
+            self._apply(self._connect(), calendar_id, [event], default_tz)
+
+    def set_watched(self, calendar_id, until):
+        """
+        Records that changes to calendar_id are pushed to us until `until` (None: no longer watched).
+        """
+        with self._lock:
+            if until is None:
+                self._watched.pop(calendar_id, None)
+            else:
+                self._watched[calendar_id] = until
+
+    def mark_dirty(self, calendar_id):
+        """
+        A change was announced: the mirror of calendar_id is not trusted until the next sync.
+        """
+        with self._lock:
+            self._dirty.add(calendar_id)
+
+    def request_sync(self, calendar_id):
+        """
+        Starts a background sync of calendar_id unless one is already running; it repeats while
+        changes keep being announced. Must be called on the event loop.
+        """
+        task = self._sync_tasks.get(calendar_id)
+        if task is None or task.done():
+            self._sync_tasks[calendar_id] = asyncio.get_running_loop().create_task(self._sync_while_dirty(calendar_id))
+
+    async def _sync_while_dirty(self, calendar_id):
+        while calendar_id in self._dirty:
+            try:
+                await asyncio.to_thread(self.sync, calendar_id)
+            except Exception as e:
+                logger.warning("Mirror sync of %s failed: %r", calendar_id, e)
+                return
+
+    def is_fresh(self, calendar_id):
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._connect().execute("SELECT synced_at FROM sync_state WHERE calendar_id = ?",
+                                          (calendar_id,)).fetchone()
+            now = self._clock()
+            fresh = (row is not None and calendar_id not in self._dirty
+                     and (now - row[0] <= self.max_staleness or self._watched.get(calendar_id, 0) > now))
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale += 1
+        return fresh
+
+    def busy(self, calendar_id, start_ts, end_ts):
+        """
+        Merged busy intervals overlapping [start_ts, end_ts), clipped to it, like a freebusy answer.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT start, end FROM events WHERE calendar_id = ? AND busy = 1 AND start < ? AND end > ?"
+                " ORDER BY start", (calendar_id, end_ts, start_ts)).fetchall()
+        merged = []
+        for start, end in rows:
+            start, end = max(start, start_ts), min(end, end_ts)
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def events(self, calendar_id, start_ts, end_ts, limit=250):
+        """
+        Events overlapping [start_ts, end_ts), in start order.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT data FROM events WHERE calendar_id = ? AND start < ? AND end > ? ORDER BY start LIMIT ?",
+                (calendar_id, end_ts, start_ts, limit)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def _list_pages(self, service, calendar_id, sync_token):
+        """
+        Yields events.list pages of a full sync (no token) or an incremental one.
+        """
+        page_token = None
+        while True:
+            kwargs = {"calendarId": calendar_id, "singleEvents": True, "maxResults": EVENT_MIRROR_PAGE_SIZE}
+            if sync_token:
+                kwargs["syncToken"] = sync_token
+            if page_token:
+                kwargs["pageToken"] = page_token
+            page = rate_limiter.call(service.events().list(**kwargs).execute, calendar_id)
+            yield page
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return
+
+    def sync(self, calendar_id):
+        """
+        Brings one calendar up to date: incrementally from its sync token, or with a full sync if it
+        has none or Google answers 410 Gone. Returns the number of changed events received.
+        """
+        from googleapiclient.errors import HttpError
+        from backend.calendar_client import get_client_pool
+
+        lock = self._sync_locks.setdefault(calendar_id, threading.Lock())
+        with lock, metrics.span("mirror_sync"):
+            with self._lock:
+                # Changes announced from here on need another sync
+                was_dirty = calendar_id in self._dirty
+                self._dirty.discard(calendar_id)
+                row = self._connect().execute("SELECT sync_token FROM sync_state WHERE calendar_id = ?",
+                                              (calendar_id,)).fetchone()
+            sync_token = row[0] if row else None
+            try:
+                with get_client_pool().service() as service:
+                    try:
+                        pages = list(self._list_pages(service, calendar_id, sync_token))
+                    except HttpError as e:
+                        if not (sync_token and e.resp.status == 410):
+                            raise
+                        logger.info("Sync token for %s expired, running a full resync", calendar_id)
+                        self.resyncs += 1
+                        sync_token = None
+                        pages = list(self._list_pages(service, calendar_id, None))
+            except BaseException:
+                if was_dirty:
+                    self.mark_dirty(calendar_id)
+                raise
+            changed = 0
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if sync_token is None:
+                        conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+                    for page in pages:
+                        items = page.get("items", [])
+                        self._apply(conn, calendar_id, items, page.get("timeZone") or "UTC")
+                        changed += len(items)
+                    conn.execute("INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_at)"
+                                 " VALUES (?, ?, ?)", (calendar_id, pages[-1].get("nextSyncToken"), self._clock()))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                if sync_token is None:
+                    self.full_syncs += 1
+                else:
+                    self.incremental_syncs += 1
+            return changed
+
+    async def sync_forever(self, calendar_ids, interval=EVENT_MIRROR_SYNC_INTERVAL):
+        """
+        Background task: syncs every calendar from calendar_ids() each interval. Failures are logged
+        and retried on the next round; reads fall back to live calls once the mirror is stale.
+        """
+        while True:
+            for calendar_id in calendar_ids():
+                try:
+                    changed = await asyncio.to_thread(self.sync, calendar_id)
+                    if changed:
+                        logger.debug("Mirror of %s synced, %d changed events", calendar_id, changed)
+                except Exception as e:
+                    logger.warning("Mirror sync of %s failed: %r", calendar_id, e)
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            conn = self._connect()
+            events = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+            oldest = conn.execute("SELECT MIN(synced_at) FROM sync_state").fetchone()[0]
+            return {
+                "enabled": True,
+                "events": events,
+                "watched": len(self._watched),
+                "dirty": len(self._dirty),
+                "max_age_s": round(self._clock() - oldest, 1) if oldest is not None else None,
+                "hits": self.hits,
+                "stale": self.stale,
+                "full_syncs": self.full_syncs,
+                "incremental_syncs": self.incremental_syncs,
+                "resyncs": self.resyncs,
+            }
+
+
+event_mirror = EventMirror()
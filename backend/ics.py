@@ -0,0 +1,573 @@
+"""
+iCalendar (.ics) import and export.
+Files are read one content line at a time: folded lines are joined as they stream past and each
+VEVENT is handed on as soon as its END line is read, so memory stays flat however large the file is.
+Imports go IMPORT_CHUNK_SIZE events at a time. The busy times of a chunk are fetched once into a
+local merged index that its events are checked against, and the events that fit are inserted through
+rate-limited batch requests. Event ids derive from the UID, so rerunning a chunk resolves to the events
+an earlier attempt created, and the progress reported after each chunk is a resume point.
+Exports page through events.list and yield the calendar a page at a time.
+
+Usage:  python -m backend.ics import team.ics --timezone Europe/Berlin
+        python -m backend.ics export --start 2026-01-01 --end 2027-01-01 --output backup.ics
+"""
+
+import codecs
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+from backend import calendar_utils
+from backend.busy_cache import BusyIntervalIndex
+from backend.idempotency import event_id_for
+from backend.rate_limit import deadline, is_retryable, RateLimitExceeded
+from backend.reservations import ledger
+from backend.tenants import current_busy_cache, current_mirror
+from backend.timezones import DEFAULT_TIMEZONE, find_zone, get_zone
+import dotenv
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# VEVENTs checked and inserted together; progress is reported (and can be resumed) per chunk
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "200"))
+# Longest window fetched with one freebusy query; the windows of a chunk are grouped up to this span
+IMPORT_MAX_WINDOW_DAYS = int(os.getenv("IMPORT_MAX_WINDOW_DAYS", "60"))
+# Uploads larger than this are spooled to a temporary file instead of memory
+IMPORT_SPOOL_BYTES = int(os.getenv("IMPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# Events per events.list page of an export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "250"))
+
+PRODID = "-//Calendar AI Agent//ICS export//EN"
+
+DURATION_RE = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+TEXT_ESCAPE_RE = re.compile(r'\\([\\;,nN])')
+
+
+def iter_lines(chunks):
+    """
+    Yields the unfolded content lines of an iCalendar stream. chunks is any iterable of bytes or
+    text (a file object, an upload); lines are joined with their folded continuations as they arrive.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')('replace')
+    rest = ''
+    pending = None
+    for chunk in chunks:
+        rest += decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        *complete, rest = rest.split('\n')
+        for raw in complete:
+            raw = raw.rstrip('\r')
+            if raw[:1] in (' ', '\t') and pending is not None:
+                pending += raw[1:]
+                continue
+            if pending:
+                yield pending
+            pending = raw
+    rest = (rest + decoder.decode(b'', final=True)).rstrip('\r')
+    if rest[:1] in (' ', '\t') and pending is not None:
+        pending += rest[1:]
+    elif rest:
+        if pending:
+            yield pending
+        pending = rest
+    if pending:
+        yield pending
+
+
+def parse_line(line):
+    """
+    Splits a content line 'NAME;PARAM=value:text' into (NAME, {PARAM: value}, text).
+    Colons and semicolons inside quoted parameter values are not separators.
+    """
+    quoted = False
+    fields = []
+    start = 0
+    for i, ch in enumerate(line):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch in ';:':
+            fields.append(line[start:i])
+            start = i + 1
+            if ch == ':':
+                break
+    else:
+        raise ValueError(f"Not a content line: {line[:80]!r}")
+    params = {}
+    for field in fields[1:]:
+        key, _, value = field.partition('=')
+        params[key.upper()] = value.strip('"')
+    return fields[0].upper(), params, line[start:]
+
+
+def iter_vevents(lines):
+    """
+    Yields each VEVENT in lines as {NAME: [(params, value), ...]}. Components nested in an event
+    (alarms) are skipped, and so is everything outside events, VTIMEZONE definitions included:
+    TZID names are resolved against the system time zone database instead.
+    """
+    event = None
+    depth = 0
+    for line in lines:
+        try:
+            name, params, value = parse_line(line)
+        except ValueError:
+            logger.debug("Skipping malformed line %r", line[:80])
+            continue
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.upper() == 'VEVENT':
+                event = {}
+        elif name == 'END':
+            if event is None:
+                continue
+            if depth:
+                depth -= 1
+            elif value.upper() == 'VEVENT':
+                yield event
+                event = None
+        elif event is not None and not depth:
+            event.setdefault(name, []).append((params, value))
+
+
+def unescape_text(value):
+    return TEXT_ESCAPE_RE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def escape_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _value(vevent, name, default=None):
+    values = vevent.get(name)
+    return values[0] if values else (None, default)
+
+
+def _time_value(params, value, timezone):
+    """
+    The events.insert start/end object for a DTSTART/DTEND value, and the aware datetime it stands
+    for (midnight in timezone for a date). Floating times, and TZIDs the system doesn't know (such
+    as Windows zone names), are read in timezone.
+    """
+    value = value.strip()
+    if params.get('VALUE', '').upper() == 'DATE' or 'T' not in value:
+        day = datetime.strptime(value, '%Y%m%d')
+        return {'date': day.strftime('%Y-%m-%d')}, day.replace(tzinfo=get_zone(timezone))
+    if value.endswith('Z'):
+        dt = datetime.strptime(value[:-1], '%Y%m%dT%H%M%S').replace(tzinfo=get_zone('UTC'))
+        return {'dateTime': dt.strftime('%Y-%m-%dT%H:%M:%SZ'), 'timeZone': 'UTC'}, dt
+    zone_name = params.get('TZID') or timezone
+    zone = find_zone(zone_name)
+    if zone is None:
+        logger.info("Unknown TZID %r, reading the time in %s", zone_name, timezone)
+        zone_name, zone = timezone, get_zone(timezone)
+    dt = datetime.strptime(value, '%Y%m%dT%H%M%S')
+    return {'dateTime': dt.strftime('%Y-%m-%dT%H:%M:%S'), 'timeZone': zone_name}, dt.replace(tzinfo=zone)
+
+
+def _duration(value):
+    match = DURATION_RE.match(value.strip().upper())
+    if not match or not any(match.groups()[1:]):
+        raise ValueError(f"Invalid DURATION {value!r}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == '-' else duration
+
+
+def _format_params(params):
+    return "".join(f";{key}=\"{value}\"" if any(c in value for c in ':;,') else f";{key}={value}"
+                   for key, value in params.items())
+
+
+def event_from_vevent(vevent, timezone='UTC'):
+    """
+    Converts a parsed VEVENT into an import item: a dict with the uid, the events.insert body (its
+    id derived from the UID and RECURRENCE-ID) and windows, the (start, end) epoch seconds it keeps
+    busy; every occurrence up to RECURRENCE_HORIZON_DAYS for a series, none if it is transparent.
+    Returns None for a cancelled event.
+    Raises ValueError if the VEVENT can't be imported.
+    """
+    from backend.recurrence import normalize_rrule, iter_occurrences
+    if _value(vevent, 'STATUS', '')[1].upper() == 'CANCELLED':
+        return None
+    start_params, start_value = _value(vevent, 'DTSTART')
+    if start_value is None:
+        raise ValueError("VEVENT without DTSTART")
+    try:
+        start, start_dt = _time_value(start_params, start_value, timezone)
+        end_params, end_value = _value(vevent, 'DTEND')
+        if end_value is not None:
+            end, end_dt = _time_value(end_params, end_value, timezone)
+        else:
+            _, duration = _value(vevent, 'DURATION')
+            if duration is not None:
+                end_dt = start_dt + _duration(duration)
+            else:
+                end_dt = start_dt + (timedelta(days=1) if 'date' in start else timedelta())
+            end = ({'date': end_dt.strftime('%Y-%m-%d')} if 'date' in start
+                   else {'dateTime': end_dt.strftime('%Y-%m-%dT%H:%M:%S'), 'timeZone': start['timeZone']})
+            if start.get('timeZone') == 'UTC':
+                end['dateTime'] += 'Z'
+    except ValueError as e:
+        raise ValueError(f"Invalid date in VEVENT: {e}") from None
+    if end_dt < start_dt:
+        raise ValueError("VEVENT ends before it starts")
+
+    uid = _value(vevent, 'UID', '')[1].strip()
+    recurrence_id = _value(vevent, 'RECURRENCE-ID', '')[1].strip()
+    summary = unescape_text(_value(vevent, 'SUMMARY', '')[1])
+    if not uid:
+        # Without a UID, the start and title identify the event across reruns of the same file
+        uid = f"{start_value}/{summary}"
+    body = {
+        'id': event_id_for(f"ics\n{uid}\n{recurrence_id}", calendar_utils.current_calendar_id()),
+        'summary': summary,
+        'description': unescape_text(_value(vevent, 'DESCRIPTION', '')[1]),
+        'start': start,
+        'end': end,
+    }
+    if _value(vevent, 'UID')[1]:
+        # Exported again as the UID, so a file round-trips to the same event ids
+        body['extendedProperties'] = {'private': {'icsUid': uid}}
+    location = unescape_text(_value(vevent, 'LOCATION', '')[1])
+    if location:
+        body['location'] = location
+    if _value(vevent, 'TRANSP', '')[1].upper() == 'TRANSPARENT':
+        body['transparency'] = 'transparent'
+    if _value(vevent, 'STATUS', '')[1].upper() == 'TENTATIVE':
+        body['status'] = 'tentative'
+
+    rrules = vevent.get('RRULE')
+    rule = normalize_rrule(rrules[0][1], start_dt.tzinfo) if rrules else None
+    if rule:
+        body['recurrence'] = [rule] + [f"{name}{_format_params(params)}:{value}"
+                                       for name in ('EXDATE', 'RDATE') for params, value in vevent.get(name, ())]
+    if body.get('transparency') == 'transparent':
+        windows = []
+    elif rule:
+        windows = list(iter_occurrences(rule, start_dt, end_dt, calendar_utils.series_horizon(start_dt)))
+    else:
+        windows = [(start_dt.timestamp(), end_dt.timestamp())]
+    return {"uid": uid, "body": body, "windows": windows}
+
+
+def _fetch_spans(windows, max_span):
+    """
+    Groups (start, end) windows into as few spans as possible, none longer than max_span seconds
+    unless a single window is; each span is then one busy lookup.
+    """
+    spans = []
+    for start, end in sorted(windows):
+        if spans and max(end, spans[-1][1]) - spans[-1][0] <= max_span:
+            spans[-1][1] = max(end, spans[-1][1])
+        else:
+            spans.append([start, end])
+    return spans
+
+
+def _item_summary(item, status, message):
+    body = item["body"]
+    start = body["start"].get("dateTime") or body["start"].get("date")
+    return {"uid": item["uid"], "summary": body["summary"], "start": start, "status": status, "message": message}
+
+
+def import_chunk(items, timezone, imported, check_conflicts=True):
+    """
+    Imports one chunk of items (see event_from_vevent) and returns (status, event or message or
+    exception) per item, status being 'imported', 'conflict' (overlaps busy time that did not come
+    from this import, or a booking in flight) or 'error'. imported is the merged index of what this
+    import has inserted so far, so events of one file may overlap each other; it is updated in place.
+    """
+    zone = get_zone(timezone)
+    calendar_id, cache, mirror = calendar_utils.current_calendar_id(), current_busy_cache(), current_mirror()
+    existing = BusyIntervalIndex()
+    if check_conflicts:
+        spans = _fetch_spans([w for item in items for w in item["windows"]], IMPORT_MAX_WINDOW_DAYS * 86400)
+        for span_start, span_end in spans:
+            for start, end in calendar_utils.fetch_busy(datetime.fromtimestamp(span_start, zone),
+                                                         datetime.fromtimestamp(span_end, zone), timezone):
+                existing.add_busy(start, end)
+            for start, end in imported.overlaps(span_start, span_end):
+                existing.drop_window(start, end)
+
+    busy = [[interval for window in item["windows"] for interval in existing.overlaps(*window)] for item in items]
+    # Only busy time covering a whole event can be the event itself, inserted by an earlier run
+    covered = [i for i, item in enumerate(items)
+               if busy[i] and any(s <= item["windows"][0][0] and e >= item["windows"][0][1] for s, e in busy[i])]
+    found = dict(zip(covered, calendar_utils.get_events_batch([items[i]["body"]["id"] for i in covered])))
+    results = [None] * len(items)
+    to_insert = []
+    try:
+        for i, item in enumerate(items):
+            if isinstance(found.get(i), Exception):
+                results[i] = ("error", found[i])
+                continue
+            if busy[i]:
+                results[i] = ("imported", found[i]) if found.get(i) is not None else (
+                    "conflict", f"Overlaps {len(busy[i])} busy interval(s) already on the calendar.")
+                continue
+            lease = None
+            if check_conflicts and len(item["windows"]) == 1:
+                lease, _ = ledger.reserve(calendar_id, *item["windows"][0], owner=item["body"]["id"])
+                if lease is None:
+                    results[i] = ("conflict", "Overlaps a booking in progress.")
+                    continue
+            to_insert.append((i, lease))
+
+        with deadline():
+            created = calendar_utils.insert_events_batch([items[i]["body"] for i, _ in to_insert])
+        for (i, lease), event in zip(to_insert, created):
+            if isinstance(event, Exception):
+                results[i] = ("error", event)
+                continue
+            results[i] = ("imported", event)
+            if lease is not None:
+                ledger.commit(lease)
+            for start, end in items[i]["windows"]:
+                imported.add_busy(start, end)
+                cache.add_busy(calendar_id, start, end)
+            if mirror is not None and "recurrence" in items[i]["body"]:
+                mirror.mark_dirty(calendar_id)
+            elif mirror is not None:
+                mirror.upsert(calendar_id, event, timezone)
+    finally:
+        for _, lease in to_insert:
+            if lease is not None:
+                ledger.release(lease)
+    return results
+
+
+def import_events(vevents, timezone='UTC', skip=0, check_conflicts=True, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Imports parsed VEVENTs chunk by chunk, yielding a progress dict after each chunk and a last one
+    with complete set once the input is exhausted:
+      done: VEVENTs handled so far, skipped ones included; pass it as skip to resume
+      imported / conflicts / errors / cancelled: counts for this run
+      failed: the events of the chunk that were not imported, with status and message
+    An event whose insert stays rate limited (or fails with another retryable error), or a failed
+    busy lookup, stops the import: the last update then has complete False, an error, and done just
+    before that event. Events are inserted with ids derived from their UID, so when a resumed import
+    meets an event it already created further along, it picks that event up instead of duplicating it.
+    The first skip VEVENTs are only read; their windows count as this import's.
+    """
+    counts = {"imported": 0, "conflicts": 0, "errors": 0, "cancelled": 0}
+    imported = BusyIntervalIndex()
+    vevents = iter(vevents)
+    done = 0
+    while True:
+        # (position in the file, status, import item, failure entry), in file order
+        entries = []
+        items = []
+        for vevent in vevents:
+            done += 1
+            try:
+                item = event_from_vevent(vevent, timezone)
+            except ValueError as e:
+                if done > skip:
+                    entries.append((done, "error", None, {
+                        "uid": _value(vevent, 'UID', '')[1], "summary": unescape_text(_value(vevent, 'SUMMARY', '')[1]),
+                        "start": _value(vevent, 'DTSTART', '')[1], "status": "error", "message": str(e)}))
+                continue
+            if done <= skip:
+                for start, end in (item["windows"] if item else ()):
+                    imported.add_busy(start, end)
+            elif item is None:
+                entries.append((done, "cancelled", None, None))
+            else:
+                entries.append((done, None, item, None))
+                items.append(item)
+                if len(items) >= chunk_size:
+                    break
+
+        error = None
+        try:
+            results = iter(import_chunk(items, timezone, imported, check_conflicts) if items else [])
+        except Exception as e:
+            logger.exception("ICS import failed after event %d", entries[0][0] - 1)
+            error = str(e)
+            results = iter([("error", e)] * len(items))
+        stop_at = None
+        failed = []
+        for position, status, item, failure in entries:
+            if item is not None:
+                status, result = next(results)
+                if status == "error" and (error is not None or isinstance(result, RateLimitExceeded)
+                                          or is_retryable(result)):
+                    error = error or f"Calendar API still failing: {result}"
+                    stop_at = position
+                    break
+                if status != "imported":
+                    failure = _item_summary(item, status, result if status == "conflict" else str(result))
+            counts[{"imported": "imported", "conflict": "conflicts", "error": "errors",
+                    "cancelled": "cancelled"}[status]] += 1
+            if failure is not None:
+                failed.append(failure)
+        if stop_at is not None:
+            logger.warning("ICS import stopped at event %d: %s", stop_at, error)
+            yield {"done": stop_at - 1, **counts, "complete": False, "error": error, "failed": failed}
+            return
+        complete = len(items) < chunk_size
+        yield {"done": done, **counts, "complete": complete, "failed": failed}
+        if complete:
+            return
+
+
+def fold(line):
+    """
+    Folds a content line into lines of at most 75 octets, never splitting a UTF-8 character.
+    """
+    if len(line.encode('utf-8')) <= 75:
+        return line
+    parts = []
+    current = ''
+    size = 0
+    limit = 75
+    for ch in line:
+        width = len(ch.encode('utf-8'))
+        if size + width > limit:
+            parts.append(current)
+            current, size, limit = '', 0, 74
+        current += ch
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def _ics_time(name, value):
+    """
+    DTSTART/DTEND/RECURRENCE-ID line for an event's start/end object; times are written in UTC, so
+    the export needs no VTIMEZONE definitions.
+    """
+    from dateutil import parser
+    if 'date' in value:
+        return f"{name};VALUE=DATE:{value['date'].replace('-', '')}"
+    dt = parser.isoparse(value['dateTime'])
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=get_zone(value.get('timeZone') or 'UTC'))
+    return f"{name}:{dt.astimezone(get_zone('UTC')).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def vevent_text(event, stamp):
+    """
+    The VEVENT of an events.list item (an expanded instance or a single event), CRLF-terminated.
+    """
+    uid = (event.get('extendedProperties', {}).get('private', {}).get('icsUid')
+           or event.get('iCalUID') or f"{event['id']}@google.com")
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        _ics_time("DTSTART", event['start']),
+        _ics_time("DTEND", event['end']),
+    ]
+    if event.get('recurringEventId') and event.get('originalStartTime'):
+        lines.append(_ics_time("RECURRENCE-ID", event['originalStartTime']))
+    for name, field in (("SUMMARY", 'summary'), ("DESCRIPTION", 'description'), ("LOCATION", 'location')):
+        if event.get(field):
+            lines.append(f"{name}:{escape_text(event[field])}")
+    if event.get('transparency') == 'transparent':
+        lines.append("TRANSP:TRANSPARENT")
+    if event.get('status') == 'tentative':
+        lines.append("STATUS:TENTATIVE")
+    lines.append("END:VEVENT")
+    return "".join(fold(line) + "\r\n" for line in lines)
+
+
+def export_ics(start_time, end_time, timezone='UTC', page_size=EXPORT_PAGE_SIZE):
+    """
+    Yields the events overlapping [start_time, end_time) as an iCalendar file, one string per
+    events.list page, so an export never holds more than a page. The first page is fetched before
+    anything is yielded: errors about the range or the calendar surface on the first next() call.
+    Raises ValueError if the range is empty.
+    """
+    from dateutil import tz
+    pages = calendar_utils.iter_event_pages(start_time, end_time, timezone, page_size)
+    stamp = datetime.now(tz.UTC).strftime('%Y%m%dT%H%M%SZ')
+    header = f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\nMETHOD:PUBLISH\r\n"
+    first = next(pages)
+    yield header + "".join(vevent_text(event, stamp) for event in first if event.get('status') != 'cancelled')
+    for page in pages:
+        yield "".join(vevent_text(event, stamp) for event in page if event.get('status') != 'cancelled')
+    yield "END:VCALENDAR\r\n"
+
+
+def _load_checkpoint(path, source):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    if checkpoint.get("source") != source:
+        raise SystemExit(f"{path} is the checkpoint of another file; pass --restart to start over")
+    return checkpoint.get("done", 0)
+
+
+def _save_checkpoint(path, source, update):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"source": source, "done": update["done"], "complete": update["complete"]}, f)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    from backend.logging_config import configure_logging
+
+    arg_parser = argparse.ArgumentParser(description="Import or export the calendar as iCalendar (.ics).")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help="Import the events of an .ics file")
+    importer.add_argument('file')
+    importer.add_argument('--timezone', default=DEFAULT_TIMEZONE, help="Zone of floating times and all-day events")
+    importer.add_argument('--checkpoint', help="Progress file to resume from (default: FILE.import.json)")
+    importer.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start from the top")
+    importer.add_argument('--allow-conflicts', action='store_true',
+                          help="Import events even if they overlap busy time already on the calendar")
+    importer.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    exporter = commands.add_parser('export', help="Export a time range of the calendar")
+    exporter.add_argument('--start', required=True, help="Range start (ISO 8601)")
+    exporter.add_argument('--end', required=True, help="Range end (ISO 8601)")
+    exporter.add_argument('--timezone', default=DEFAULT_TIMEZONE, help="Zone of range bounds without an offset")
+    exporter.add_argument('--output', help="File to write (default stdout)")
+    args = arg_parser.parse_args(argv)
+    configure_logging()
+    if find_zone(args.timezone) is None:
+        arg_parser.error(f"Unknown time zone {args.timezone!r}")
+
+    if args.command == 'export':
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            for text in export_ics(args.start, args.end, args.timezone):
+                out.write(text)
+        finally:
+            if args.output:
+                out.close()
+        return 0
+
+    source = os.path.abspath(args.file)
+    checkpoint = args.checkpoint or args.file + ".import.json"
+    skip = 0 if args.restart else _load_checkpoint(checkpoint, source)
+    if skip:
+        print(f"Resuming after {skip} events ({checkpoint})", file=sys.stderr)
+    update = None
+    with open(args.file, 'rb') as f:
+        for update in import_events(iter_vevents(iter_lines(f)), args.timezone, skip,
+                                    not args.allow_conflicts, args.chunk_size):
+            _save_checkpoint(checkpoint, source, update)
+            for item in update["failed"]:
+                print(f"{item['status']}: {item['start']} {item['summary']!r} ({item['uid']}): {item['message']}",
+                      file=sys.stderr)
+            print(f"{update['done']} events read: {update['imported']} imported, {update['conflicts']} conflicts, "
+                  f"{update['errors']} errors, {update['cancelled']} cancelled", file=sys.stderr)
+    if update is not None and not update["complete"]:
+        print(f"Stopped: {update['error']}. Run the same command again to resume.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,199 @@
+"""
+Idempotency for booking requests.
+Each /chat, /book and /book/batch request gets a key, either the client's Idempotency-Key header or
+a hash of its normalized parameters. Completed results are kept in a bounded LRU/TTL store and
+returned to retries without calling Gemini or Google again, and concurrent requests with the same
+key are coalesced onto the one already running. Event ids derived from the key (or, for chat
+turns, from the extracted booking details) are passed to events.insert as a second safeguard across
+workers.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import timezone
+
+import dotenv
+from backend.tenants import current_tenant
+dotenv.load_dotenv()
+
+# Seconds a completed result is replayed for retries of the same request; 0 disables the store
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Longest client-supplied key accepted
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+
+def derive_key(scope, payload):
+    """
+    Key for a request without an Idempotency-Key header: a hash of its scope and normalized payload.
+    """
+    normalized = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f"{scope}\n{normalized}".encode('utf-8')).hexdigest()
+
+
+def request_key(scope, header_key, payload):
+    """
+    Store key for a request. Client keys are namespaced by scope, so the same key sent to /chat and
+    /book cannot replay one endpoint's result on the other, and by tenant, so one tenant's key
+    cannot replay another's.
+    """
+    tenant = current_tenant()
+    if tenant is not None:
+        scope = f"{tenant.tenant_id}/{scope}"
+    if header_key:
+        return f"{scope}:{header_key[:IDEMPOTENCY_MAX_KEY_LENGTH]}"
+    return f"{scope}:{derive_key(scope, payload)}"
+
+
+def event_id_for(key, calendar_id, index=None):
+    """
+    Deterministic Calendar event id for a request key. Lowercase hex is a subset of the base32hex
+    alphabet events.insert accepts, so a second insert with the same key fails with 409 instead of
+    creating a duplicate.
+    """
+    seed = f"{calendar_id}\n{key}" if index is None else f"{calendar_id}\n{key}\n{index}"
+    return hashlib.sha256(seed.encode('utf-8')).hexdigest()
+
+
+def booking_event_id(calendar_id, start, end, summary, recurrence=None):
+    """
+    Deterministic Calendar event id for a booking itself rather than the request asking for it:
+    the calendar, start and end (aware datetimes, compared as instants), summary and recurrence,
+    normalized. Two turns asking for the same event get the same id; different events never do,
+    whatever message or key they came with.
+    """
+    payload = {"start": start.astimezone(timezone.utc).isoformat(), "end": end.astimezone(timezone.utc).isoformat(),
+               "summary": " ".join(summary.split()), "recurrence": (recurrence or "").strip().upper()}
+    return event_id_for(derive_key("booking", payload), calendar_id)
+
+
+class IdempotencyStore:
+    """
+    Thread-safe, LRU-bounded map of key -> Future with TTL-based eviction.
+    A key maps to an in-flight Future while its request runs and to the completed Future afterwards.
+    Failed requests are dropped, so a retry runs again.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        # key -> (completed_at or None while running, Future)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _claim(self, key):
+        """
+        Returns (future, owner): owner is True if the caller must run the request and resolve future.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                completed_at, future = entry
+                if completed_at is None:
+                    self.coalesced += 1
+                    return future, False
+                if self._clock() - completed_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return future, False
+            self.misses += 1
+            future = Future()
+            self._entries[key] = (None, future)
+            self._entries.move_to_end(key)
+            self._evict()
+            return future, True
+
+    def _evict(self):
+        """
+        Drops expired completed entries from the LRU end, and the oldest completed ones while over
+        max_entries. In-flight entries stay so requests can still coalesce onto them.
+        """
+        now = self._clock()
+        stale = []
+        for key, (completed_at, _) in self._entries.items():
+            over = len(self._entries) - len(stale) > self.max_entries
+            if completed_at is None:
+                if not over:
+                    break
+            elif over or now - completed_at >= self.ttl:
+                stale.append(key)
+            else:
+                break
+        for key in stale:
+            del self._entries[key]
+
+    def _resolve(self, key, future, result=None, error=None, keep=True):
+        with self._lock:
+            if error is None and keep:
+                self._entries[key] = (self._clock(), future)
+            else:
+                self._entries.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def run(self, key, func, *args, keep=None, **kwargs):
+        """
+        Returns func(*args, **kwargs), or the result of an earlier or in-flight call with the same key.
+        keep is an optional predicate; results it rejects (e.g. transient errors) are handed to
+        coalesced waiters but not replayed to later retries.
+        """
+        if not self.enabled or key is None:
+            return func(*args, **kwargs)
+        future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, result, keep=keep is None or keep(result))
+        return result
+
+    async def arun(self, key, coro_func, *args, keep=None, **kwargs):
+        """
+        Async variant of run: awaits coro_func(*args, **kwargs) once per key. Waiters await the
+        owner's Future without blocking the event loop.
+        """
+        if not self.enabled or key is None:
+            return await coro_func(*args, **kwargs)
+        future, owner = self._claim(key)
+        if not owner:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await coro_func(*args, **kwargs)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, result, keep=keep is None or keep(result))
+        return result
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.coalesced + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            }
+
+
+idempotency_store = IdempotencyStore()
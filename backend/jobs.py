@@ -0,0 +1,444 @@
+"""
+Background booking jobs.
+With "Prefer: respond-async", /chat and /book enqueue the request as a job and answer 202 with its
+id at once, so no HTTP connection is held through Gemini and Calendar calls; clients poll (or
+long-poll with ?wait=) GET /jobs/{id}. A pool of JOB_WORKERS asyncio workers drains the queue.
+Jobs of a batchable kind aimed at the same calendar are claimed together and handled in one call,
+so /book jobs share a single freebusy lookup and batched inserts. The default store is in-process
+(queued jobs are lost on restart); set JOB_DB to a SQLite path to keep them across restarts and
+share the queue between workers, where a job whose worker died is picked up again after JOB_LEASE.
+The worker running a job renews its lease while the job runs, however long that takes, so a job
+is only run again once nobody is running it.
+Job ids derive from the request's idempotency key and payload, so a retried submission finds the same job.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+import dotenv
+from backend.metrics import metrics
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_DB = os.getenv("JOB_DB")
+# Most jobs handled in one batch, and how long a woken worker waits for more jobs to batch with
+JOB_BATCH_MAX = int(os.getenv("JOB_BATCH_MAX", "50"))
+JOB_BATCH_WINDOW = float(os.getenv("JOB_BATCH_WINDOW", "0.05"))
+# Jobs waiting to run before new submissions are refused
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "10000"))
+# Seconds finished jobs stay readable
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+# Seconds a claimed job is held without a sign of life from its worker before another worker
+# retries it; a running job's lease is renewed every third of this
+JOB_LEASE = float(os.getenv("JOB_LEASE", "120"))
+# Idle workers also look for jobs this often (jobs submitted by other processes sharing JOB_DB)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Longest accepted ?wait= on GET /jobs/{id}
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+FINAL_STATUSES = ("done", "failed")
+
+
+class QueueFull(Exception):
+    """
+    JOB_MAX_QUEUED jobs are already waiting.
+    """
+
+
+def job_id_for(key, payload):
+    """
+    Job id for a request idempotency key and the job's payload: a retried submission finds the same
+    job, and a key reused for another request gets a job of its own instead of the first one's.
+    """
+    normalized = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"job\n{key}\n{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+def new_job(job_id, kind, payload, calendar_id, now):
+    return {"id": job_id, "kind": kind, "calendar_id": calendar_id, "status": "queued", "payload": payload,
+            "result": None, "error": None, "created_at": now, "updated_at": now}
+
+
+class JobStore:
+    """
+    In-process store: jobs by id, a FIFO of queued ids plus one per (kind, calendar) so a batch is
+    claimed without scanning, and finished jobs expired JOB_TTL after they complete.
+    """
+
+    def __init__(self, ttl=JOB_TTL, clock=time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._jobs = {}
+        self._order = deque()
+        self._groups = OrderedDict()
+        self._finished = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._finished and self._finished[0][0] <= now - self.ttl:
+            self._jobs.pop(self._finished.popleft()[1], None)
+
+    def add(self, job, max_queued=None):
+        """
+        Stores a new job; returns (job, created). An existing job with the same id is returned instead.
+        Raises QueueFull if max_queued jobs are waiting.
+        """
+        with self._lock:
+            self._expire(self._clock())
+            existing = self._jobs.get(job["id"])
+            if existing is not None:
+                return dict(existing), False
+            if max_queued is not None and self.queued() >= max_queued:
+                raise QueueFull(f"{max_queued} jobs already queued.")
+            self._jobs[job["id"]] = dict(job)
+            self._order.append(job["id"])
+            self._groups.setdefault((job["kind"], job["calendar_id"]), deque()).append(job["id"])
+            return dict(job), True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def claim(self, batch_kinds, limit, lease=None):
+        """
+        Marks the oldest queued job running, with up to limit - 1 more queued jobs of the same kind
+        and calendar if its kind is in batch_kinds; returns them oldest first.
+        """
+        with self._lock:
+            while self._order and self._jobs.get(self._order[0], {}).get("status") != "queued":
+                self._order.popleft()
+            if not self._order:
+                return []
+            first = self._jobs[self._order[0]]
+            group_key = (first["kind"], first["calendar_id"])
+            group = self._groups[group_key]
+            count = limit if first["kind"] in batch_kinds else 1
+            now = self._clock()
+            claimed = []
+            while group and len(claimed) < count:
+                job = self._jobs.get(group.popleft())
+                if job is not None and job["status"] == "queued":
+                    job["status"] = "running"
+                    job["updated_at"] = now
+                    claimed.append(dict(job))
+            if not group:
+                del self._groups[group_key]
+            return claimed
+
+    def renew(self, job_ids, lease=None):
+        """
+        No-op: jobs of an in-process store are only ever run by this process.
+        """
+
+    def finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            now = self._clock()
+            job.update(status=status, result=result, error=error, updated_at=now)
+            self._finished.append((now, job_id))
+
+    def queued(self):
+        return sum(len(group) for group in self._groups.values())
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+
+class SQLiteJobStore:
+    """
+    Queue shared by several worker processes through one SQLite file. A claim is one IMMEDIATE
+    transaction, so two workers never take the same job; running jobs carry a lease, and a job
+    whose lease ran out (its worker died without renewing it) is claimed again. Bookings are safe
+    to rerun because their event ids come from the idempotency key.
+    """
+
+    # Finished jobs past their TTL are purged every this many submissions
+    PURGE_EVERY = 100
+
+    def __init__(self, path=JOB_DB, ttl=JOB_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._local = threading.local()
+        self._adds = 0
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                     " id TEXT PRIMARY KEY, kind TEXT NOT NULL, calendar_id TEXT, status TEXT NOT NULL,"
+                     " payload TEXT NOT NULL, result TEXT, error TEXT, created_at REAL NOT NULL,"
+                     " updated_at REAL NOT NULL, lease_until REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _job(row):
+        job_id, kind, calendar_id, status, payload, result, error, created_at, updated_at = row
+        return {"id": job_id, "kind": kind, "calendar_id": calendar_id, "status": status,
+                "payload": json.loads(payload), "result": json.loads(result) if result is not None else None,
+                "error": error, "created_at": created_at, "updated_at": updated_at}
+
+    _COLUMNS = "id, kind, calendar_id, status, payload, result, error, created_at, updated_at"
+
+    def add(self, job, max_queued=None):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job["id"],)).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self._job(row), False
+            if max_queued is not None and self._queued(conn) >= max_queued:
+                raise QueueFull(f"{max_queued} jobs already queued.")
+            conn.execute("INSERT INTO jobs (id, kind, calendar_id, status, payload, created_at, updated_at)"
+                         " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (job["id"], job["kind"], job["calendar_id"], job["status"], json.dumps(job["payload"]),
+                          job["created_at"], job["updated_at"]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._adds += 1
+        if self._adds % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at <= ?",
+                         (self._clock() - self.ttl,))
+        return dict(job), True
+
+    def get(self, job_id):
+        row = self._connect().execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def claim(self, batch_kinds, limit, lease=JOB_LEASE):
+        now = self._clock()
+        claimable = "(status = 'queued' OR (status = 'running' AND lease_until < ?))"
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first = conn.execute(f"SELECT id, kind, calendar_id FROM jobs WHERE {claimable}"
+                                 " ORDER BY created_at LIMIT 1", (now,)).fetchone()
+            if first is None:
+                conn.execute("COMMIT")
+                return []
+            job_id, kind, calendar_id = first
+            ids = [job_id]
+            if kind in batch_kinds and limit > 1:
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM jobs WHERE {claimable} AND kind = ? AND calendar_id IS ?"
+                    " ORDER BY created_at LIMIT ?", (now, kind, calendar_id, limit))]
+            marks = ",".join("?" * len(ids))
+            conn.execute(f"UPDATE jobs SET status = 'running', lease_until = ?, updated_at = ? WHERE id IN ({marks})",
+                         (now + lease, now, *ids))
+            rows = conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id IN ({marks}) ORDER BY created_at",
+                                ids).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [self._job(row) for row in rows]
+
+    def renew(self, job_ids, lease=JOB_LEASE):
+        """
+        Extends the lease of jobs that are still running.
+        """
+        marks = ",".join("?" * len(job_ids))
+        self._connect().execute(f"UPDATE jobs SET lease_until = ? WHERE status = 'running' AND id IN ({marks})",
+                                (self._clock() + lease, *job_ids))
+
+    def finish(self, job_id, status, result=None, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, lease_until = NULL WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, self._clock(), job_id))
+
+    @staticmethod
+    def _queued(conn):
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def queued(self):
+        return self._queued(self._connect())
+
+    def counts(self):
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobQueue:
+    """
+    Submits jobs to a store and runs them on a pool of asyncio workers. Handlers are registered per
+    kind: handler(payload) -> result, or for batch kinds handler([payload, ...]) -> [result, ...].
+    Results must be JSON-serializable; an exception fails every job of the call.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS, batch_max=JOB_BATCH_MAX, batch_window=JOB_BATCH_WINDOW,
+                 max_queued=JOB_MAX_QUEUED, lease=JOB_LEASE, poll_interval=JOB_POLL_INTERVAL, clock=time.time):
+        self.store = store
+        self.workers = workers
+        self.batch_max = batch_max
+        self.batch_window = batch_window
+        self.max_queued = max_queued
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._handlers = {}
+        self._batch_kinds = set()
+        self._wakeup = None
+        self._waiters = {}
+        self.submitted = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.max_batch = 0
+        self.failures = 0
+
+    def register(self, kind, handler, batch=False):
+        self._handlers[kind] = handler
+        if batch:
+            self._batch_kinds.add(kind)
+
+    def _wakeup_event(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def submit(self, kind, payload, job_id, calendar_id=None):
+        """
+        Enqueues a job unless one with this id exists; returns the job. Must be called on the event loop.
+        Raises QueueFull when JOB_MAX_QUEUED jobs are waiting.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler for job kind {kind!r}.")
+        job, created = self.store.add(new_job(job_id, kind, payload, calendar_id, self._clock()), self.max_queued)
+        if created:
+            self.submitted += 1
+            self._wakeup_event().set()
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    async def wait(self, job_id, timeout):
+        """
+        Long poll: returns the job once it is finished, or as it is after timeout seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - loop.time()
+            if job is None or job["status"] in FINAL_STATUSES or remaining <= 0:
+                return job
+            event = self._waiters.setdefault(job_id, asyncio.Event())
+            try:
+                # Jobs run by other processes sharing JOB_DB are only seen by polling
+                await asyncio.wait_for(event.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    def _finish(self, job, status, result=None, error=None):
+        self.store.finish(job["id"], status, result, error)
+        event = self._waiters.pop(job["id"], None)
+        if event is not None:
+            event.set()
+
+    async def _heartbeat(self, job_ids):
+        """
+        Renews the lease of running jobs every third of it until cancelled, so a slow job (an LLM
+        turn waiting out timeouts and retries) is not taken over by another worker while it runs.
+        """
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                self.store.renew(job_ids, self.lease)
+            except Exception:
+                logger.exception("Could not renew the lease of jobs %s", job_ids)
+
+    async def _run(self, jobs):
+        kind = jobs[0]["kind"]
+        now = self._clock()
+        for job in jobs:
+            metrics.observe("job_queue_wait", max(now - job["created_at"], 0.0))
+        self.batches += 1
+        self.batched_jobs += len(jobs)
+        self.max_batch = max(self.max_batch, len(jobs))
+        handler = self._handlers.get(kind)
+        heartbeat = asyncio.create_task(self._heartbeat([job["id"] for job in jobs]))
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind {kind!r}.")
+            with metrics.span(f"job {kind}"):
+                if kind in self._batch_kinds:
+                    results = await handler([job["payload"] for job in jobs])
+                else:
+                    results = [await handler(jobs[0]["payload"])]
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", jobs[0]["id"], kind)
+            self.failures += len(jobs)
+            for job in jobs:
+                self._finish(job, "failed", error=str(e))
+            return
+        finally:
+            heartbeat.cancel()
+        for job, result in zip(jobs, results):
+            self._finish(job, "done", result)
+
+    async def _worker(self):
+        wakeup = self._wakeup_event()
+        while True:
+            wakeup.clear()
+            jobs = self.store.claim(self._batch_kinds, self.batch_max, self.lease)
+            if jobs:
+                await self._run(jobs)
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                continue
+            # Let jobs submitted right behind this one join its batch
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+
+    async def run_forever(self):
+        """
+        Background task running the worker pool until cancelled.
+        """
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    def stats(self):
+        counts = self.store.counts()
+        return {
+            "workers": self.workers,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "mean_batch": round(self.batched_jobs / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+        }
+
+
+job_queue = JobQueue(SQLiteJobStore() if JOB_DB else JobStore())
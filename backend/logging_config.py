@@ -0,0 +1,49 @@
+"""
+Logging setup shared by the backend and the agent.
+Routine events go through the standard logging module at LOG_LEVEL. Full request/response payloads
+(chat messages, Gemini output, Calendar API bodies) are only logged when LOG_PAYLOADS enables them,
+either always or for a sampled fraction of calls, so they cost no I/O or formatting by default.
+"""
+
+import logging
+import os
+import random
+
+import dotenv
+dotenv.load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "off" (default), "all", or a sample rate between 0 and 1
+LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "off").lower()
+
+
+def _payload_rate(value):
+    if value in ("", "0", "off", "false", "no"):
+        return 0.0
+    if value in ("1", "all", "on", "true", "yes"):
+        return 1.0
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except ValueError:
+        return 0.0
+
+
+PAYLOAD_SAMPLE_RATE = _payload_rate(LOG_PAYLOADS)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """
+    Installs a root handler if the host (uvicorn, a script) has not configured one.
+    """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def log_payload(logger, message, *args):
+    """
+    logger.info for verbose payloads, subject to LOG_PAYLOADS; arguments are only formatted if logged.
+    """
+    if PAYLOAD_SAMPLE_RATE <= 0.0:
+        return
+    if PAYLOAD_SAMPLE_RATE < 1.0 and random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    logger.info(message, *args)
@@ -1,20 +1,190 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
-from datetime import datetime
-from backend.calendar_utils import create_event, check_availability
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, Optional, List, Dict, Any
+from datetime import datetime, timezone as dt_timezone
+from contextlib import asynccontextmanager
+from backend.calendar_client import get_client_pool, pool_stats
+from backend import calendar_utils
+from backend.calendar_utils import (abook_if_free, abook_recurring_if_free, asearch_free_slots, abook_events_batch,
+                                    alist_events, calendars_for, EventIdConflict)
+from backend.idempotency import idempotency_store, request_key, event_id_for
+from backend.sessions import session_store, SessionBusy
+from backend.busy_cache import busy_cache
+from backend.reservations import ledger
+from backend.event_mirror import event_mirror
+from backend.webhooks import watch_manager
+from backend.recurrence import normalize_rrule
+from backend.ics import export_ics, import_events, iter_lines, iter_vevents, IMPORT_SPOOL_BYTES
+from backend.timezones import DEFAULT_TIMEZONE, UnknownTimezone, get_zone, resolve_timezone, today_in, zone_cache
+from backend.jobs import job_queue, job_id_for, QueueFull, JOB_MAX_WAIT
+from backend.rate_limit import rate_limiter, RateLimitExceeded
+from backend.tenants import TenantMiddleware, current_tenant, tenant_registry, use_tenant
+from backend.metrics import metrics, MetricsMiddleware
+from backend.logging_config import configure_logging, log_payload
 # Import the agent conversation function
-from agent.booking_agent import run_agent_conversation
-import traceback
-import pytz
+from agent.booking_agent import arun_agent_conversation, get_llm, is_retryable_reply
+from agent.extraction_cache import extraction_cache
+from agent.extraction_schema import extraction_stats
+from agent.llm_gateway import llm_gateway
+from agent.fast_parser import fast_path_stats
+import asyncio
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+import uuid
 
-app = FastAPI()
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# "background" warms clients after startup without delaying readiness, "blocking" finishes
+# warm-up before serving, "off" leaves everything to the first request
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
+
+def warm_up():
+    """
+    Builds the Gemini client and the Calendar client pool (credentials, discovery document,
+    one pooled connection) ahead of the first request.
+    """
+    started = time.perf_counter()
+    try:
+        get_llm()
+    except Exception as e:
+        logger.warning("LLM warm-up failed: %r", e)
+    try:
+        with get_client_pool().service():
+            pass
+    except Exception as e:
+        logger.warning("Calendar warm-up failed: %r", e)
+    logger.info("Warm-up finished in %.0fms", (time.perf_counter() - started) * 1000)
+
+@asynccontextmanager
+async def lifespan(app):
+    warmup_task = None
+    if WARMUP_MODE == "blocking":
+        await asyncio.to_thread(warm_up)
+    elif WARMUP_MODE == "background":
+        warmup_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    mirror_task = None
+    if event_mirror.enabled:
+        mirror_task = asyncio.create_task(event_mirror.sync_forever(lambda: [calendar_utils.CALENDAR_ID]))
+    watch_task = None
+    if watch_manager.enabled:
+        watch_task = asyncio.create_task(watch_manager.run_forever(lambda: [calendar_utils.CALENDAR_ID]))
+    jobs_task = asyncio.create_task(job_queue.run_forever())
+    yield
+    jobs_task.cancel()
+    await asyncio.gather(jobs_task, return_exceptions=True)
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if mirror_task is not None:
+        mirror_task.cancel()
+    if watch_task is not None:
+        # Lets the task stop its channels so Google stops posting to this process
+        watch_task.cancel()
+        await asyncio.gather(watch_task, return_exceptions=True)
+
+app = FastAPI(lifespan=lifespan)
+# Added first so it runs inside MetricsMiddleware, and rejected keys are timed too
+app.add_middleware(TenantMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+metrics.register_source("busy_cache", busy_cache.stats)
+metrics.register_source("extraction_cache", extraction_cache.stats)
+metrics.register_source("extraction", extraction_stats.snapshot)
+metrics.register_source("llm_gateway", llm_gateway.stats)
+metrics.register_source("fast_path", fast_path_stats.snapshot)
+metrics.register_source("idempotency", idempotency_store.stats)
+metrics.register_source("calendar_pool", pool_stats)
+metrics.register_source("reservations", lambda: {"active": ledger.active()})
+metrics.register_source("sessions", lambda: {"sessions": len(session_store)})
+metrics.register_source("rate_limiter", rate_limiter.stats)
+metrics.register_source("event_mirror", event_mirror.stats)
+metrics.register_source("webhooks", watch_manager.stats)
+metrics.register_source("jobs", job_queue.stats)
+metrics.register_source("timezones", zone_cache.stats)
+metrics.register_source("tenants", tenant_registry.stats)
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+def to_job_response(job: dict) -> JobResponse:
+    return JobResponse(job_id=job["id"], kind=job["kind"], status=job["status"], result=job["result"],
+                       error=job["error"], created_at=job["created_at"], updated_at=job["updated_at"])
+
+def wants_async(prefer: Optional[str]) -> bool:
+    """
+    True if the client sent "Prefer: respond-async" (RFC 7240) and takes a job id instead of the result.
+    """
+    return bool(prefer) and any(p.strip().lower() == "respond-async" for p in prefer.split(","))
+
+def submit_job(kind: str, payload: dict, key: str) -> JSONResponse:
+    """
+    Enqueues a job for the request and answers 202 with it; a retry of the request gets the same job.
+    The job runs as the request's tenant, and is only batched with jobs of the same tenant.
+    """
+    tenant = current_tenant()
+    calendar_id = calendar_utils.current_calendar_id()
+    if tenant is not None:
+        payload = {**payload, "tenant": tenant.tenant_id}
+        calendar_id = f"{tenant.tenant_id}/{calendar_id}"
+    try:
+        job = job_queue.submit(kind, payload, job_id_for(key, payload), calendar_id)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail={"status": "error", "message": str(e)}, headers={"Retry-After": "1"})
+    return JSONResponse(status_code=202, content=to_job_response(job).model_dump(),
+                        headers={"Location": f"/jobs/{job['id']}", "Preference-Applied": "respond-async"})
+
+def rate_limited_error(error):
+    """
+    503 with Retry-After for a Calendar call that stayed rate limited past its deadline.
+    """
+    logger.warning("Calendar rate limited: %s", error)
+    return HTTPException(status_code=503, detail={"status": "error", "message": str(error)},
+                         headers={"Retry-After": str(math.ceil(error.retry_after or 1))})
+
+# Upper bound on attendee (or extra) calendars in one request
+MAX_ATTENDEES = int(os.getenv("MAX_ATTENDEES", "200"))
+
+TIMEZONE_DESCRIPTION = f"IANA time zone, e.g. Europe/Berlin; {DEFAULT_TIMEZONE} when omitted"
+
+def known_timezone(value: Optional[str]) -> Optional[str]:
+    """
+    Validator for an optional time zone name: unknown names are rejected with a 422.
+    """
+    return resolve_timezone(value) if value else None
+
+# The time zone field of the request models
+KnownTimezone = Annotated[Optional[str], AfterValidator(known_timezone)]
+
+def query_timezone(value: Optional[str]) -> str:
+    """
+    The zone name of a timezone query parameter; unknown names are a 400.
+    """
+    try:
+        return resolve_timezone(value)
+    except UnknownTimezone as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 class BookingRequest(BaseModel):
     summary: str
     start: datetime = Field(..., description="Start time in RFC3339 format")
     end: datetime = Field(..., description="End time in RFC3339 format")
     description: Optional[str] = None
+    attendees: List[str] = Field([], max_length=MAX_ATTENDEES,
+                                 description="Emails whose calendars must also be free for the slot")
+    recurrence: Optional[str] = Field(None, max_length=500,
+                                      description="RRULE making start/end the first of a series, e.g. FREQ=WEEKLY;COUNT=4")
+    timezone: KnownTimezone = Field(None, max_length=64, description=TIMEZONE_DESCRIPTION)
 
     def validate_times(self):
         if self.start >= self.end:
@@ -23,53 +193,474 @@ class BookingRequest(BaseModel):
 # --- New: Chat endpoint ---
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = Field(None, max_length=128, description="Continue this conversation; omit to start one")
+    attendees: List[str] = Field([], max_length=MAX_ATTENDEES,
+                                 description="Emails whose calendars must also be free (added to those in the message)")
+    timezone: KnownTimezone = Field(None, max_length=64,
+                                    description="Time zone of the dates and times in the conversation, kept for "
+                                                "the rest of the session; " + TIMEZONE_DESCRIPTION)
 
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
+
+def chat_key(request: ChatRequest, idempotency_key: Optional[str]) -> str:
+    """
+    Idempotency key of a chat turn, shared by /chat and /chat/stream.
+    """
+    if request.session_id and not idempotency_key:
+        # A follow-up may repeat an earlier message of the session ("book it", "yes") with other
+        # fields pending, so only the client can tell a retry from a new turn: never replayed
+        return request_key("chat", None, {"turn": uuid.uuid4().hex})
+    # Without a client key, the same opening message on the same day (in the request's zone) is
+    # treated as a retry
+    today = today_in(request.timezone).isoformat()
+    payload = {"message": " ".join(request.message.split()), "today": today}
+    if request.attendees:
+        payload["attendees"] = sorted(set(request.attendees))
+    if request.timezone:
+        payload["timezone"] = request.timezone
+    return request_key("chat", idempotency_key, payload)
+
+def keep_chat_response(response: ChatResponse) -> bool:
+    return not is_retryable_reply(response.response)
 
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
-    print("Received /chat request with message:", request.message)
+async def chat_endpoint(request: ChatRequest, idempotency_key: Optional[str] = Header(None),
+                        prefer: Optional[str] = Header(None)):
+    log_payload(logger, "Received /chat request with message: %s", request.message)
+    key = chat_key(request, idempotency_key)
+    if wants_async(prefer):
+        return submit_job("chat", {"request": request.model_dump()}, key)
     try:
-        reply = run_agent_conversation(request.message)
-        print("Agent reply:", reply)
-        return ChatResponse(response=reply)
+        response = await idempotency_store.arun(key, chat_once, request, keep=keep_chat_response)
+        log_payload(logger, "Agent reply: %s", response.response)
+        return response
+    except SessionBusy as e:
+        raise HTTPException(status_code=409, detail={"status": "error", "message": str(e)})
     except Exception as e:
-        traceback.print_exc()
-        print("Error in /chat endpoint:", e)
+        logger.exception("Error in /chat endpoint")
         raise HTTPException(status_code=500, detail=f"Agent error: {e}")
 
+def sse_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    /chat as Server-Sent Events: a 'stage' event as each step finishes ("understood", "checking",
+    then the booking status), then 'done' with the ChatResponse, or 'error'. A retry of a turn that
+    already finished gets only the 'done' event.
+    """
+    log_payload(logger, "Received /chat/stream request with message: %s", request.message)
+    key = chat_key(request, idempotency_key)
+    queue = asyncio.Queue()
+
+    def progress(stage, text):
+        queue.put_nowait(sse_event("stage", {"stage": stage, "text": text}))
+
+    async def run():
+        try:
+            response = await idempotency_store.arun(key, chat_once, request, keep=keep_chat_response,
+                                                    progress=progress)
+            log_payload(logger, "Agent reply: %s", response.response)
+            queue.put_nowait(sse_event("done", response.model_dump()))
+        except Exception as e:
+            logger.exception("Error in /chat/stream endpoint")
+            metrics.record_error("chat_stream")
+            queue.put_nowait(sse_event("error", {"message": f"Agent error: {e}"}))
+        queue.put_nowait(None)
+
+    async def events():
+        # The turn runs as its own task, so a client that disconnects does not cancel a booking halfway
+        task = asyncio.create_task(run())
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+        await task
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def chat_once(request: ChatRequest, progress=None) -> ChatResponse:
+    """
+    Runs one chat turn inside its session: the agent sees the known fields and the new turns only.
+    """
+    tenant = current_tenant()
+    # Turns of one session run one at a time, so each sees the transcript and fields the last one saved
+    async with session_store.turn(request.session_id):
+        session = session_store.get(request.session_id, tenant.tenant_id if tenant is not None else None)
+        if request.timezone:
+            session.timezone = request.timezone
+        session.add_turn("user", request.message)
+        reply = await arun_agent_conversation(request.message, session=session,
+                                              attendees=request.attendees, progress=progress,
+                                              timezone=session.timezone)
+        session.add_turn("assistant", reply)
+        session_store.save(session)
+    return ChatResponse(response=reply, session_id=session.session_id)
+
 class BookingResponse(BaseModel):
     status: str
     event: Optional[Dict[str, Any]] = None
     busy_slots: Optional[List[Any]] = None
     message: Optional[str] = None
+    # Recurring bookings: occurrences checked, and the first busy ones
+    occurrences: Optional[int] = None
+    conflicts: Optional[List[Any]] = None
+
+def zoned_times(request: BookingRequest) -> tuple:
+    """
+    The request's start and end as aware datetimes in its time zone, with the zone name:
+    (start_dt, end_dt, timezone). They are passed to the calendar calls as they are.
+    """
+    timezone = resolve_timezone(request.timezone)
+    zone = get_zone(timezone)
+    return request.start.astimezone(zone), request.end.astimezone(zone), timezone
+
+def job_booking(request: BookingRequest) -> dict:
+    """
+    A booking as stored in a queued job: JSON-safe, with RFC3339 times and the zone name.
+    """
+    start_dt, end_dt, timezone = zoned_times(request)
+    return {"start_time": start_dt.isoformat(), "end_time": end_dt.isoformat(), "timezone": timezone,
+            "summary": request.summary, "description": request.description, "attendees": request.attendees,
+            "recurrence": request.recurrence}
+
+def booking_payload(request: BookingRequest) -> dict:
+    """
+    Normalized booking parameters used to derive an idempotency key when the client sends none.
+    """
+    utc = dt_timezone.utc
+    payload = {"start": request.start.astimezone(utc).isoformat(), "end": request.end.astimezone(utc).isoformat(),
+               "summary": request.summary.strip(), "description": (request.description or "").strip()}
+    # Only present when set, so keys of plain bookings are unchanged
+    if request.attendees:
+        payload["attendees"] = sorted(set(request.attendees))
+    if request.recurrence:
+        payload["recurrence"] = request.recurrence.strip().upper()
+    if request.timezone:
+        payload["timezone"] = request.timezone
+    return payload
 
 @app.post("/book", response_model=BookingResponse)
-async def book_event(request: BookingRequest):
+async def book_event(request: BookingRequest, idempotency_key: Optional[str] = Header(None),
+                     prefer: Optional[str] = Header(None)):
     try:
         request.validate_times()
+        if request.recurrence:
+            normalize_rrule(request.recurrence, get_zone(request.timezone))
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
-    # Convert datetimes to Asia/Kolkata timezone and RFC3339 string
-    ist = pytz.timezone('Asia/Kolkata')
-    start_ist = request.start.astimezone(ist)
-    end_ist = request.end.astimezone(ist)
-    start_str = start_ist.strftime('%Y-%m-%dT%H:%M:%S')
-    end_str = end_ist.strftime('%Y-%m-%dT%H:%M:%S')
-    timezone = 'Asia/Kolkata'
+    key = request_key("book", idempotency_key, booking_payload(request))
+    if wants_async(prefer):
+        return submit_job("book", {"booking": job_booking(request),
+                                   "event_id": event_id_for(key, calendar_utils.current_calendar_id())}, key)
+    return await idempotency_store.arun(key, book_event_once, request, key,
+                                        keep=lambda response: response.status != "contested")
+
+async def book_event_once(request: BookingRequest, key: str) -> BookingResponse:
+    start_dt, end_dt, timezone = zoned_times(request)
     try:
-        # Check availability
-        is_free, busy_info = check_availability(start_str, end_str, timezone)
-        if not is_free:
-            return BookingResponse(status="busy", busy_slots=busy_info, message="Time slot is busy.")
-        # Book the event
-        event = create_event(start_str, end_str, request.summary, request.description, timezone)
+        # Check availability and book under a reservation lease, so concurrent overlapping
+        # requests cannot both pass the check
+        event_id = event_id_for(key, calendar_utils.current_calendar_id())
+        if request.recurrence:
+            result = await abook_recurring_if_free(start_dt, end_dt, request.summary, request.description, timezone,
+                                                   request.recurrence, event_id, request.attendees)
+        else:
+            result = await abook_if_free(start_dt, end_dt, request.summary, request.description, timezone,
+                                         event_id, request.attendees)
+        if result["status"] != "booked":
+            return BookingResponse(**result)
+        event = result["event"]
         if isinstance(event, dict) and event.get("id"):
-            return BookingResponse(status="booked", event=event, message="Event booked successfully.")
+            return BookingResponse(**result)
         else:
             return BookingResponse(status="error", message="Unknown error booking event.")
+    except ValueError as ve:
+        # An invalid recurrence rule
+        raise HTTPException(status_code=400, detail=str(ve))
+    except RateLimitExceeded as e:
+        raise rate_limited_error(e)
+    except EventIdConflict as e:
+        # The Idempotency-Key was used before for a different booking
+        raise HTTPException(status_code=409, detail={"status": "error", "message": str(e)})
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Calendar request failed")
         raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
 
+def job_tenant(payload: dict):
+    """
+    The tenant a queued job was submitted as, or None. Raises UnknownTenant if it is no longer configured.
+    """
+    tenant_id = payload.get("tenant")
+    return tenant_registry.get(tenant_id) if tenant_id else None
+
+async def run_book_jobs(payloads: list) -> list:
+    """
+    Job handler for queued /book requests to one calendar (of one tenant): single bookings are booked
+    together, with one freebusy lookup and batched inserts; each recurring series is booked on its own.
+    """
+    with use_tenant(job_tenant(payloads[0])):
+        results = [None] * len(payloads)
+        single = [i for i, p in enumerate(payloads) if not p["booking"].get("recurrence")]
+        if single:
+            booked = await abook_events_batch([payloads[i]["booking"] for i in single], DEFAULT_TIMEZONE,
+                                              [payloads[i]["event_id"] for i in single])
+            for i, result in zip(single, booked):
+                results[i] = result
+        for i, payload in enumerate(payloads):
+            if results[i] is None:
+                booking = payload["booking"]
+                try:
+                    results[i] = await abook_recurring_if_free(
+                        booking["start_time"], booking["end_time"], booking["summary"], booking["description"],
+                        booking.get("timezone") or DEFAULT_TIMEZONE, booking["recurrence"], payload["event_id"],
+                        booking["attendees"])
+                except ValueError as ve:
+                    results[i] = {"status": "error", "message": str(ve)}
+        return [BookingResponse(**result).model_dump() for result in results]
+
+async def run_chat_job(payload: dict) -> dict:
+    with use_tenant(job_tenant(payload)):
+        response = await chat_once(ChatRequest(**payload["request"]))
+    return response.model_dump()
+
+job_queue.register("book", run_book_jobs, batch=True)
+job_queue.register("chat", run_chat_job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def job_endpoint(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT)):
+    """
+    Status of a queued /chat or /book request; result holds its ChatResponse or BookingResponse once
+    status is 'done'. With wait, answers as soon as the job finishes or after that many seconds.
+    """
+    job = await job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    tenant = current_tenant()
+    if job is not None and job["payload"].get("tenant") != (tenant.tenant_id if tenant is not None else None):
+        # Another tenant's job is as unknown as a missing one
+        job = None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return to_job_response(job)
+
+# Upper bound on bookings accepted in one /book/batch request
+BATCH_MAX_BOOKINGS = int(os.getenv("BATCH_MAX_BOOKINGS", "500"))
+
+class BatchBookingRequest(BaseModel):
+    bookings: List[BookingRequest] = Field(..., min_length=1, max_length=BATCH_MAX_BOOKINGS)
+
+class BatchBookingResponse(BaseModel):
+    results: List[BookingResponse]
+    booked: int
+
+@app.post("/book/batch", response_model=BatchBookingResponse)
+async def book_events_batch_endpoint(request: BatchBookingRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Books many events at once: one freebusy query for the union of their windows, local
+    conflict detection within the batch, and batched inserts. Results are per item, in order.
+    """
+    key = request_key("book/batch", idempotency_key, [booking_payload(b) for b in request.bookings])
+    # Item event ids are deterministic, so retrying a partly failed batch cannot duplicate what was inserted
+    return await idempotency_store.arun(
+        key, book_events_batch_once, request, key,
+        keep=lambda response: all(r.status in ("booked", "busy", "conflict") for r in response.results))
+
+async def book_events_batch_once(request: BatchBookingRequest, key: str) -> BatchBookingResponse:
+    results = [None] * len(request.bookings)
+    valid = []
+    for i, booking in enumerate(request.bookings):
+        try:
+            booking.validate_times()
+        except ValueError as ve:
+            results[i] = BookingResponse(status="error", message=str(ve))
+            continue
+        if booking.recurrence:
+            results[i] = BookingResponse(status="error", message="Recurring bookings must be sent to /book.")
+            continue
+        start_dt, end_dt, timezone = zoned_times(booking)
+        valid.append((i, {"start_time": start_dt, "end_time": end_dt, "timezone": timezone,
+                          "summary": booking.summary, "description": booking.description,
+                          "attendees": booking.attendees}))
+    try:
+        calendar_id = calendar_utils.current_calendar_id()
+        booked = await abook_events_batch([b for _, b in valid], DEFAULT_TIMEZONE,
+                                          [event_id_for(key, calendar_id, i) for i, _ in valid])
+    except RateLimitExceeded as e:
+        raise rate_limited_error(e)
+    except Exception as e:
+        logger.exception("Calendar request failed")
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+    for (i, _), result in zip(valid, booked):
+        results[i] = BookingResponse(**result)
+    return BatchBookingResponse(results=results, booked=sum(r.status == "booked" for r in results))
+
+class SlotSearchRequest(BaseModel):
+    start: datetime = Field(..., description="Start of the search range in RFC3339 format")
+    end: datetime = Field(..., description="End of the search range in RFC3339 format")
+    duration_minutes: int = Field(..., gt=0, description="Length of the wanted slot")
+    working_hours_start: str = Field("09:00", description="Start of the working day (HH:MM in timezone)")
+    working_hours_end: str = Field("18:00", description="End of the working day (HH:MM in timezone)")
+    granularity_minutes: int = Field(15, gt=0, description="Slot starts are aligned to this many minutes")
+    limit: int = Field(5, gt=0, le=100, description="Maximum number of slots to return")
+    include_weekends: bool = False
+    calendars: List[str] = Field([], max_length=MAX_ATTENDEES,
+                                 description="Attendee calendars that must be free too, besides the tenant's calendar")
+    timezone: KnownTimezone = Field(None, max_length=64,
+                                    description="Zone of the working hours and of the returned slots; "
+                                                + TIMEZONE_DESCRIPTION)
+
+class Slot(BaseModel):
+    start: str
+    end: str
+
+class SlotSearchResponse(BaseModel):
+    slots: List[Slot]
+
+@app.post("/slots", response_model=SlotSearchResponse)
+async def slots_endpoint(request: SlotSearchRequest):
+    timezone = resolve_timezone(request.timezone)
+    zone = get_zone(timezone)
+    try:
+        slots = await asearch_free_slots(
+            request.start.astimezone(zone),
+            request.end.astimezone(zone),
+            request.duration_minutes,
+            timezone,
+            work_start=request.working_hours_start,
+            work_end=request.working_hours_end,
+            granularity_minutes=request.granularity_minutes,
+            limit=request.limit,
+            include_weekends=request.include_weekends,
+            calendar_ids=calendars_for(request.calendars),
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except RateLimitExceeded as e:
+        raise rate_limited_error(e)
+    except Exception as e:
+        logger.exception("Calendar request failed")
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+    return SlotSearchResponse(slots=[Slot(**slot) for slot in slots])
+
+class EventsResponse(BaseModel):
+    events: List[Dict[str, Any]]
+
+@app.get("/events", response_model=EventsResponse)
+async def events_endpoint(start: datetime, end: datetime, limit: int = Query(250, gt=0, le=2500),
+                          timezone: Optional[str] = Query(None, max_length=64, description=TIMEZONE_DESCRIPTION)):
+    """
+    Events between start and end (RFC3339), served from the local event mirror while it is fresh.
+    Times without an offset are read in timezone.
+    """
+    timezone = query_timezone(timezone)
+    try:
+        events = await alist_events(start, end, timezone, limit)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except RateLimitExceeded as e:
+        raise rate_limited_error(e)
+    except Exception as e:
+        logger.exception("Calendar request failed")
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+    return EventsResponse(events=events)
+
+def close_in_flight(generator):
+    """
+    Closes a generator stepped on the calendar executor. If the client went away while a step was
+    still running there, the generator cannot be closed yet; it is dropped once that step returns.
+    """
+    try:
+        generator.close()
+    except ValueError:
+        logger.info("Client disconnected while a Calendar step was running")
+
+@app.post("/import/ics")
+async def import_ics_endpoint(request: Request, timezone: str = Query(DEFAULT_TIMEZONE, max_length=64), skip: int = Query(0, ge=0),
+                              check_conflicts: bool = True):
+    """
+    Imports the events of an .ics file sent as the request body. The upload is spooled (to disk past
+    IMPORT_SPOOL_BYTES) and parsed a line at a time; events overlapping busy time already on the
+    calendar are reported instead of imported unless check_conflicts is false. Progress is streamed
+    back as one JSON line per chunk (see backend.ics.import_events); if the last line is not
+    complete, resend the file with skip set to its done.
+    """
+    timezone = query_timezone(timezone)
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+
+    async def progress():
+        # Each chunk's Calendar calls run on the calendar executor, within the tenant's concurrency limit
+        updates = import_events(iter_vevents(iter_lines(spool)), timezone, skip, check_conflicts)
+        try:
+            while True:
+                update = await calendar_utils.run_in_calendar_executor(next, updates, None)
+                if update is None:
+                    break
+                yield json.dumps(update) + "\n"
+        finally:
+            close_in_flight(updates)
+            spool.close()
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+@app.get("/export/ics")
+async def export_ics_endpoint(start: datetime, end: datetime,
+                              timezone: Optional[str] = Query(None, max_length=64, description=TIMEZONE_DESCRIPTION)):
+    """
+    The events between start and end (RFC3339) as an .ics file, streamed one events.list page at a time.
+    Times without an offset are read in timezone.
+    """
+    pages = export_ics(start, end, query_timezone(timezone))
+    try:
+        # The first page is fetched up front so range and Calendar errors still get a status code
+        first = await calendar_utils.run_in_calendar_executor(next, pages)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except RateLimitExceeded as e:
+        raise rate_limited_error(e)
+    except Exception as e:
+        logger.exception("Calendar request failed")
+        raise HTTPException(status_code=500, detail={"status": "error", "message": str(e)})
+
+    async def body():
+        try:
+            yield first
+            while True:
+                page = await calendar_utils.run_in_calendar_executor(next, pages, None)
+                if page is None:
+                    break
+                yield page
+        finally:
+            close_in_flight(pages)
+
+    return StreamingResponse(body(), media_type="text/calendar; charset=utf-8",
+                             headers={"Content-Disposition": 'attachment; filename="calendar.ics"'})
+
+@app.post("/webhooks/calendar", status_code=204)
+async def calendar_webhook(request: Request):
+    """
+    Receives Calendar push notifications (X-Goog-* headers, no body) for the channels registered by
+    watch_manager, and invalidates or resyncs only the calendar that changed.
+    """
+    try:
+        calendar_id = watch_manager.handle(request.headers)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if calendar_id:
+        logger.debug("Change notification for %s", calendar_id)
+        watch_manager.on_change(calendar_id)
+    return Response(status_code=204)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Per-stage latency histograms (p50/p95/p99 in ms), error counts and cache/pool statistics.
+    """
+    return metrics.snapshot()
@@ -0,0 +1,196 @@
+"""
+Low-overhead latency metrics for the request pipeline.
+Each stage (LLM extraction, JSON parsing, datetime composition, freebusy, insert, whole requests)
+is timed with a span that feeds a fixed-bucket histogram, so recording is a bisect and two integer
+increments under a lock, and p50/p95/p99 are read from bucket counts. Caches register their stats()
+as sources, and /metrics returns everything as one JSON snapshot.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import dotenv
+dotenv.load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Bucket upper bounds in seconds, 0.1ms to ~3 minutes, each 20% above the previous one,
+# so a reported percentile is within 20% of the true value
+BUCKETS = tuple(0.0001 * 1.2 ** i for i in range(80))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """
+        Estimates the q-th quantile by interpolating inside the bucket that holds it.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        ms = 1000.0
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.count * ms, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * ms, 3),
+            "p95_ms": round(self.quantile(0.95) * ms, 3),
+            "p99_ms": round(self.quantile(0.99) * ms, 3),
+            "max_ms": round(self.max * ms, 3),
+        }
+
+
+class Span:
+    """
+    Times one stage; an exception escaping the block counts as an error of that stage.
+    """
+
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, error=exc_type is not None)
+        return False
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """
+    Registry of per-stage histograms and of stats sources (caches, pools) read at snapshot time.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._sources = {}
+        self.started = time.time()
+
+    def span(self, stage):
+        """
+        with metrics.span("freebusy"): ...
+        """
+        return Span(self, stage) if self.enabled else _NOOP_SPAN
+
+    def observe(self, stage, seconds, error=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                histogram.errors += 1
+
+    def record_error(self, stage):
+        """
+        Counts a failure that did not raise through a span (e.g. an error reply or a 5xx response).
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.errors += 1
+
+    def register_source(self, name, stats):
+        """
+        Adds a zero-argument callable whose dict result is included in snapshots under name.
+        """
+        with self._lock:
+            self._sources[name] = stats
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())}
+            sources = dict(self._sources)
+        caches = {}
+        for name, stats in sorted(sources.items()):
+            try:
+                caches[name] = stats()
+            except Exception as e:
+                caches[name] = {"error": repr(e)}
+        return {"uptime_s": round(time.time() - self.started, 1), "stages": stages, "sources": caches}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.started = time.time()
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request as stage "request <METHOD> <route>"; exceptions and
+    5xx responses count as errors. Pure ASGI, so it adds no per-request task or body buffering.
+    """
+
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            await self.app(scope, receive, send_with_status)
+            failed = status >= 500
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.registry.observe(f"request {scope['method']} {route}", time.perf_counter() - started, error=failed)
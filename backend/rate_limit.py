@@ -0,0 +1,282 @@
+"""
+Client-side rate limiting and retries for Google Calendar API calls.
+Every call takes a token from a bucket shared by the whole project, from one per calendar and,
+while a tenant is set (see backend.tenants), from one per tenant, so bursts are smoothed out before
+Google starts rejecting them and one tenant's burst does not use up the others' share. Calls
+rejected with 429, a rate-limit 403 or a 5xx are retried with jittered exponential backoff, and a
+Retry-After holds back every caller of that calendar, not just the one that was told. Queueing and
+retries are bounded by a deadline per booking, so a request waits out a burst instead of failing,
+and fails fast once the deadline can no longer be met.
+"""
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import dotenv
+from backend.metrics import metrics
+from backend.tenants import current_tenant
+dotenv.load_dotenv()
+
+# Sustained calls per second and burst size; 0 disables a bucket. The project bucket should be the
+# Calendar API queries-per-minute quota of the Cloud project (see its Quotas page) / 60, split
+# between the processes sharing the project; the default of 9,000 calls a minute is meant to sit
+# just under the quota a new project gets.
+CALENDAR_PROJECT_QPS = float(os.getenv("CALENDAR_PROJECT_QPS", "150"))
+CALENDAR_PROJECT_BURST = int(os.getenv("CALENDAR_PROJECT_BURST", "50"))
+CALENDAR_QPS_PER_CALENDAR = float(os.getenv("CALENDAR_QPS_PER_CALENDAR", "10"))
+CALENDAR_BURST_PER_CALENDAR = int(os.getenv("CALENDAR_BURST_PER_CALENDAR", "20"))
+CALENDAR_MAX_RETRIES = int(os.getenv("CALENDAR_MAX_RETRIES", "5"))
+# Backoff before retry n is uniform in [0, min(max, base * 2^n)] seconds
+CALENDAR_BACKOFF_BASE = float(os.getenv("CALENDAR_BACKOFF_BASE", "0.5"))
+CALENDAR_BACKOFF_MAX = float(os.getenv("CALENDAR_BACKOFF_MAX", "32"))
+# Seconds a booking (or a standalone call) may spend queueing and retrying
+CALENDAR_DEADLINE = float(os.getenv("CALENDAR_DEADLINE", "20"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 403 reasons that mean "slow down"; other 403s (e.g. daily quotaExceeded, forbidden) are final
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+_deadline = contextvars.ContextVar("calendar_deadline", default=None)
+
+
+class RateLimitExceeded(Exception):
+    """
+    A Calendar call could not be made, or retried, before its deadline.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _error_reason(error):
+    try:
+        return json.loads(error.content)["error"]["errors"][0]["reason"]
+    except Exception:
+        return None
+
+
+def is_retryable(error):
+    from googleapiclient.errors import HttpError
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    return status in RETRYABLE_STATUSES or (status == 403 and _error_reason(error) in RATE_LIMIT_REASONS)
+
+
+def retry_after_seconds(error):
+    """
+    The Retry-After of an HttpError in seconds, or None. HTTP-date values are not used by Google.
+    """
+    try:
+        return max(float(error.resp.get("retry-after")), 0.0)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def deadline(seconds=CALENDAR_DEADLINE):
+    """
+    Bounds queueing and retries of every Calendar call made in the block (on this thread or task).
+    A nested scope never extends the deadline of the enclosing one.
+    """
+    value = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        value = min(value, current)
+    token = _deadline.set(value)
+    try:
+        yield value
+    finally:
+        _deadline.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations: a caller takes its tokens at once, possibly into debt,
+    and is told how long to wait before using them, so waiters are served in arrival order.
+    Not thread-safe on its own; RateLimiter serializes access.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost, deadline=None):
+        """
+        Takes cost tokens and returns the seconds until they may be used, or None (taking nothing)
+        if that would be after deadline.
+        """
+        now = self._clock()
+        self._refill(now)
+        wait = max(self._blocked_until - now, 0.0)
+        if self._tokens < cost:
+            wait = max(wait, (cost - self._tokens) / self.rate)
+        if deadline is not None and now + wait > deadline:
+            return None
+        self._tokens -= cost
+        return wait
+
+    def refund(self, cost):
+        self._tokens = min(self.burst, self._tokens + cost)
+
+    def block(self, seconds):
+        """
+        Hands out no tokens for the next seconds (the server sent Retry-After).
+        """
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+class RateLimiter:
+    """
+    Project-wide, per-calendar and per-tenant token buckets, plus the retry policy for Calendar calls.
+    """
+
+    def __init__(self, project_qps=CALENDAR_PROJECT_QPS, project_burst=CALENDAR_PROJECT_BURST,
+                 calendar_qps=CALENDAR_QPS_PER_CALENDAR, calendar_burst=CALENDAR_BURST_PER_CALENDAR,
+                 max_retries=CALENDAR_MAX_RETRIES, backoff_base=CALENDAR_BACKOFF_BASE,
+                 backoff_max=CALENDAR_BACKOFF_MAX, default_deadline=CALENDAR_DEADLINE,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.calendar_qps = calendar_qps
+        self.calendar_burst = calendar_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_deadline = default_deadline
+        self._clock = clock
+        self._sleep = sleep
+        self._project = TokenBucket(project_qps, project_burst, clock) if project_qps > 0 else None
+        self._calendars = {}
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.calls = 0
+        self.delayed = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _buckets(self, calendar_id):
+        buckets = [self._project] if self._project is not None else []
+        if calendar_id is not None and self.calendar_qps > 0:
+            bucket = self._calendars.get(calendar_id)
+            if bucket is None:
+                bucket = self._calendars[calendar_id] = TokenBucket(self.calendar_qps, self.calendar_burst, self._clock)
+            buckets.append(bucket)
+        tenant = current_tenant()
+        if tenant is not None and tenant.qps > 0:
+            bucket = self._tenants.get(tenant.tenant_id)
+            if bucket is None:
+                bucket = self._tenants[tenant.tenant_id] = TokenBucket(tenant.qps, tenant.burst, self._clock)
+            buckets.append(bucket)
+        return buckets
+
+    def current_deadline(self):
+        """
+        The deadline of the enclosing deadline() scope, or default_deadline from now.
+        """
+        current = _deadline.get()
+        return current if current is not None else self._clock() + self.default_deadline
+
+    def acquire(self, calendar_id=None, cost=1, deadline=None):
+        """
+        Blocks until cost calls may be made against calendar_id. Raises RateLimitExceeded, taking
+        nothing, if the wait would run past deadline.
+        """
+        with self._lock:
+            self.calls += 1
+            taken = []
+            wait = 0.0
+            for bucket in self._buckets(calendar_id):
+                bucket_wait = bucket.reserve(cost, deadline)
+                if bucket_wait is None:
+                    for earlier in taken:
+                        earlier.refund(cost)
+                    self.rejected += 1
+                    raise RateLimitExceeded(f"Calendar rate limit: no capacity for {calendar_id} before the deadline")
+                taken.append(bucket)
+                wait = max(wait, bucket_wait)
+            if wait <= 0:
+                return
+            self.delayed += 1
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            self._sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+            metrics.observe("rate_limit_wait", wait)
+
+    def backoff(self, attempt):
+        """
+        Full-jitter exponential backoff: spreads retries of callers that failed together.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def retry_wait(self, error, attempt, calendar_id=None, deadline=None):
+        """
+        Decides whether a failed call is retried. Returns False if it is not retryable or out of
+        attempts; otherwise sleeps the backoff (a Retry-After blocks the buckets instead, if there are
+        any, so the next acquire waits for it) and returns True. Raises RateLimitExceeded if the retry could not
+        start before deadline.
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        retry_after = retry_after_seconds(error)
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        if deadline is not None and self._clock() + delay > deadline:
+            with self._lock:
+                self.rejected += 1
+            raise RateLimitExceeded(f"Calendar call still failing after {attempt + 1} attempts: {error}",
+                                    retry_after=retry_after) from error
+        with self._lock:
+            self.retries += 1
+            buckets = self._buckets(calendar_id) if retry_after is not None else []
+            for bucket in buckets:
+                bucket.block(retry_after)
+        if not buckets:
+            self._sleep(delay)
+        return True
+
+    def call(self, func, calendar_id=None, cost=1):
+        """
+        Returns func() (typically a request's execute), rate limited and retried under the deadline.
+        """
+        call_deadline = self.current_deadline()
+        attempt = 0
+        while True:
+            self.acquire(calendar_id, cost, call_deadline)
+            try:
+                return func()
+            except Exception as e:
+                if not self.retry_wait(e, attempt, calendar_id, call_deadline):
+                    raise
+            attempt += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "calls": self.calls,
+                "delayed": self.delayed,
+                "retries": self.retries,
+                "rejected": self.rejected,
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,109 @@
+"""
+Recurring events.
+A series is described by an RFC 5545 RRULE and expanded lazily with dateutil.rrule, one occurrence
+at a time. Availability of the whole series comes from a single busy list covering every checked
+occurrence (one freebusy query instead of one per instance), swept against the occurrences in one
+linear pass, and the series is created with a single recurring events.insert. Rules without an end
+are checked RECURRENCE_HORIZON_DAYS ahead.
+"""
+
+import os
+import re
+from datetime import datetime
+
+import dotenv
+dotenv.load_dotenv()
+
+# How far ahead occurrences are checked, and at most how many
+RECURRENCE_HORIZON_DAYS = int(os.getenv("RECURRENCE_HORIZON_DAYS", "90"))
+RECURRENCE_MAX_OCCURRENCES = int(os.getenv("RECURRENCE_MAX_OCCURRENCES", "500"))
+# Conflicting occurrences listed in a busy result
+RECURRENCE_MAX_REPORTED = 10
+
+
+def normalize_rrule(rule, zone):
+    """
+    Returns rule ("FREQ=..." or "RRULE:FREQ=...") as the "RRULE:..." line events.insert expects.
+    A floating or date-only UNTIL is read as wall-clock time (end of day for a date) in zone and
+    converted to UTC, as RFC 5545 requires when the start has a time zone.
+    Raises ValueError if it is not a single valid RRULE.
+    """
+    from dateutil import tz
+    from dateutil.rrule import rrulestr
+
+    text = (rule or "").strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+    parts = []
+    try:
+        for part in filter(None, (p.strip() for p in text.split(";"))):
+            key, sep, value = part.partition("=")
+            if not sep:
+                raise ValueError(part)
+            key, value = key.strip().upper(), value.strip().upper()
+            if any(ch.isspace() for ch in value):
+                # A second rule (or anything else) run into this one
+                raise ValueError(part)
+            if key == "UNTIL" and not value.endswith("Z"):
+                until = (datetime.strptime(value, "%Y%m%dT%H%M%S") if "T" in value
+                         else datetime.strptime(value, "%Y%m%d").replace(hour=23, minute=59, second=59))
+                value = until.replace(tzinfo=zone).astimezone(tz.UTC).strftime("%Y%m%dT%H%M%SZ")
+            parts.append(f"{key}={value}")
+        line = "RRULE:" + ";".join(parts)
+        if not any(part.startswith("FREQ=") for part in parts):
+            raise ValueError("FREQ is required")
+        rrulestr(line, dtstart=datetime(2000, 1, 1, tzinfo=zone))
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid recurrence rule {rule!r}: {e}") from None
+    return line
+
+
+def iter_occurrences(rule, start_dt, end_dt, until=None, limit=RECURRENCE_MAX_OCCURRENCES):
+    """
+    Lazily yields (start, end) epoch seconds of each occurrence of the series whose first instance
+    is [start_dt, end_dt), in order, for occurrences starting before until (at most limit of them).
+    Occurrences keep the wall-clock time of start_dt across DST changes. The start itself is always
+    an occurrence, as in RFC 5545, even if the rule would not generate it; it then counts towards
+    the rule's COUNT.
+    """
+    from dateutil.rrule import rrulestr
+
+    rule_count = re.search(r"(?:^|[:;])COUNT=(\d+)", rule)
+    if rule_count:
+        limit = min(limit, int(rule_count.group(1)))
+    duration = end_dt - start_dt
+    count = 0
+    occurrences = iter(rrulestr(rule, dtstart=start_dt))
+    first = next(occurrences, None)
+    if first != start_dt:
+        occurrences = _chain(first, occurrences)
+        first = start_dt
+    occurrence = first
+    while occurrence is not None and count < limit and (until is None or occurrence < until):
+        yield occurrence.timestamp(), (occurrence + duration).timestamp()
+        count += 1
+        occurrence = next(occurrences, None)
+
+
+def _chain(first, rest):
+    if first is not None:
+        yield first
+    yield from rest
+
+
+def find_conflicts(occurrences, busy):
+    """
+    Sweeps occurrences (in start order) against merged busy intervals sorted by start, in one pass;
+    yields (occurrence, overlapping busy intervals) for every occurrence that overlaps any.
+    """
+    i = 0
+    for start, end in occurrences:
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        hits = []
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            hits.append(busy[j])
+            j += 1
+        if hits:
+            yield (start, end), hits
@@ -0,0 +1,176 @@
+"""
+Slot reservation ledger that closes the check-then-create race.
+A booking takes a short-lived lease on its interval before checking availability; overlapping
+requests are rejected locally in O(log n) without any Google call. Committed leases are kept until
+every worker's busy cache has had time to see the new event. The default ledger is in-process;
+set RESERVATION_DB to a SQLite path so several workers on one host share it.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+
+import dotenv
+dotenv.load_dotenv()
+
+# Seconds a lease protects a slot while availability is checked and the event is inserted
+RESERVATION_TTL = float(os.getenv("RESERVATION_TTL", "30"))
+# Seconds a committed booking keeps blocking its slot (covers busy caches filled before it)
+RESERVATION_COMMIT_TTL = float(os.getenv("RESERVATION_COMMIT_TTL", os.getenv("BUSY_CACHE_TTL", "60")))
+RESERVATION_DB = os.getenv("RESERVATION_DB")
+
+
+class ReservationLedger:
+    """
+    In-process ledger. Live leases of one calendar never overlap, so they are kept as sorted,
+    disjoint bisect arrays and an overlap check only has to look at the neighbours of a position.
+    """
+
+    # Expired leases that nothing overlapped are swept every this many reservations
+    SWEEP_EVERY = 256
+
+    def __init__(self, lease_ttl=RESERVATION_TTL, commit_ttl=RESERVATION_COMMIT_TTL, clock=time.time):
+        self.lease_ttl = lease_ttl
+        self.commit_ttl = commit_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # calendar_id -> (starts, ends, lease ids), sorted by start
+        self._calendars = {}
+        # lease_id -> [calendar_id, start, end, expires_at, committed, owner]
+        self._leases = {}
+        self._reserved = 0
+
+    def _remove(self, lease_id):
+        calendar_id, start = self._leases.pop(lease_id)[:2]
+        starts, ends, ids = self._calendars[calendar_id]
+        i = ids.index(lease_id, bisect_left(starts, start))
+        del starts[i], ends[i], ids[i]
+
+    def _sweep(self, now):
+        for lease_id in [k for k, lease in self._leases.items() if lease[3] <= now]:
+            self._remove(lease_id)
+
+    def reserve(self, calendar_id, start, end, owner=None):
+        """
+        Takes a lease on [start, end) (epoch seconds). owner is an optional tag, e.g. the event id
+        the booking will create, that lets a retry recognise its own committed lease.
+        Returns (lease_id, None), or (None, (start, end, owner)) of the live lease it overlaps.
+        """
+        with self._lock:
+            now = self._clock()
+            self._reserved += 1
+            if self._reserved % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+            starts, ends, ids = self._calendars.setdefault(calendar_id, ([], [], []))
+            while True:
+                i = bisect_right(ends, start)
+                if i >= len(starts) or starts[i] >= end:
+                    break
+                lease = self._leases[ids[i]]
+                if lease[3] > now:
+                    return None, (starts[i], ends[i], lease[5])
+                self._remove(ids[i])
+            lease_id = uuid.uuid4().hex
+            starts.insert(i, start)
+            ends.insert(i, end)
+            ids.insert(i, lease_id)
+            self._leases[lease_id] = [calendar_id, start, end, now + self.lease_ttl, False, owner]
+            return lease_id, None
+
+    def commit(self, lease_id):
+        """
+        Marks the lease's booking as created; it keeps blocking the slot for commit_ttl.
+        """
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is not None:
+                lease[3] = self._clock() + self.commit_ttl
+                lease[4] = True
+
+    def release(self, lease_id):
+        """
+        Drops a lease that was not committed (busy slot, failed insert). No-op otherwise.
+        """
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            if lease is not None and not lease[4]:
+                self._remove(lease_id)
+
+    def active(self, calendar_id=None):
+        with self._lock:
+            now = self._clock()
+            return sum(1 for lease in self._leases.values() if lease[3] > now and calendar_id in (None, lease[0]))
+
+
+class SQLiteReservationLedger:
+    """
+    Ledger shared by several worker processes through one SQLite file.
+    Reservations run in BEGIN IMMEDIATE transactions, so they are serialized across processes;
+    expired leases are purged first, which keeps live leases disjoint and lets the overlap check
+    use a single (calendar_id, start) index probe.
+    """
+
+    def __init__(self, path=RESERVATION_DB, lease_ttl=RESERVATION_TTL, commit_ttl=RESERVATION_COMMIT_TTL,
+                 clock=time.time):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.commit_ttl = commit_ttl
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " id TEXT PRIMARY KEY, calendar_id TEXT NOT NULL, start REAL NOT NULL, \"end\" REAL NOT NULL,"
+                " expires_at REAL NOT NULL, committed INTEGER NOT NULL DEFAULT 0, owner TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS leases_calendar_start ON leases (calendar_id, start)")
+            conn.execute("CREATE INDEX IF NOT EXISTS leases_expires ON leases (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, calendar_id, start, end, owner=None):
+        conn = self._connect()
+        now = self._clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            row = conn.execute(
+                "SELECT start, \"end\", owner FROM leases WHERE calendar_id = ? AND start < ? ORDER BY start DESC LIMIT 1",
+                (calendar_id, end)).fetchone()
+            if row is not None and row[1] > start:
+                conn.execute("COMMIT")
+                return None, (row[0], row[1], row[2])
+            lease_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO leases (id, calendar_id, start, \"end\", expires_at, owner)"
+                         " VALUES (?, ?, ?, ?, ?, ?)", (lease_id, calendar_id, start, end, now + self.lease_ttl, owner))
+            conn.execute("COMMIT")
+            return lease_id, None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def commit(self, lease_id):
+        self._connect().execute("UPDATE leases SET committed = 1, expires_at = ? WHERE id = ?",
+                                (self._clock() + self.commit_ttl, lease_id))
+
+    def release(self, lease_id):
+        self._connect().execute("DELETE FROM leases WHERE id = ? AND committed = 0", (lease_id,))
+
+    def active(self, calendar_id=None):
+        query = "SELECT COUNT(*) FROM leases WHERE expires_at > ?"
+        args = [self._clock()]
+        if calendar_id is not None:
+            query += " AND calendar_id = ?"
+            args.append(calendar_id)
+        return self._connect().execute(query, args).fetchone()[0]
+
+
+ledger = SQLiteReservationLedger() if RESERVATION_DB else ReservationLedger()
@@ -0,0 +1,314 @@
+"""
+Server-side chat sessions for multi-turn booking conversations.
+A session keeps a bounded transcript, appended to incrementally rather than rebuilt every turn,
+and the event fields extracted so far, so a follow-up such as "make it 4pm instead" only sends
+the new messages and the known fields to the LLM. The default store is in-process with an LRU
+cap and idle eviction; set SESSION_DB to a SQLite path to share sessions between workers.
+Turns of one session are serialized (see SessionStore.turn), so two concurrent requests cannot
+both read a session and then overwrite each other's transcript and fields.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, nullcontext
+
+import dotenv
+dotenv.load_dotenv()
+
+# Seconds without a turn after which a session is dropped
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Transcript bounds per session; the oldest turns are dropped first
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+SESSION_MAX_TRANSCRIPT_CHARS = int(os.getenv("SESSION_MAX_TRANSCRIPT_CHARS", "8000"))
+SESSION_DB = os.getenv("SESSION_DB")
+# Seconds a turn waits for an earlier turn of the same session before it is rejected
+SESSION_TURN_TIMEOUT = float(os.getenv("SESSION_TURN_TIMEOUT", "30"))
+# Seconds a turn's claim on a shared (SESSION_DB) session lasts, so a worker that died mid-turn
+# does not block the session for good
+SESSION_TURN_LEASE = float(os.getenv("SESSION_TURN_LEASE", "600"))
+
+EVENT_FIELDS = ("summary", "date", "start_time", "end_time", "description", "recurrence")
+
+
+class Session:
+    """
+    One conversation: transcript lines, known event fields and the turns not yet sent to the LLM.
+    """
+
+    def __init__(self, session_id=None, max_turns=SESSION_MAX_TURNS, max_chars=SESSION_MAX_TRANSCRIPT_CHARS,
+                 tenant_id=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        # The tenant the session belongs to; other tenants never get it back
+        self.tenant_id = tenant_id
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.lines = deque()
+        self.transcript = ""
+        self.params = {}
+        # IANA zone the user's dates and times are in; None means DEFAULT_TIMEZONE
+        self.timezone = None
+        # Index into lines of the first turn the LLM has not seen yet
+        self.pending_from = 0
+        self.last_active = time.time()
+
+    def add_turn(self, role, content):
+        line = ("User: " if role == "user" else "Assistant: ") + content
+        self.lines.append(line)
+        self.transcript = f"{self.transcript}\n{line}" if self.transcript else line
+        while len(self.lines) > 1 and (len(self.lines) > self.max_turns or len(self.transcript) > self.max_chars):
+            dropped = self.lines.popleft()
+            self.transcript = self.transcript[len(dropped) + 1:]
+            self.pending_from = max(0, self.pending_from - 1)
+        self.last_active = time.time()
+
+    def delta(self):
+        """
+        Transcript lines added since the last extraction.
+        """
+        return list(self.lines)[self.pending_from:]
+
+    def mark_extracted(self):
+        self.pending_from = len(self.lines)
+
+    def latest_user_message(self):
+        return next((line[len("User: "):] for line in reversed(self.lines) if line.startswith("User: ")), None)
+
+    def update_params(self, extracted):
+        """
+        Merges freshly extracted fields over the known ones; 'MISSING' never overwrites a value.
+        Returns the merged params.
+        """
+        if isinstance(extracted, dict):
+            for key in EVENT_FIELDS:
+                value = extracted.get(key)
+                if value and value != 'MISSING':
+                    self.params[key] = value
+        merged = {key: self.params.get(key, 'MISSING') for key in EVENT_FIELDS}
+        for optional in ('description', 'recurrence'):
+            if merged[optional] == 'MISSING':
+                merged[optional] = ''
+        return merged
+
+    def reset_params(self):
+        """
+        Starts a new booking after one was made; the transcript is kept for context.
+        """
+        self.params = {}
+
+    def to_dict(self):
+        return {"session_id": self.session_id, "lines": list(self.lines), "params": self.params,
+                "timezone": self.timezone, "tenant_id": self.tenant_id, "pending_from": self.pending_from, "last_active": self.last_active}
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        session = cls(data["session_id"], **kwargs)
+        session.lines = deque(data["lines"])
+        session.transcript = "\n".join(session.lines)
+        session.params = data["params"]
+        session.timezone = data.get("timezone")
+        session.tenant_id = data.get("tenant_id")
+        session.pending_from = data["pending_from"]
+        session.last_active = data["last_active"]
+        return session
+
+
+class SessionBusy(Exception):
+    """
+    Raised when a turn cannot start because another turn of the same session is still running.
+    """
+
+
+class TurnLocks:
+    """
+    Per-session asyncio locks serializing the turns of a session in this process. A lock only
+    exists while a turn holds or waits for it.
+    """
+
+    def __init__(self):
+        # session_id -> [lock, turns holding or waiting for it]
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, session_id, timeout):
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise SessionBusy(f"Another turn of session {session_id} is still running.") from None
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[session_id]
+
+
+class SessionStore:
+    """
+    In-process store: LRU-ordered by last use, capped at max_sessions, idle sessions evicted.
+    """
+
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX_SESSIONS, clock=time.time,
+                 turn_timeout=SESSION_TURN_TIMEOUT):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.turn_timeout = turn_timeout
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._turns = TurnLocks()
+
+    def turn(self, session_id):
+        """
+        Async context manager a turn holds from get to save. Turns of the same session run one at a
+        time; one that cannot start within turn_timeout raises SessionBusy. A new session (no id)
+        has nothing to wait for.
+        """
+        return self._turns.hold(session_id, self.turn_timeout) if session_id else nullcontext()
+
+    def _evict(self, now):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_active < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id=None, tenant_id=None):
+        """
+        Returns the session with this id, or a new one (keeping a client-supplied id) if unknown or expired.
+        A session of another tenant is not handed out; the caller gets a new one with a fresh id.
+        """
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                return Session(session_id, tenant_id=tenant_id)
+            if session.tenant_id != tenant_id:
+                return Session(tenant_id=tenant_id)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session):
+        with self._lock:
+            session.last_active = self._clock()
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            self._evict(session.last_active)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """
+    Store shared by several worker processes through one SQLite file. Sessions are stored as JSON;
+    both operations are single indexed statements, cheap enough to run on the request path.
+    """
+
+    # Idle sessions are purged every this many saves
+    PURGE_EVERY = 100
+    # Seconds between attempts to claim a session another worker's turn holds
+    TURN_POLL_INTERVAL = 0.05
+
+    def __init__(self, path=SESSION_DB, idle_ttl=SESSION_IDLE_TTL, clock=time.time,
+                 turn_timeout=SESSION_TURN_TIMEOUT, turn_lease=SESSION_TURN_LEASE):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.turn_timeout = turn_timeout
+        self.turn_lease = turn_lease
+        self._clock = clock
+        self._local = threading.local()
+        self._saves = 0
+        self._turns = TurnLocks()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                         " id TEXT PRIMARY KEY, data TEXT NOT NULL, last_active REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)")
+            conn.execute("CREATE TABLE IF NOT EXISTS session_turns ("
+                         " id TEXT PRIMARY KEY, token TEXT NOT NULL, held_until REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _claim_turn(self, session_id, token):
+        """
+        Takes the session for a turn unless a live claim of another turn (possibly in another
+        worker) holds it. Returns True if taken.
+        """
+        conn = self._connect()
+        now = self._clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT held_until FROM session_turns WHERE id = ?", (session_id,)).fetchone()
+            if row is not None and row[0] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO session_turns (id, token, held_until) VALUES (?, ?, ?)",
+                         (session_id, token, now + self.turn_lease))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @asynccontextmanager
+    async def turn(self, session_id):
+        """
+        As SessionStore.turn, across every worker sharing the file: turns of this process queue on a
+        local lock, then claim the session in the session_turns table.
+        """
+        if not session_id:
+            yield
+            return
+        deadline = time.monotonic() + self.turn_timeout
+        async with self._turns.hold(session_id, self.turn_timeout):
+            token = uuid.uuid4().hex
+            while not self._claim_turn(session_id, token):
+                if time.monotonic() >= deadline:
+                    raise SessionBusy(f"Another turn of session {session_id} is still running.")
+                await asyncio.sleep(self.TURN_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                self._connect().execute("DELETE FROM session_turns WHERE id = ? AND token = ?", (session_id, token))
+
+    def get(self, session_id=None, tenant_id=None):
+        if session_id:
+            row = self._connect().execute("SELECT data FROM sessions WHERE id = ? AND last_active > ?",
+                                          (session_id, self._clock() - self.idle_ttl)).fetchone()
+            if row is not None:
+                session = Session.from_dict(json.loads(row[0]))
+                return session if session.tenant_id == tenant_id else Session(tenant_id=tenant_id)
+        return Session(session_id, tenant_id=tenant_id)
+
+    def save(self, session):
+        session.last_active = self._clock()
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO sessions (id, data, last_active) VALUES (?, ?, ?)",
+                     (session.session_id, json.dumps(session.to_dict()), session.last_active))
+        self._saves += 1
+        if self._saves % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE last_active <= ?", (session.last_active - self.idle_ttl,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+session_store = SQLiteSessionStore() if SESSION_DB else SessionStore()
@@ -0,0 +1,78 @@
+"""
+Free-slot search over a single freebusy window.
+Busy intervals are merged once and then swept linearly alongside the working-hours windows of each day,
+so the cost is O(days + busy intervals + slots returned) regardless of the granularity.
+"""
+
+from datetime import datetime, time as dt_time, timedelta
+
+
+def merge_intervals(intervals):
+    """
+    Sorts (start, end) pairs and merges overlapping or touching ones.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def _working_windows(range_start, range_end, work_start, work_end, include_weekends):
+    """
+    Yields the working-hours windows of each local day in the range as epoch-second pairs.
+    """
+    zone = range_start.tzinfo
+    day = range_start.date()
+    last_day = range_end.date()
+    while day <= last_day:
+        if include_weekends or day.weekday() < 5:
+            midnight = datetime.combine(day, dt_time(0), zone).timestamp()
+            window_start = max(datetime.combine(day, work_start, zone), range_start)
+            window_end = min(datetime.combine(day, work_end, zone), range_end)
+            if window_start < window_end:
+                yield midnight, window_start.timestamp(), window_end.timestamp()
+        day += timedelta(days=1)
+
+
+def find_free_slots(busy, range_start, range_end, duration, work_start=dt_time(9), work_end=dt_time(18),
+                    granularity=timedelta(minutes=15), limit=5, include_weekends=False):
+    """
+    Returns up to limit earliest free (start, end) epoch-second pairs of the given duration.
+
+    Args:
+        busy: (start, end) epoch-second pairs, in any order
+        range_start, range_end: aware datetimes bounding the search (their zone defines "working hours")
+        duration, granularity: timedeltas; slot starts are aligned to granularity from local midnight
+        work_start, work_end: datetime.time bounds of the working day
+    """
+    length = duration.total_seconds()
+    step = granularity.total_seconds()
+    if length <= 0 or step <= 0:
+        raise ValueError("Duration and granularity must be positive.")
+    intervals = merge_intervals(busy)
+    slots = []
+    i = 0
+    for midnight, window_start, window_end in _working_windows(range_start, range_end, work_start, work_end,
+                                                               include_weekends):
+        candidate = window_start
+        while len(slots) < limit:
+            # Align up to the granularity grid of the local day
+            offset = (candidate - midnight) % step
+            if offset:
+                candidate += step - offset
+            if candidate + length > window_end:
+                break
+            while i < len(intervals) and intervals[i][1] <= candidate:
+                i += 1
+            if i < len(intervals) and intervals[i][0] < candidate + length:
+                candidate = intervals[i][1]
+                continue
+            slots.append((candidate, candidate + length))
+            candidate += length
+        if len(slots) >= limit:
+            break
+    return slots
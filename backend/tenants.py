@@ -0,0 +1,346 @@
+"""
+Tenants: the calendars, and the credentials to reach them, that the API serves.
+Without TENANTS_FILE the backend serves the single CALENDAR_ID with SERVICE_ACCOUNT_FILE. With it,
+every request must carry the X-API-Key of a tenant in the file, and the tenant is kept in a context
+variable for the rest of the request (and for the jobs it queues), so calendar calls go to its
+calendar through its own client pool and busy cache, take tokens from its own bucket in the rate
+limiter and hold at most its max_concurrency calendar executor threads. A busy tenant queues behind
+its own limits instead of taking the threads, connections and cache entries everyone shares.
+Idempotency keys, jobs and sessions are kept apart per tenant as well. /metrics reports on every
+tenant, so it takes the operator's OPERATOR_API_KEY instead of a tenant's key.
+Client pools and busy caches are created on a tenant's first call and the least recently used ones
+are dropped beyond TENANT_MAX_POOLS, so idle tenants cost nothing.
+The event mirror and push notification channels follow CALENDAR_ID with the default credentials
+only, so tenant requests never read or write the mirror: their calendars are read through freebusy.
+Nothing announces changes made to a tenant calendar outside this service, so they show up once the
+tenant's busy cache entry is older than TENANT_BUSY_CACHE_TTL.
+
+TENANTS_FILE is JSON, a list of tenants or {"tenants": [...]}:
+    [{"id": "acme", "api_keys": ["..."], "calendar_id": "team@acme.example",
+      "service_account_file": "acme.json", "qps": 5, "burst": 10, "max_concurrency": 4}]
+Only id, api_keys and calendar_id are required.
+"""
+
+import asyncio
+import contextvars
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+import dotenv
+from backend.busy_cache import BusyCache, busy_cache
+from backend.metrics import metrics
+dotenv.load_dotenv()
+
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+# Tenants whose client pool and busy cache are kept; the least recently used beyond this are dropped
+TENANT_MAX_POOLS = int(os.getenv("TENANT_MAX_POOLS", "64"))
+# Defaults for tenants that do not set their own
+TENANT_POOL_SIZE = int(os.getenv("TENANT_POOL_SIZE", "4"))
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "4"))
+# Sustained Calendar calls per second and burst size per tenant; 0 disables the tenant bucket
+TENANT_QPS = float(os.getenv("TENANT_QPS", "10"))
+TENANT_BURST = int(os.getenv("TENANT_BURST", "20"))
+TENANT_CACHE_MAX_CALENDARS = int(os.getenv("TENANT_CACHE_MAX_CALENDARS", "32"))
+# Seconds busy times of tenant calendars are cached; no push notification invalidates them earlier
+TENANT_BUSY_CACHE_TTL = float(os.getenv("TENANT_BUSY_CACHE_TTL", os.getenv("BUSY_CACHE_TTL", "60")))
+# Paths served without an API key: Google's push notifications and the API docs
+TENANT_PUBLIC_PATHS = tuple(p.strip() for p in os.getenv(
+    "TENANT_PUBLIC_PATHS", "/webhooks/calendar,/docs,/openapi.json").split(",") if p.strip())
+# Paths reporting on every tenant, served only with OPERATOR_API_KEY (never with a tenant's key)
+TENANT_OPERATOR_PATHS = tuple(p.strip() for p in os.getenv(
+    "TENANT_OPERATOR_PATHS", "/metrics").split(",") if p.strip())
+OPERATOR_API_KEY = os.getenv("OPERATOR_API_KEY")
+
+API_KEY_HEADER = b"x-api-key"
+
+_current = contextvars.ContextVar("tenant", default=None)
+
+
+class UnknownTenant(LookupError):
+    """
+    A tenant id that is not (or no longer) in the registry.
+    """
+
+
+class Tenant:
+    """
+    One tenant: its calendar, credentials and limits.
+    """
+
+    def __init__(self, tenant_id, calendar_id, api_keys=(), service_account_file=None, qps=TENANT_QPS,
+                 burst=TENANT_BURST, max_concurrency=TENANT_MAX_CONCURRENCY, pool_size=TENANT_POOL_SIZE):
+        if not tenant_id or not calendar_id:
+            raise ValueError("A tenant needs an id and a calendar_id.")
+        self.tenant_id = tenant_id
+        self.calendar_id = calendar_id
+        self.api_keys = tuple(api_keys)
+        self.service_account_file = service_account_file
+        self.qps = qps
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("id"), data.get("calendar_id"), data.get("api_keys", ()),
+                   data.get("service_account_file"), float(data.get("qps", TENANT_QPS)),
+                   int(data.get("burst", TENANT_BURST)), int(data.get("max_concurrency", TENANT_MAX_CONCURRENCY)),
+                   int(data.get("pool_size", TENANT_POOL_SIZE)))
+
+    def __repr__(self):
+        return f"Tenant({self.tenant_id!r}, {self.calendar_id!r})"
+
+
+def current_tenant():
+    """
+    The tenant of the request (or job) being handled, or None when tenants are not configured.
+    """
+    return _current.get()
+
+
+@contextmanager
+def use_tenant(tenant):
+    """
+    Makes tenant the current tenant for the block (on this thread or task).
+    """
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+def default_pool(tenant):
+    from backend.calendar_client import CalendarClientPool, SERVICE_ACCOUNT_FILE
+    return CalendarClientPool(size=tenant.pool_size,
+                              service_account_file=tenant.service_account_file or SERVICE_ACCOUNT_FILE)
+
+
+class TenantState:
+    """
+    The parts of a tenant created on first use and dropped when it goes idle.
+    """
+
+    def __init__(self, pool, cache):
+        self.pool = pool
+        self.busy_cache = cache
+
+
+class TenantRegistry:
+    """
+    Thread-safe map of API key -> Tenant, with an LRU of per-tenant client pools and busy caches and
+    a concurrency limit per tenant. pool_factory(tenant) builds a tenant's CalendarClientPool.
+    """
+
+    def __init__(self, tenants=(), max_pools=TENANT_MAX_POOLS, pool_factory=default_pool,
+                 cache_max_calendars=TENANT_CACHE_MAX_CALENDARS, cache_ttl=TENANT_BUSY_CACHE_TTL):
+        self.max_pools = max_pools
+        self.pool_factory = pool_factory
+        self.cache_max_calendars = cache_max_calendars
+        self.cache_ttl = cache_ttl
+        self._tenants = {}
+        self._by_key = {}
+        self._states = OrderedDict()
+        self._slots = {}
+        self._running = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self.pools_created = 0
+        self.pools_evicted = 0
+        self.rejected = 0
+        for tenant in tenants:
+            self.add(tenant)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("tenants", [])
+        return cls([Tenant.from_dict(entry) for entry in data], **kwargs)
+
+    @property
+    def enabled(self):
+        return bool(self._tenants)
+
+    def add(self, tenant):
+        with self._lock:
+            for key in tenant.api_keys:
+                owner = self._by_key.get(key)
+                if owner is not None and owner.tenant_id != tenant.tenant_id:
+                    raise ValueError(f"API key of tenant {tenant.tenant_id!r} is already used by {owner.tenant_id!r}.")
+            self._tenants[tenant.tenant_id] = tenant
+            for key in tenant.api_keys:
+                self._by_key[key] = tenant
+            # A replaced tenant may have new credentials or limits
+            self._states.pop(tenant.tenant_id, None)
+            self._slots.pop(tenant.tenant_id, None)
+
+    def authenticate(self, api_key):
+        """
+        The tenant an API key belongs to, or None.
+        """
+        tenant = self._by_key.get(api_key) if api_key else None
+        if tenant is None:
+            with self._lock:
+                self.rejected += 1
+        return tenant
+
+    def get(self, tenant_id):
+        """
+        The tenant with this id. Raises UnknownTenant if there is none.
+        """
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            raise UnknownTenant(f"Unknown tenant {tenant_id!r}.")
+        return tenant
+
+    def _state(self, tenant):
+        with self._lock:
+            state = self._states.get(tenant.tenant_id)
+            if state is not None:
+                self._states.move_to_end(tenant.tenant_id)
+                return state
+        # Built outside the lock; a racing first call for the same tenant keeps whichever came first
+        state = TenantState(self.pool_factory(tenant), BusyCache(ttl=self.cache_ttl,
+                                                                 max_calendars=self.cache_max_calendars))
+        with self._lock:
+            existing = self._states.get(tenant.tenant_id)
+            if existing is not None:
+                return existing
+            self._states[tenant.tenant_id] = state
+            self.pools_created += 1
+            while len(self._states) > self.max_pools:
+                # Services checked out of an evicted pool are returned to it and dropped with it
+                self._states.popitem(last=False)
+                self.pools_evicted += 1
+        return state
+
+    def pool(self, tenant):
+        return self._state(tenant).pool
+
+    def busy_cache(self, tenant):
+        return self._state(tenant).busy_cache
+
+    def invalidate_busy(self, calendar_id):
+        """
+        Drops the cached busy times of calendar_id in every tenant's busy cache.
+        """
+        with self._lock:
+            states = list(self._states.values())
+        for state in states:
+            state.busy_cache.invalidate(calendar_id)
+
+    @asynccontextmanager
+    async def limit(self, tenant):
+        """
+        Holds one of the tenant's max_concurrency calendar slots for the block; 0 is unlimited.
+        Must be used on the event loop.
+        """
+        if tenant.max_concurrency <= 0:
+            yield
+            return
+        slots = self._slots.get(tenant.tenant_id)
+        if slots is None:
+            slots = self._slots.setdefault(tenant.tenant_id, asyncio.Semaphore(tenant.max_concurrency))
+        tenant_id = tenant.tenant_id
+        if slots.locked():
+            self._waiting[tenant_id] = self._waiting.get(tenant_id, 0) + 1
+            started = time.monotonic()
+            try:
+                await slots.acquire()
+            finally:
+                self._waiting[tenant_id] -= 1
+            metrics.observe("tenant_queue_wait", time.monotonic() - started)
+        else:
+            await slots.acquire()
+        self._running[tenant_id] = self._running.get(tenant_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._running[tenant_id] -= 1
+            slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tenants": len(self._tenants),
+                "pools": len(self._states),
+                "pools_created": self.pools_created,
+                "pools_evicted": self.pools_evicted,
+                "rejected": self.rejected,
+                "running": {tenant_id: n for tenant_id, n in self._running.items() if n},
+                "waiting": {tenant_id: n for tenant_id, n in self._waiting.items() if n},
+            }
+
+
+def current_pool():
+    """
+    The client pool of the current tenant, or None without one.
+    """
+    tenant = _current.get()
+    return tenant_registry.pool(tenant) if tenant is not None else None
+
+
+def current_busy_cache():
+    """
+    The busy cache of the current tenant, or the process-wide busy_cache without one.
+    """
+    tenant = _current.get()
+    return tenant_registry.busy_cache(tenant) if tenant is not None else busy_cache
+
+
+def current_mirror():
+    """
+    The event mirror, or None for a tenant's request: the mirror is synced (and watched) for
+    CALENDAR_ID with the default credentials, which say nothing about a tenant's calendar.
+    """
+    from backend.event_mirror import event_mirror
+    return event_mirror if _current.get() is None else None
+
+
+class TenantMiddleware:
+    """
+    ASGI middleware resolving the X-API-Key header to the current tenant. While tenants are
+    configured, requests without a known key are answered 401, except on TENANT_PUBLIC_PATHS;
+    TENANT_OPERATOR_PATHS take operator_key instead (and are closed without one).
+    Pure ASGI, so the tenant is set in the context the endpoint (and what it starts) runs in.
+    """
+
+    def __init__(self, app, registry=None, public_paths=TENANT_PUBLIC_PATHS, operator_paths=TENANT_OPERATOR_PATHS,
+                 operator_key=OPERATOR_API_KEY):
+        self.app = app
+        self.registry = registry or tenant_registry
+        self.public_paths = public_paths
+        self.operator_paths = operator_paths
+        self.operator_key = operator_key
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled or scope["path"].startswith(self.public_paths):
+            return await self.app(scope, receive, send)
+        api_key = next((value.decode("latin-1") for name, value in scope["headers"] if name == API_KEY_HEADER), None)
+        if scope["path"].startswith(self.operator_paths):
+            if self.operator_key and api_key and hmac.compare_digest(api_key, self.operator_key):
+                return await self.app(scope, receive, send)
+            return await self._unauthorized(send)
+        tenant = self.registry.authenticate(api_key)
+        if tenant is None:
+            return await self._unauthorized(send)
+        with use_tenant(tenant):
+            await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _unauthorized(send):
+        body = json.dumps({"detail": "Missing or unknown API key."}).encode()
+        await send({"type": "http.response.start", "status": 401,
+                    "headers": [(b"content-type", b"application/json"), (b"www-authenticate", b"ApiKey"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+tenant_registry = TenantRegistry.from_file(TENANTS_FILE) if TENANTS_FILE else TenantRegistry()
@@ -0,0 +1,130 @@
+"""
+Time zones for requests and sessions.
+Each request or chat session carries an IANA zone name (DEFAULT_TIMEZONE unless the client sends
+one). Zone names are resolved once per process and the zone objects shared. Zones whose UTC offset
+has not changed for years and is not scheduled to change, such as Asia/Kolkata, are replaced by a
+precomputed fixed offset, so their conversions need no transition lookups. Strings are parsed once
+at the edges; inside, times travel as aware datetimes.
+"""
+
+import os
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+
+import dotenv
+dotenv.load_dotenv()
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Kolkata")
+# Years back and ahead over which a zone's offset must be constant to be treated as a fixed offset
+FIXED_OFFSET_YEARS_BACK = 10
+FIXED_OFFSET_YEARS_AHEAD = 3
+
+
+class UnknownTimezone(ValueError):
+    """
+    A time zone name that is not in the tz database.
+    """
+
+
+def _fixed_offset(name, zone):
+    """
+    A datetime.timezone standing in for zone if its offset is the same at every month of the sampled
+    years, else None. Sampling is done once, when the zone is resolved.
+    """
+    this_year = date.today().year
+    offsets = {datetime(year, month, 15, 12, tzinfo=zone).utcoffset()
+               for year in range(this_year - FIXED_OFFSET_YEARS_BACK, this_year + FIXED_OFFSET_YEARS_AHEAD + 1)
+               for month in range(1, 13)}
+    if len(offsets) != 1:
+        return None
+    offset = offsets.pop()
+    return timezone.utc if offset == timedelta(0) and name.upper() in ("UTC", "ETC/UTC") else timezone(offset, name)
+
+
+class ZoneCache:
+    """
+    Thread-safe map of zone name -> tzinfo (None for unknown names), filled on first use of a name.
+    """
+
+    def __init__(self):
+        self._zones = {}
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    def find(self, name):
+        """
+        The tzinfo for name, or None if it is not a known zone.
+        """
+        try:
+            return self._zones[name]
+        except KeyError:
+            pass
+        from dateutil import tz
+        zone = tz.gettz(name) if name else None
+        if zone is not None:
+            zone = _fixed_offset(name, zone) or zone
+        with self._lock:
+            self.misses += 1
+            return self._zones.setdefault(name, zone)
+
+    def stats(self):
+        with self._lock:
+            zones = [zone for zone in self._zones.values() if zone is not None]
+        return {"zones": len(zones), "fixed_offset": sum(isinstance(zone, timezone) for zone in zones),
+                "misses": self.misses}
+
+
+zone_cache = ZoneCache()
+
+
+def find_zone(name):
+    return zone_cache.find(name)
+
+
+def get_zone(name=None):
+    """
+    The shared tzinfo for name (DEFAULT_TIMEZONE when None). Raises UnknownTimezone for unknown names.
+    """
+    zone = zone_cache.find(name or DEFAULT_TIMEZONE)
+    if zone is None:
+        raise UnknownTimezone(f"Unknown time zone {name!r}")
+    return zone
+
+
+def resolve_timezone(name=None):
+    """
+    Returns name (DEFAULT_TIMEZONE when empty) after checking it is a known zone.
+    Raises UnknownTimezone otherwise.
+    """
+    name = (name or "").strip() or DEFAULT_TIMEZONE
+    get_zone(name)
+    return name
+
+
+def local_datetime(day, clock, zone):
+    """
+    The aware datetime for a 'YYYY-MM-DD' date and an 'HH:MM' wall-clock time in zone.
+    Raises ValueError if either can't be read.
+    """
+    try:
+        return datetime.combine(date.fromisoformat(day), time.fromisoformat(clock), zone)
+    except ValueError:
+        # Hours without a leading zero ("9:00")
+        return datetime.strptime(f"{day} {clock}", '%Y-%m-%d %H:%M').replace(tzinfo=zone)
+
+
+def wall_clock(dt, zone=None):
+    """
+    'YYYY-MM-DDTHH:MM:SS' wall-clock time of an aware datetime in zone (its own zone when None),
+    the form events.insert takes alongside a timeZone.
+    """
+    if zone is not None:
+        dt = dt.astimezone(zone)
+    return dt.replace(tzinfo=None, microsecond=0).isoformat()
+
+
+def today_in(name=None):
+    """
+    Today's date in the zone, which is what "today" and "tomorrow" mean to its users.
+    """
+    return datetime.now(get_zone(name)).date()
@@ -0,0 +1,202 @@
+"""
+Push notifications from Google Calendar.
+With WEBHOOK_URL set, an events.watch channel is registered for each calendar and renewed before it
+expires, and Google POSTs to /webhooks/calendar whenever that calendar changes. A notification
+invalidates only that calendar's busy cache and marks its event mirror dirty, so reads go live until
+an incremental sync has caught up, which is queued at once. While a calendar's channel is alive the
+mirror stays trusted between changes, so availability data is current without polling.
+Channels belong to the process that registered them; with several workers, share EVENT_MIRROR_DB.
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from urllib.parse import unquote
+
+import dotenv
+from backend.busy_cache import busy_cache
+from backend.event_mirror import event_mirror
+from backend.rate_limit import rate_limiter
+from backend.tenants import tenant_registry
+dotenv.load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Public address of /webhooks/calendar (must be HTTPS for Google); unset disables watch channels
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Secret echoed back in X-Goog-Channel-Token; set it explicitly when several workers share WEBHOOK_URL
+WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN") or secrets.token_urlsafe(24)
+# Requested channel lifetime, and how long before expiry a channel is replaced
+WEBHOOK_CHANNEL_TTL = float(os.getenv("WEBHOOK_CHANNEL_TTL", "604800"))
+WEBHOOK_RENEW_MARGIN = float(os.getenv("WEBHOOK_RENEW_MARGIN", "3600"))
+WEBHOOK_CHECK_INTERVAL = float(os.getenv("WEBHOOK_CHECK_INTERVAL", "60"))
+
+CHANGE_STATES = ("exists", "not_exists")
+
+
+def _calendar_from_uri(uri):
+    """
+    Calendar id from a resource URI such as .../calendars/<id>/events?alt=json.
+    """
+    path = uri.split('?', 1)[0]
+    parts = path.split('/')
+    if 'calendars' in parts:
+        index = parts.index('calendars')
+        if index + 1 < len(parts):
+            return unquote(parts[index + 1])
+    return None
+
+
+class WatchManager:
+    """
+    Registers, renews and stops watch channels, and validates incoming notifications.
+    """
+
+    def __init__(self, address=WEBHOOK_URL, token=WEBHOOK_TOKEN, ttl=WEBHOOK_CHANNEL_TTL,
+                 renew_margin=WEBHOOK_RENEW_MARGIN, clock=time.time):
+        self.address = address
+        self.token = token
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self._clock = clock
+        # channel id -> {"calendar_id", "resource_id", "expiration"}
+        self._channels = {}
+        self._by_calendar = {}
+        self._lock = threading.Lock()
+        self.notifications = 0
+        self.rejected = 0
+        self.renewals = 0
+
+    @property
+    def enabled(self):
+        return bool(self.address)
+
+    def watch(self, calendar_id):
+        """
+        Registers a new channel for calendar_id; returns its id.
+        """
+        from backend.calendar_client import get_client_pool
+
+        channel_id = uuid.uuid4().hex
+        body = {"id": channel_id, "type": "web_hook", "address": self.address, "token": self.token,
+                "params": {"ttl": str(int(self.ttl))}}
+        with get_client_pool().service() as service:
+            response = rate_limiter.call(service.events().watch(calendarId=calendar_id, body=body).execute,
+                                         calendar_id)
+        expiration = int(response["expiration"]) / 1000 if response.get("expiration") else self._clock() + self.ttl
+        with self._lock:
+            self._channels[channel_id] = {"calendar_id": calendar_id, "resource_id": response.get("resourceId"),
+                                          "expiration": expiration}
+            self._by_calendar[calendar_id] = channel_id
+        event_mirror.set_watched(calendar_id, expiration)
+        logger.info("Watching %s on channel %s until %s", calendar_id, channel_id, time.ctime(expiration))
+        return channel_id
+
+    def stop(self, channel_id):
+        from backend.calendar_client import get_client_pool
+
+        with self._lock:
+            channel = self._channels.pop(channel_id, None)
+            if channel is not None and self._by_calendar.get(channel["calendar_id"]) == channel_id:
+                del self._by_calendar[channel["calendar_id"]]
+                event_mirror.set_watched(channel["calendar_id"], None)
+        if channel is None:
+            return
+        with get_client_pool().service() as service:
+            rate_limiter.call(service.channels().stop(
+                body={"id": channel_id, "resourceId": channel["resource_id"]}).execute, channel["calendar_id"])
+
+    def ensure(self, calendar_ids):
+        """
+        Watches every calendar that has no channel, and replaces channels close to expiry. The new
+        channel is registered before the old one is stopped, so no change goes unnoticed.
+        """
+        now = self._clock()
+        for calendar_id in calendar_ids:
+            with self._lock:
+                channel_id = self._by_calendar.get(calendar_id)
+                expiration = self._channels[channel_id]["expiration"] if channel_id else None
+            if expiration is not None and expiration - now > self.renew_margin:
+                continue
+            try:
+                self.watch(calendar_id)
+            except Exception as e:
+                logger.warning("Could not watch %s: %r", calendar_id, e)
+                continue
+            if channel_id is not None:
+                self.renewals += 1
+                try:
+                    self.stop(channel_id)
+                except Exception as e:
+                    logger.info("Could not stop replaced channel %s: %r", channel_id, e)
+
+    def stop_all(self):
+        with self._lock:
+            channel_ids = list(self._channels)
+        for channel_id in channel_ids:
+            try:
+                self.stop(channel_id)
+            except Exception as e:
+                logger.info("Could not stop channel %s: %r", channel_id, e)
+
+    def handle(self, headers):
+        """
+        Validates a notification; returns the changed calendar id, or None for the initial 'sync'
+        message and for channels of other workers whose calendar can't be told from the headers.
+        Raises PermissionError if the channel token does not match.
+        """
+        if not secrets.compare_digest(headers.get("x-goog-channel-token") or "", self.token):
+            with self._lock:
+                self.rejected += 1
+            raise PermissionError("Invalid channel token.")
+        state = headers.get("x-goog-resource-state")
+        with self._lock:
+            self.notifications += 1
+            channel = self._channels.get(headers.get("x-goog-channel-id") or "")
+        if state not in CHANGE_STATES:
+            return None
+        if channel is not None:
+            return channel["calendar_id"]
+        return _calendar_from_uri(headers.get("x-goog-resource-uri") or "")
+
+    def on_change(self, calendar_id):
+        """
+        Applies a change notification: drops cached busy times of that calendar only (in every
+        tenant's busy cache too), and queues an incremental mirror sync. Must be called on the event loop.
+        """
+        busy_cache.invalidate(calendar_id)
+        tenant_registry.invalidate_busy(calendar_id)
+        event_mirror.mark_dirty(calendar_id)
+        if event_mirror.enabled:
+            event_mirror.request_sync(calendar_id)
+
+    async def run_forever(self, calendar_ids, interval=WEBHOOK_CHECK_INTERVAL):
+        """
+        Background task keeping a live channel on every calendar from calendar_ids(); channels are
+        stopped when the task is cancelled at shutdown.
+        """
+        try:
+            while True:
+                await asyncio.to_thread(self.ensure, calendar_ids())
+                await asyncio.sleep(interval)
+        finally:
+            await asyncio.shield(asyncio.to_thread(self.stop_all))
+
+    def stats(self):
+        with self._lock:
+            now = self._clock()
+            return {
+                "enabled": self.enabled,
+                "channels": len(self._channels),
+                "min_ttl_s": round(min((c["expiration"] for c in self._channels.values()), default=now) - now, 1),
+                "notifications": self.notifications,
+                "rejected": self.rejected,
+                "renewals": self.renewals,
+            }
+
+
+watch_manager = WatchManager()
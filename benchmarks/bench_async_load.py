@@ -0,0 +1,108 @@
+"""
+Load test for the async /chat and /book paths with mocked backends.
+The app runs in-process behind httpx's ASGI transport, Gemini is replaced by StubLLM and the Calendar
+API by the local fake server, each with injected latency. Starlette's threadpool is deliberately kept
+small to show that throughput follows the number of concurrent clients, not the threadpool size.
+
+Usage:  python -m benchmarks.bench_async_load --requests 200 --concurrency 1 8 32 64
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+
+async def run_load(client, path, payloads, concurrency):
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            payload = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return len(latencies) / (time.perf_counter() - started), sorted(latencies)
+
+
+def booking_payloads(count, day_offset):
+    payloads = []
+    for n in range(count):
+        day = 1 + day_offset + n // 8
+        hour = 9 + n % 8
+        payloads.append({
+            "summary": f"Bench booking {n}",
+            "start": f"2031-{1 + day // 28:02d}-{1 + day % 28:02d}T{hour:02d}:00:00+05:30",
+            "end": f"2031-{1 + day // 28:02d}-{1 + day % 28:02d}T{hour:02d}:30:00+05:30",
+        })
+    return payloads
+
+
+async def main_async(args):
+    import anyio.to_thread
+    import httpx
+    from google.auth.credentials import AnonymousCredentials
+
+    from benchmarks.fake_calendar import FakeCalendarServer
+    from benchmarks.fake_gemini import StubLLM
+    from backend import calendar_client, calendar_utils
+    from agent import booking_agent
+    from backend.main import app
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threadpool_size
+    booking_agent.set_llm(StubLLM(latency=args.llm_latency))
+    calendar_utils.CALENDAR_ID = 'bench@example.com'
+
+    with FakeCalendarServer(latency=args.calendar_latency) as server:
+        calendar_client.set_client_pool(calendar_client.CalendarClientPool(
+            credentials=AnonymousCredentials(), api_root=server.url, size=calendar_utils.CALENDAR_MAX_WORKERS))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            print(f"threadpool={args.threadpool_size}  llm latency={args.llm_latency * 1000:.0f}ms  "
+                  f"calendar latency={args.calendar_latency * 1000:.0f}ms")
+            for path in ("/chat", "/book"):
+                for i, concurrency in enumerate(args.concurrency):
+                    if path == "/chat":
+                        payloads = [{"message": f"Book load test meeting {i}-{n}"} for n in range(args.requests)]
+                    else:
+                        payloads = booking_payloads(args.requests, i * (args.requests // 8 + 1))
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        throughput, latencies = await run_load(client, path, payloads, concurrency)
+                    p50 = latencies[len(latencies) // 2] * 1000
+                    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+                    print(f"{path:<6} concurrency={concurrency:<4} throughput={throughput:8.1f} req/s  "
+                          f"p50={p50:7.1f}ms  p95={p95:7.1f}ms")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=200)
+    arg_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    arg_parser.add_argument('--llm-latency', type=float, default=0.3)
+    arg_parser.add_argument('--calendar-latency', type=float, default=0.02)
+    arg_parser.add_argument('--threadpool-size', type=int, default=4)
+    arg_parser.add_argument('--llm-concurrency', type=int, default=64)
+    arg_parser.add_argument('--calendar-workers', type=int, default=32)
+    args = arg_parser.parse_args()
+    # Limits are read at import time, so set them before the app is imported
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # The fake server has no quota; measure the request path, not the client-side limiter
+    os.environ.setdefault("CALENDAR_QPS_PER_CALENDAR", "0")
+    os.environ.setdefault("CALENDAR_PROJECT_QPS", "0")
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    os.environ["CALENDAR_MAX_WORKERS"] = str(args.calendar_workers)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Bulk booking throughput: looping over /book vs. a single /book/batch request.
+Runs the app in-process against the local fake Calendar server (with injected latency) and
+reports events per second and the number of Calendar API requests each approach needed.
+
+Usage:  python -m benchmarks.bench_batch_booking --events 200 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+
+def bookings(count, year):
+    items = []
+    for n in range(count):
+        day = n // 16
+        minute = 9 * 60 + (n % 16) * 30
+        date = f"{year}-{1 + day // 28:02d}-{1 + day % 28:02d}"
+        items.append({
+            "summary": f"Bulk event {n}",
+            "start": f"{date}T{minute // 60:02d}:{minute % 60:02d}:00+05:30",
+            "end": f"{date}T{minute // 60:02d}:{minute % 60 + 25:02d}:00+05:30",
+        })
+    return items
+
+
+async def main_async(args):
+    import httpx
+    from google.auth.credentials import AnonymousCredentials
+
+    from benchmarks.fake_calendar import FakeCalendarServer
+    from backend import calendar_client, calendar_utils
+    from backend.main import app
+
+    calendar_utils.CALENDAR_ID = 'bench@example.com'
+    with FakeCalendarServer(latency=args.latency) as server:
+        calendar_client.set_client_pool(calendar_client.CalendarClientPool(
+            credentials=AnonymousCredentials(), api_root=server.url))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                statuses = []
+                for item in bookings(args.events, 2032):
+                    response = await client.post("/book", json=item)
+                    statuses.append(response.json()["status"])
+                loop_elapsed = time.perf_counter() - started
+            loop_requests = dict(server.state.request_counts)
+            server.state.request_counts.clear()
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                response = await client.post("/book/batch", json={"bookings": bookings(args.events, 2033)})
+                batch_elapsed = time.perf_counter() - started
+            batch_booked = response.json()["booked"]
+            batch_requests = dict(server.state.request_counts)
+
+    print(f"{args.events} events, fake Calendar latency {args.latency * 1000:.0f}ms")
+    print(f"/book loop   {args.events / loop_elapsed:8.1f} events/s  booked={statuses.count('booked')}  "
+          f"server requests={loop_requests}")
+    print(f"/book/batch  {args.events / batch_elapsed:8.1f} events/s  booked={batch_booked}  "
+          f"server requests={batch_requests}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--events', type=int, default=200)
+    arg_parser.add_argument('--latency', type=float, default=0.02)
+    args = arg_parser.parse_args()
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # The fake server has no quota; measure the request path, not the client-side limiter
+    os.environ.setdefault("CALENDAR_QPS_PER_CALENDAR", "0")
+    os.environ.setdefault("CALENDAR_PROJECT_QPS", "0")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Per-call overhead of the Calendar client: rebuilding it on every call vs. the pooled client.
+Both variants run check_availability-style freebusy queries against a local fake Calendar server
+using a throwaway service account whose token endpoint points at the fake server.
+
+Usage:  python -m benchmarks.bench_client_pool --calls 200
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.fake_calendar import FakeCalendarServer
+
+CALENDAR = 'bench@example.com'
+
+
+def write_fake_service_account(directory, token_uri):
+    """
+    Writes a service account JSON with a freshly generated RSA key; returns its path.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+    info = {
+        "type": "service_account",
+        "project_id": "bench",
+        "private_key_id": "bench",
+        "private_key": pem,
+        "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": token_uri,
+    }
+    path = os.path.join(directory, 'service_account.json')
+    with open(path, 'w') as f:
+        json.dump(info, f)
+    return path
+
+
+def freebusy_body(i):
+    hour = 9 + i % 8
+    return {
+        "timeMin": f"2025-07-10T{hour:02d}:00:00+05:30",
+        "timeMax": f"2025-07-10T{hour:02d}:30:00+05:30",
+        "timeZone": "Asia/Kolkata",
+        "items": [{"id": CALENDAR}],
+    }
+
+
+def legacy_call(service_account_file, api_root, i):
+    """
+    What get_calendar_service() used to do on every call: read the key file, mint credentials,
+    build the client from the discovery document with a new transport.
+    """
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    credentials = service_account.Credentials.from_service_account_file(
+        service_account_file, scopes=['https://www.googleapis.com/auth/calendar'])
+    service = build('calendar', 'v3', credentials=credentials, static_discovery=True,
+                    client_options={"api_endpoint": api_root + 'calendar/v3/'})
+    return service.freebusy().query(body=freebusy_body(i)).execute()
+
+
+def pooled_call(pool, i):
+    with pool.service() as service:
+        return service.freebusy().query(body=freebusy_body(i)).execute()
+
+
+def measure(fn, calls):
+    timings = []
+    for i in range(calls):
+        started = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name, timings, requests):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<8} mean={statistics.mean(timings):7.2f}ms  p50={statistics.median(timings):7.2f}ms  "
+          f"p95={p95:7.2f}ms  server requests={requests}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--calls', type=int, default=200)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="Fake server latency per request (seconds)")
+    args = arg_parser.parse_args()
+
+    from backend.calendar_client import CalendarClientPool
+
+    with FakeCalendarServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        key_file = write_fake_service_account(tmp, server.url + 'token')
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = measure(lambda i: legacy_call(key_file, server.url, i), args.calls)
+        legacy_requests = dict(server.state.request_counts)
+        server.state.request_counts.clear()
+
+        pool = CalendarClientPool(service_account_file=key_file, api_root=server.url, size=4)
+        pooled = measure(lambda i: pooled_call(pool, i), args.calls)
+        pooled_requests = dict(server.state.request_counts)
+
+    print(f"{args.calls} freebusy calls, fake server latency {args.latency * 1000:.0f}ms")
+    report("before", legacy, legacy_requests)
+    report("after", pooled, pooled_requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Share of messages the deterministic fast path handles without Gemini, and its per-message cost.
+
+Usage:  python -m benchmarks.bench_fast_parser --corpus benchmarks/corpus/chat_messages.jsonl
+"""
+
+import argparse
+import json
+import time
+
+DEFAULT_CORPUS = 'benchmarks/corpus/chat_messages.jsonl'
+
+
+def load_messages(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line)["message"] for line in f if line.strip()]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    arg_parser.add_argument('--repeat', type=int, default=200, help="Timing repetitions over the corpus")
+    arg_parser.add_argument('--verbose', action='store_true', help="Print every message and its result")
+    args = arg_parser.parse_args()
+
+    from agent.fast_parser import FAST_PATH_MIN_CONFIDENCE, parse_booking_message
+
+    messages = load_messages(args.corpus)
+    handled = 0
+    for message in messages:
+        params, confidence = parse_booking_message(message)
+        ok = params is not None and confidence >= FAST_PATH_MIN_CONFIDENCE
+        handled += ok
+        if args.verbose:
+            print(f"{'FAST' if ok else 'LLM ':<4} {confidence:.2f}  {message!r} -> {params}")
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for message in messages:
+            parse_booking_message(message)
+    per_message = (time.perf_counter() - started) / (args.repeat * len(messages)) * 1e6
+
+    print(f"{len(messages)} messages: {handled} handled by the fast path ({handled / len(messages):.0%}), "
+          f"{len(messages) - handled} sent to Gemini")
+    print(f"fast path cost: {per_message:.1f}us per message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Latency and load on the LLM with and without the gateway, against StubLLM with a long-tailed
+latency distribution (lognormal around --latency, plus a --slow-rate share of --slow-latency calls).
+
+Runs the same workload three ways: a bare semaphore around the model (the old request path), the
+gateway without hedging, and the gateway with hedging. A --duplicates share of the requests repeats
+a prompt another request may have in flight, which the gateway coalesces. With --max-concurrency
+below the client concurrency and a short --queue-deadline, calls are rejected instead of queueing.
+
+Usage:  python -m benchmarks.bench_llm_gateway --requests 2000 --concurrency 24
+        python -m benchmarks.bench_llm_gateway --concurrency 128 --max-concurrency 8 --queue-deadline 0.5
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def build_prompts(count, duplicates, seed):
+    rng = random.Random(seed)
+    prompts = []
+    for n in range(count):
+        if prompts and rng.random() < duplicates:
+            # A prompt from the last few requests, likely still in flight
+            prompts.append(prompts[-rng.randint(1, min(len(prompts), 8))])
+        else:
+            prompts.append([f"Book meeting {n}"])
+    return prompts
+
+
+async def run(call, prompts, concurrency):
+    queue = asyncio.Queue()
+    for prompt in prompts:
+        queue.put_nowait(prompt)
+    latencies = []
+    failures = {}
+
+    async def worker():
+        while not queue.empty():
+            prompt = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                await call(prompt)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies), failures
+
+
+def report(name, elapsed, latencies, failures, model_calls, stats=None):
+    print(f"{name:<16} ok={len(latencies):<6} {len(latencies) / elapsed:7.1f} req/s  "
+          f"p50={percentile(latencies, 0.50) * 1000:7.1f}ms  p95={percentile(latencies, 0.95) * 1000:7.1f}ms  "
+          f"p99={percentile(latencies, 0.99) * 1000:7.1f}ms  max={(latencies[-1] if latencies else 0) * 1000:7.1f}ms  "
+          f"model calls={model_calls}")
+    extra = []
+    if stats:
+        extra.append(f"coalesced={stats['coalesced']}  hedged={stats['hedged']}  hedge wins={stats['hedge_wins']}  "
+                     f"rejected={stats['rejected']}  timeouts={stats['timeouts']}  max waiting={stats['max_waiting']}")
+    if failures:
+        extra.append("failed: " + ", ".join(f"{name} {n}" for name, n in sorted(failures.items())))
+    for line in extra:
+        print(" " * 17 + line)
+
+
+async def main_async(args):
+    from agent.llm_gateway import LLMGateway
+    from benchmarks.fake_gemini import StubLLM
+
+    prompts = build_prompts(args.requests, args.duplicates, args.seed)
+
+    def stub():
+        return StubLLM(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                       slow_latency=args.slow_latency, seed=args.seed)
+
+    print(f"{args.requests} requests  concurrency={args.concurrency}  max in flight={args.max_concurrency}  "
+          f"latency={args.latency * 1000:.0f}ms (sigma {args.jitter})  slow={args.slow_rate:.0%} at "
+          f"{args.slow_latency * 1000:.0f}ms  duplicates={args.duplicates:.0%}")
+
+    model = stub()
+    slots = asyncio.Semaphore(args.max_concurrency)
+
+    async def bare(prompt):
+        async with slots:
+            return await model.ainvoke(prompt)
+
+    report("semaphore", *await run(bare, prompts, args.concurrency), model.calls)
+
+    for name, hedge in (("gateway", False), ("gateway+hedge", True)):
+        model = stub()
+        gateway = LLMGateway(max_concurrency=args.max_concurrency, max_queued=args.max_queued,
+                             queue_deadline=args.queue_deadline, timeout=args.timeout, hedge=hedge,
+                             hedge_after=args.hedge_after, hedge_budget=args.hedge_budget)
+        result = await run(lambda prompt: gateway.ainvoke(model, prompt), prompts, args.concurrency)
+        report(name, *result, model.calls, gateway.stats())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=2000)
+    arg_parser.add_argument('--concurrency', type=int, default=24, help="Concurrent callers")
+    arg_parser.add_argument('--max-concurrency', type=int, default=32, help="LLM calls in flight at once")
+    arg_parser.add_argument('--max-queued', type=int, default=256)
+    arg_parser.add_argument('--queue-deadline', type=float, default=10)
+    arg_parser.add_argument('--timeout', type=float, default=30)
+    arg_parser.add_argument('--hedge-after', type=float, default=0, help="Fixed hedge delay; 0 uses the observed p95")
+    arg_parser.add_argument('--hedge-budget', type=float, default=0.1)
+    arg_parser.add_argument('--latency', type=float, default=0.3, help="Median stub latency in seconds")
+    arg_parser.add_argument('--jitter', type=float, default=0.3, help="Sigma of the lognormal latency")
+    arg_parser.add_argument('--slow-rate', type=float, default=0.03, help="Share of calls that take --slow-latency")
+    arg_parser.add_argument('--slow-latency', type=float, default=3.0)
+    arg_parser.add_argument('--duplicates', type=float, default=0.1, help="Share of requests repeating a recent prompt")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Cold-start benchmark: backend import time and first-request latency in fresh interpreters.
+Each run starts a new Python process that imports backend.main, then sends a first /chat request
+(a fast-path message, so no Gemini call) and a first /slots request against the local fake Calendar
+server, followed by a second request of each to show the warm cost.
+
+Usage:  python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def child():
+    """
+    Runs inside the fresh interpreter and prints one JSON line of timings (milliseconds).
+    """
+    timings = {}
+    started = time.perf_counter()
+    import backend.main
+    timings["import"] = (time.perf_counter() - started) * 1000
+
+    import asyncio
+    import contextlib
+    import io
+    import httpx
+    from google.auth.credentials import AnonymousCredentials
+    from backend import calendar_client, calendar_utils
+    from benchmarks.fake_calendar import FakeCalendarServer
+
+    chat = {"message": "Book team sync 2031-03-10 15:00-16:00"}
+    slots = {"start": "2031-03-11T00:00:00+05:30", "end": "2031-03-14T00:00:00+05:30", "duration_minutes": 30}
+
+    async def requests():
+        transport = httpx.ASGITransport(app=backend.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, path, payload in (("chat", "/chat", chat), ("slots", "/slots", slots)):
+                for attempt in ("first", "second"):
+                    t = time.perf_counter()
+                    response = await client.post(path, json=payload)
+                    response.raise_for_status()
+                    timings[f"{attempt}_{name}"] = (time.perf_counter() - t) * 1000
+
+    with FakeCalendarServer() as server:
+        calendar_utils.CALENDAR_ID = 'bench@example.com'
+        calendar_client.set_client_pool(calendar_client.CalendarClientPool(
+            credentials=AnonymousCredentials(), api_root=server.url))
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(requests())
+    print(json.dumps(timings))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--runs', type=int, default=5)
+    arg_parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.child:
+        return child()
+
+    env = dict(os.environ, WARMUP_MODE="off")
+    env.setdefault("GEMINI_API_KEY", "bench")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child"], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process"] = (time.perf_counter() - started) * 1000
+        runs.append(result)
+
+    print(f"{args.runs} fresh processes (median ms):")
+    for key in ("import", "first_chat", "second_chat", "first_slots", "second_slots", "process"):
+        print(f"  {key:<13} {statistics.median(r[key] for r in runs):8.1f}")
+
+
+if __name__ == "__main__":
+    main()
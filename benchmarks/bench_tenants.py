@@ -0,0 +1,139 @@
+"""
+Latency per tenant when one tenant floods /book, against the local fake Calendar server.
+One heavy tenant keeps --heavy-clients bookings in flight while every other tenant has
+--light-clients, for --duration seconds, each tenant booking on its own calendar with its own key.
+
+Runs twice: "shared" gives the tenants no limits of their own and one client pool between them
+(the single-tenant setup with routing added), so the heavy tenant's calls fill the calendar
+executor and everyone queues behind them; "isolated" gives each tenant its own pool and
+--tenant-concurrency executor slots (and --tenant-qps, if set), so only the heavy tenant waits.
+
+Usage:  python -m benchmarks.bench_tenants --tenants 16 --heavy-clients 64 --duration 5
+        python -m benchmarks.bench_tenants --per-tenant --tenant-qps 20
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def booking(n):
+    day, hour = n // 8, n % 8
+    date = f"2032-{1 + day // 28 % 12:02d}-{1 + day % 28:02d}"
+    return {"summary": f"Tenant booking {n}", "start": f"{date}T{9 + hour:02d}:00:00+00:00",
+            "end": f"{date}T{9 + hour:02d}:30:00+00:00"}
+
+
+async def run_tenants(client, api_keys, clients, duration):
+    """
+    Closed-loop load: clients[i] concurrent bookers for tenant i until duration is up.
+    Returns (seconds until the last booking finished, latencies per tenant, failures per tenant).
+    """
+    latencies = [[] for _ in api_keys]
+    failures = [0] * len(api_keys)
+    counters = [0] * len(api_keys)
+    started = time.perf_counter()
+    stop_at = started + duration
+
+    async def booker(i):
+        while time.perf_counter() < stop_at:
+            n = counters[i]
+            counters[i] += 1
+            sent = time.perf_counter()
+            response = await client.post("/book", json=booking(n), headers={"X-API-Key": api_keys[i]})
+            if response.status_code == 200 and response.json()["status"] == "booked":
+                latencies[i].append(time.perf_counter() - sent)
+            else:
+                failures[i] += 1
+
+    await asyncio.gather(*(booker(i) for i, count in enumerate(clients) for _ in range(count)))
+    return time.perf_counter() - started, [sorted(values) for values in latencies], failures
+
+
+def report(mode, elapsed, latencies, failures, per_tenant):
+    light = [values for values in latencies[1:] if values]
+    light_all = sorted(value for values in light for value in values)
+    light_p95 = sorted(percentile(values, 0.95) for values in light)
+    heavy = latencies[0]
+    print(f"{mode:<9} heavy: {len(heavy) / elapsed:6.1f} req/s  p50={percentile(heavy, 0.5) * 1000:7.1f}ms  "
+          f"p95={percentile(heavy, 0.95) * 1000:7.1f}ms   "
+          f"light: {len(light_all) / elapsed:6.1f} req/s  p50={percentile(light_all, 0.5) * 1000:7.1f}ms  "
+          f"p95={percentile(light_all, 0.95) * 1000:7.1f}ms  worst tenant p95="
+          f"{(light_p95[-1] if light_p95 else 0) * 1000:7.1f}ms  failed={sum(failures)}")
+    if per_tenant:
+        for i, values in enumerate(latencies):
+            print(f"{'':<9} tenant {i:02d}{' (heavy)' if i == 0 else '        '}  ok={len(values):<5} "
+                  f"p50={percentile(values, 0.5) * 1000:7.1f}ms  p95={percentile(values, 0.95) * 1000:7.1f}ms  "
+                  f"failed={failures[i]}")
+
+
+async def main_async(args):
+    import httpx
+    from google.auth.credentials import AnonymousCredentials
+
+    from benchmarks.fake_calendar import FakeCalendarServer
+    from benchmarks.replay import serve_app
+    from backend import calendar_client, calendar_utils
+    from backend.calendar_client import CalendarClientPool
+    from backend.tenants import Tenant, tenant_registry
+    from backend.main import app
+
+    clients = [args.heavy_clients] + [args.light_clients] * (args.tenants - 1)
+    print(f"{args.tenants} tenants  heavy clients={args.heavy_clients}  light clients={args.light_clients} each  "
+          f"calendar workers={calendar_utils.CALENDAR_MAX_WORKERS}  calendar latency={args.calendar_latency * 1000:.0f}ms")
+    with FakeCalendarServer(latency=args.calendar_latency) as server:
+        calendar_client.set_client_pool(CalendarClientPool(
+            credentials=AnonymousCredentials(), api_root=server.url, size=calendar_utils.CALENDAR_MAX_WORKERS))
+        for mode in ("shared", "isolated"):
+            if mode == "shared":
+                shared = CalendarClientPool(credentials=AnonymousCredentials(), api_root=server.url,
+                                            size=calendar_utils.CALENDAR_MAX_WORKERS)
+                tenant_registry.pool_factory = lambda tenant: shared
+                limits = {"max_concurrency": 0, "qps": 0}
+            else:
+                tenant_registry.pool_factory = lambda tenant: CalendarClientPool(
+                    credentials=AnonymousCredentials(), api_root=server.url, size=tenant.pool_size)
+                limits = {"max_concurrency": args.tenant_concurrency, "qps": args.tenant_qps,
+                          "pool_size": args.tenant_concurrency}
+            api_keys = []
+            for i in range(args.tenants):
+                api_keys.append(f"{mode}-key-{i}")
+                tenant_registry.add(Tenant(f"{mode}-{i:02d}", f"{mode}-{i:02d}@bench.example.com", [api_keys[-1]],
+                                           burst=max(1, int(args.tenant_qps)), **limits))
+            async with serve_app(app, False) as kwargs:
+                async with httpx.AsyncClient(**kwargs, timeout=120) as client:
+                    result = await run_tenants(client, api_keys, clients, args.duration)
+            report(mode, *result, args.per_tenant)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--tenants', type=int, default=16)
+    arg_parser.add_argument('--heavy-clients', type=int, default=64, help="Concurrent bookings of the heavy tenant")
+    arg_parser.add_argument('--light-clients', type=int, default=1, help="Concurrent bookings of every other tenant")
+    arg_parser.add_argument('--duration', type=float, default=5, help="Seconds each run lasts")
+    arg_parser.add_argument('--calendar-latency', type=float, default=0.02)
+    arg_parser.add_argument('--calendar-workers', type=int, default=16)
+    arg_parser.add_argument('--tenant-concurrency', type=int, default=4, help="Executor slots per tenant when isolated")
+    arg_parser.add_argument('--tenant-qps', type=float, default=0, help="Calendar calls per second per tenant "
+                                                                        "when isolated; 0 leaves it unlimited")
+    arg_parser.add_argument('--per-tenant', action='store_true', help="Print every tenant's latencies")
+    args = arg_parser.parse_args()
+    # Limits are read at import time, so set them before the app is imported
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("WARMUP_MODE", "off")
+    # The fake server has no quota; only the tenant limits under test apply
+    os.environ.setdefault("CALENDAR_QPS_PER_CALENDAR", "0")
+    os.environ.setdefault("CALENDAR_PROJECT_QPS", "0")
+    os.environ["CALENDAR_MAX_WORKERS"] = str(args.calendar_workers)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Cost of composing a booking's times, from the extracted date and HH:MM fields to the busy window
+and the events.insert body, before and after zones were cached and datetimes kept aware end to end.
+
+The old path resolves the zone with dateutil on every call, formats the datetimes to wall-clock
+strings for the calendar functions and parses them back there with dateutil's parser. The new path
+takes the zone from the shared cache, composes with fromisoformat and hands the datetimes through.
+
+Usage:  python -m benchmarks.bench_timezones --repeat 20000 --timezone Europe/Berlin
+"""
+
+import argparse
+import time
+
+
+def old_path(params, timezone):
+    from datetime import datetime
+    from dateutil import parser, tz
+    from backend.calendar_utils import build_event_body
+
+    ist = tz.gettz(timezone)
+    start_dt = datetime.strptime(params['date'] + ' ' + params['start_time'], '%Y-%m-%d %H:%M').replace(tzinfo=ist)
+    end_dt = datetime.strptime(params['date'] + ' ' + params['end_time'], '%Y-%m-%d %H:%M').replace(tzinfo=ist)
+    start_str = start_dt.strftime('%Y-%m-%dT%H:%M:%S')
+    end_str = end_dt.strftime('%Y-%m-%dT%H:%M:%S')
+    zone = tz.gettz(timezone)
+    window = (parser.parse(start_str).replace(tzinfo=zone).timestamp(),
+              parser.parse(end_str).replace(tzinfo=zone).timestamp())
+    return window, build_event_body(start_str, end_str, params['summary'], '', timezone)
+
+
+def new_path(params, timezone):
+    from agent.booking_agent import compose_datetimes
+    from backend.calendar_utils import build_event_body, parse_in_zone
+    from backend.timezones import get_zone
+
+    zone = get_zone(timezone)
+    start_dt, end_dt = compose_datetimes(params, zone)
+    window = (parse_in_zone(start_dt, zone).timestamp(), parse_in_zone(end_dt, zone).timestamp())
+    return window, build_event_body(start_dt, end_dt, params['summary'], '', timezone)
+
+
+def time_path(path, params, timezone, repeat):
+    path(params, timezone)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        path(params, timezone)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--repeat', type=int, default=20000)
+    arg_parser.add_argument('--timezone', action='append',
+                            help="Zone to compose in (repeatable); defaults to DEFAULT_TIMEZONE and Europe/Berlin")
+    args = arg_parser.parse_args()
+
+    from backend.timezones import DEFAULT_TIMEZONE
+
+    params = {"summary": "Design review", "date": "2026-03-30", "start_time": "09:30", "end_time": "10:15"}
+    for timezone in args.timezone or [DEFAULT_TIMEZONE, "Europe/Berlin"]:
+        old, new = old_path(params, timezone), new_path(params, timezone)
+        if old != new:
+            raise SystemExit(f"{timezone}: paths disagree:\n  old {old}\n  new {new}")
+        old_us = time_path(old_path, params, timezone, args.repeat)
+        new_us = time_path(new_path, params, timezone, args.repeat)
+        print(f"{timezone:<20} old {old_us:6.1f}us  new {new_us:6.1f}us  per booking  ({old_us / new_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
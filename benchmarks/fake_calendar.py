@@ -0,0 +1,499 @@
+"""
+Local fake Google Calendar server for benchmarks.
+Implements just enough of the Calendar v3 REST surface (token minting, freeBusy with recurring events
+expanded, event insert/get/update/delete, list with incremental sync tokens, watch channels and batch
+requests)
+to drive the real googleapiclient code paths without credentials or network access.
+Watch channels receive push notifications (the X-Goog-* headers only, like Google's) on every change.
+A share of calls can be answered with 429 rateLimitExceeded, as Google does under quota pressure.
+
+Run standalone with:  python -m benchmarks.fake_calendar --port 8085 --latency 0.02 --rate-limit 0.05
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from zoneinfo import ZoneInfo
+
+# Google rejects freeBusy queries for more calendars than this
+FREEBUSY_MAX_ITEMS = 50
+
+
+def parse_rfc3339(value, tz_name=None):
+    """
+    Parses an RFC3339 / ISO string into an aware datetime (naive values use tz_name, else UTC).
+    """
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=ZoneInfo(tz_name) if tz_name else timezone.utc)
+    return dt
+
+
+class FakeCalendarState:
+    """
+    In-memory calendars shared by all handler threads.
+    """
+
+    def __init__(self, latency=0.0, rate_limit=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        # Share of API calls (token minting excluded) rejected with 429
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.events = {}
+        self.request_counts = {}
+        self._ids = itertools.count(1)
+        # Every change gets a sequence number; sync tokens are the last number a client has seen
+        self.sync_seq = 0
+        self.min_sync_seq = 0
+        # calendar id -> {channel id: channel}
+        self.channels = {}
+        self._random = random.Random(seed)
+
+    def count(self, name):
+        with self.lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+
+    def rate_limited(self):
+        """
+        Decides whether this call is rejected with 429; counted as 'rate_limited'.
+        """
+        if self.rate_limit <= 0:
+            return False
+        with self.lock:
+            limited = self._random.random() < self.rate_limit
+        if limited:
+            self.count('rate_limited')
+        return limited
+
+    def insert(self, calendar_id, body):
+        """
+        Returns the created event, or None if a client-supplied id already exists (HTTP 409).
+        """
+        start = body.get('start', {})
+        end = body.get('end', {})
+        event = dict(body)
+        with self.lock:
+            if 'id' in event and self.find(calendar_id, event['id']) is not None:
+                return None
+            event.setdefault('id', f"fake{next(self._ids):08d}")
+            event['status'] = 'confirmed'
+            event['htmlLink'] = f"https://calendar.example/event?eid={event['id']}"
+            # All-day events (a 'date') span whole UTC days here
+            event['_start'] = parse_rfc3339(start.get('dateTime') or start['date'], start.get('timeZone'))
+            event['_end'] = parse_rfc3339(end.get('dateTime') or end['date'], end.get('timeZone'))
+            self.sync_seq += 1
+            event['_seq'] = self.sync_seq
+            self.events.setdefault(calendar_id, []).append(event)
+        return public_event(event)
+
+    def update(self, calendar_id, event_id, body):
+        """
+        Replaces an event (a cancelled one too, which restores it); returns it, or None if unknown.
+        """
+        start = body.get('start', {})
+        end = body.get('end', {})
+        with self.lock:
+            event = self.find(calendar_id, event_id)
+            if event is None:
+                return None
+            event.clear()
+            event.update(body, id=event_id, status=body.get('status', 'confirmed'),
+                         htmlLink=f"https://calendar.example/event?eid={event_id}")
+            event['_start'] = parse_rfc3339(start.get('dateTime') or start['date'], start.get('timeZone'))
+            event['_end'] = parse_rfc3339(end.get('dateTime') or end['date'], end.get('timeZone'))
+            self.sync_seq += 1
+            event['_seq'] = self.sync_seq
+        return public_event(event)
+
+    def delete(self, calendar_id, event_id):
+        """
+        Cancels an event; like Google, its id stays taken. Returns False if it is unknown or cancelled.
+        """
+        with self.lock:
+            event = self.find(calendar_id, event_id)
+            if event is None or event['status'] == 'cancelled':
+                return False
+            event['status'] = 'cancelled'
+            self.sync_seq += 1
+            event['_seq'] = self.sync_seq
+        return True
+
+    def find(self, calendar_id, event_id):
+        for event in self.events.get(calendar_id, []):
+            if event['id'] == event_id:
+                return event
+        return None
+
+    def dispatch(self, method, path, body):
+        """
+        Routes one API call; returns (status, JSON payload). Shared by direct and batch requests.
+        """
+        url = urlparse(path)
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        if method == 'POST' and parts == ['token']:
+            self.count('token')
+            return 200, {"access_token": "fake-token", "token_type": "Bearer", "expires_in": 3600}
+        if parts[:2] != ['calendar', 'v3']:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        if self.rate_limited():
+            return 429, RATE_LIMIT_ERROR
+        parts = parts[2:]
+        if method == 'POST' and parts == ['freeBusy']:
+            return self.freebusy(body)
+        if len(parts) == 3 and parts[0] == 'calendars' and parts[2] == 'events':
+            if method == 'POST':
+                self.count('insert')
+                created = self.insert(parts[1], body)
+                if created is None:
+                    return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+                self.notify(parts[1], 'exists')
+                return 200, created
+            if method == 'GET':
+                return self.list(parts[1], parse_qs(url.query))
+        if len(parts) == 4 and parts[0] == 'calendars' and parts[2:] == ['events', 'watch'] and method == 'POST':
+            self.count('watch')
+            return 200, self.watch(parts[1], body)
+        if method == 'POST' and parts == ['channels', 'stop']:
+            self.count('stop')
+            with self.lock:
+                for channels in self.channels.values():
+                    channels.pop(body.get('id'), None)
+            return 204, {}
+        if len(parts) == 4 and parts[0] == 'calendars' and parts[2] == 'events' and method == 'GET':
+            self.count('get')
+            with self.lock:
+                event = self.find(parts[1], parts[3])
+            if event is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            return 200, public_event(event)
+        if len(parts) == 4 and parts[0] == 'calendars' and parts[2] == 'events' and method == 'PUT':
+            self.count('update')
+            updated = self.update(parts[1], parts[3], body)
+            if updated is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            self.notify(parts[1], 'exists')
+            return 200, updated
+        if len(parts) == 4 and parts[0] == 'calendars' and parts[2] == 'events' and method == 'DELETE':
+            self.count('delete')
+            if not self.delete(parts[1], parts[3]):
+                return 410, {"error": {"code": 410, "message": "Resource has been deleted"}}
+            self.notify(parts[1], 'exists')
+            return 204, {}
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    def freebusy(self, body):
+        self.count('freebusy')
+        tz_name = body.get('timeZone') or 'UTC'
+        time_min = parse_rfc3339(body['timeMin'], tz_name)
+        time_max = parse_rfc3339(body['timeMax'], tz_name)
+        out_tz = ZoneInfo(tz_name)
+        if len(body.get('items', [])) > FREEBUSY_MAX_ITEMS:
+            return 400, {"error": {"code": 400, "message": "Too many calendars requested.",
+                                   "errors": [{"reason": "tooManyCalendarsRequested"}]}}
+        calendars = {}
+        for item in body.get('items', []):
+            calendars[item['id']] = {"busy": [
+                {"start": s.astimezone(out_tz).isoformat(), "end": e.astimezone(out_tz).isoformat()}
+                for s, e in self.busy(item['id'], time_min, time_max)
+            ]}
+        return 200, {"kind": "calendar#freeBusy", "timeMin": body['timeMin'],
+                     "timeMax": body['timeMax'], "calendars": calendars}
+
+    def watch(self, calendar_id, body):
+        ttl = float((body.get('params') or {}).get('ttl', 3600))
+        channel = {
+            "kind": "api#channel",
+            "id": body['id'],
+            "resourceId": f"resource-{calendar_id}",
+            "resourceUri": f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events",
+            "token": body.get('token'),
+            "expiration": str(int((time.time() + ttl) * 1000)),
+            "_address": body['address'],
+            "_messages": itertools.count(),
+        }
+        with self.lock:
+            self.channels.setdefault(calendar_id, {})[channel['id']] = channel
+        self._post(channel, 'sync')
+        return {k: v for k, v in channel.items() if not k.startswith('_') and k != 'token'}
+
+    def notify(self, calendar_id, state):
+        """
+        Posts a change notification to every channel watching calendar_id, off the request thread.
+        """
+        with self.lock:
+            channels = list(self.channels.get(calendar_id, {}).values())
+        for channel in channels:
+            self._post(channel, state)
+
+    def _post(self, channel, state):
+        headers = {
+            "X-Goog-Channel-ID": channel['id'],
+            "X-Goog-Message-Number": str(next(channel['_messages']) + 1),
+            "X-Goog-Resource-ID": channel['resourceId'],
+            "X-Goog-Resource-State": state,
+            "X-Goog-Resource-URI": channel['resourceUri'],
+            "X-Goog-Channel-Expiration": time.strftime(
+                '%a, %d %b %Y %H:%M:%S GMT', time.gmtime(int(channel['expiration']) / 1000)),
+        }
+        if channel.get('token'):
+            headers["X-Goog-Channel-Token"] = channel['token']
+
+        def send():
+            try:
+                request = urllib.request.Request(channel['_address'], data=b'', headers=headers, method='POST')
+                urllib.request.urlopen(request, timeout=10).close()
+                self.count('notification')
+            except Exception:
+                self.count('notification_failed')
+
+        threading.Thread(target=send, daemon=True).start()
+
+    def expire_sync_tokens(self):
+        """
+        Makes every sync token issued so far invalid, so the next incremental sync gets 410 Gone.
+        """
+        with self.lock:
+            self.min_sync_seq = self.sync_seq
+
+    def list(self, calendar_id, query):
+        self.count('list')
+        with self.lock:
+            events = list(self.events.get(calendar_id, []))
+            seq = self.sync_seq
+            min_seq = self.min_sync_seq
+        if 'syncToken' in query:
+            since = int(query['syncToken'][0].rsplit('-', 1)[1])
+            if since < min_seq:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required.",
+                                       "errors": [{"domain": "calendar", "reason": "fullSyncRequired"}]}}
+            return self._sync_page(
+                sorted((e for e in events if e['_seq'] > since), key=lambda e: e['_seq']), seq, query)
+        if 'timeMin' not in query and 'timeMax' not in query:
+            return self._sync_page(sorted(events, key=lambda e: e['_seq']), seq, query)
+        time_min = parse_rfc3339(query.get('timeMin', ['1970-01-01T00:00:00Z'])[0])
+        time_max = parse_rfc3339(query.get('timeMax', ['2100-01-01T00:00:00Z'])[0])
+        if query.get('singleEvents', ['false'])[0] == 'true':
+            items = [self.instance(e, start, end)
+                     for e in events if e['status'] != 'cancelled'
+                     for start, end in self.instances(e, time_min, time_max)]
+        else:
+            items = [public_event(e) for e in events if e['_end'] > time_min and e['_start'] < time_max
+                     and e['status'] != 'cancelled']
+        items.sort(key=lambda e: parse_rfc3339(e['start'].get('dateTime') or e['start']['date']))
+        offset = int(query.get('pageToken', ['0'])[0])
+        size = int(query.get('maxResults', ['250'])[0])
+        page = {"kind": "calendar#events", "items": items[offset:offset + size]}
+        if offset + size < len(items):
+            page["nextPageToken"] = str(offset + size)
+        return 200, page
+
+    @staticmethod
+    def instance(event, start, end):
+        """
+        The events.list item of one instance of an event (the event itself unless it recurs).
+        """
+        if not event.get('recurrence'):
+            return public_event(event)
+        item = {k: v for k, v in public_event(event).items() if k != 'recurrence'}
+        zone = event['start'].get('timeZone') or 'UTC'
+        item['id'] = f"{event['id']}_{start.astimezone(timezone.utc):%Y%m%dT%H%M%SZ}"
+        item['recurringEventId'] = event['id']
+        item['originalStartTime'] = {'dateTime': start.isoformat(), 'timeZone': zone}
+        item['start'] = {'dateTime': start.isoformat(), 'timeZone': zone}
+        item['end'] = {'dateTime': end.isoformat(), 'timeZone': zone}
+        return item
+
+    def _sync_page(self, events, seq, query):
+        """
+        One page of a full or incremental sync; the last page carries nextSyncToken.
+        """
+        offset = int(query.get('pageToken', ['0'])[0])
+        size = int(query.get('maxResults', ['250'])[0])
+        page = {"kind": "calendar#events", "timeZone": "UTC",
+                "items": [public_event(e) for e in events[offset:offset + size]]}
+        if offset + size < len(events):
+            page["nextPageToken"] = str(offset + size)
+        else:
+            page["nextSyncToken"] = f"sync-{seq}"
+        return 200, page
+
+    def busy(self, calendar_id, time_min, time_max):
+        with self.lock:
+            events = list(self.events.get(calendar_id, []))
+        busy = []
+        for event in events:
+            if event.get('transparency') == 'transparent' or event['status'] == 'cancelled':
+                continue
+            for start, end in self.instances(event, time_min, time_max):
+                busy.append((max(start, time_min), min(end, time_max)))
+        return sorted(busy)
+
+    @staticmethod
+    def instances(event, time_min, time_max):
+        """
+        (start, end) of each instance of an event overlapping [time_min, time_max); a recurring
+        event's RRULE is expanded in the zone of its start.
+        """
+        if not event.get('recurrence'):
+            if event['_start'] < time_max and event['_end'] > time_min:
+                yield event['_start'], event['_end']
+            return
+        from dateutil.rrule import rrulestr
+
+        duration = event['_end'] - event['_start']
+        zone = ZoneInfo(event['start'].get('timeZone') or 'UTC')
+        rule = rrulestr("\n".join(event['recurrence']), dtstart=event['_start'].astimezone(zone))
+        for start in rule.between(time_min - duration, time_max):
+            if start + duration > time_min:
+                yield start, start + duration
+
+
+RATE_LIMIT_ERROR = {"error": {"code": 429, "message": "Rate Limit Exceeded", "errors": [
+    {"domain": "usageLimits", "reason": "rateLimitExceeded", "message": "Rate Limit Exceeded"}]}}
+
+
+def public_event(event):
+    return {k: v for k, v in event.items() if not k.startswith('_')}
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, data, content_type='application/json; charset=UTF-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if status == 429:
+            self.send_header('Retry-After', str(self.state.retry_after))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        raw = self._read_body()
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        content_type = self.headers.get('Content-Type', '')
+        if method == 'POST' and urlparse(self.path).path.rstrip('/') == '/batch/calendar/v3':
+            self.state.count('batch')
+            body, boundary = handle_batch(self.state, raw, content_type)
+            return self._send(200, body, f'multipart/mixed; boundary={boundary}')
+        status, payload = self.state.dispatch(method, self.path, parse_body(raw, content_type))
+        self._send(status, json.dumps(payload).encode() if status != 204 else b'')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+def parse_body(raw, content_type):
+    if not raw:
+        return {}
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        return {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+    return json.loads(raw)
+
+
+def handle_batch(state, raw, content_type):
+    """
+    Executes a multipart/mixed batch request part by part; returns (response body, boundary).
+    """
+    boundary = content_type.split('boundary=', 1)[1].strip('"')
+    out_boundary = 'batch_fake_boundary'
+    out = []
+    for part in raw.split(b'--' + boundary.encode()):
+        part = part.strip(b'\r\n')
+        if not part or part == b'--':
+            continue
+        part_headers, _, inner = part.replace(b'\r\n', b'\n').partition(b'\n\n')
+        content_id = ''
+        for line in part_headers.decode().split('\n'):
+            if line.lower().startswith('content-id:'):
+                content_id = line.split(':', 1)[1].strip()
+        request_head, _, body = inner.partition(b'\n\n')
+        request_line = request_head.decode().split('\n')[0]
+        method, path = request_line.split(' ')[:2]
+        status, payload = state.dispatch(method, path, json.loads(body) if body.strip() else {})
+        response_id = content_id.replace('<', '<response-', 1)
+        retry_after = f"Retry-After: {state.retry_after}\r\n" if status == 429 else ""
+        out.append(
+            f"--{out_boundary}\r\nContent-Type: application/http\r\nContent-ID: {response_id}\r\n\r\n"
+            f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\nContent-Type: application/json; charset=UTF-8\r\n"
+            f"{retry_after}\r\n{json.dumps(payload)}\r\n"
+        )
+    out.append(f"--{out_boundary}--\r\n")
+    return ''.join(out).encode(), out_boundary
+
+
+class FakeCalendarServer:
+    """
+    Runs the fake Calendar API on a background thread.
+
+        with FakeCalendarServer(latency=0.02, rate_limit=0.05) as server:
+            pool = CalendarClientPool(api_root=server.url, ...)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rate_limit=0.0, retry_after=1, seed=None):
+        self.state = FakeCalendarState(latency=latency, rate_limit=rate_limit, retry_after=retry_after, seed=seed)
+        handler = type('BoundFakeCalendarHandler', (FakeCalendarHandler,), {'state': self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run a local fake Google Calendar API.")
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8085)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="Seconds of delay added to every request")
+    arg_parser.add_argument('--rate-limit', type=float, default=0.0,
+                            help="Share of calls answered with 429 rateLimitExceeded")
+    arg_parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with a 429")
+    args = arg_parser.parse_args()
+    server = FakeCalendarServer(args.host, args.port, args.latency, args.rate_limit, args.retry_after)
+    print(f"Fake Calendar API listening on {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,125 @@
+"""
+Stub stand-in for ChatGoogleGenerativeAI used by the offline benchmarks.
+Answers every prompt with canned extraction JSON after an injected latency, through both
+invoke() and ainvoke(), so the request path can be exercised without a Gemini key. Like the real
+model it offers with_structured_output and reports token usage; a share of first answers can be
+made malformed to exercise the repair path. Latency is drawn from a distribution: lognormal around
+latency (jitter is its sigma), with a slow_rate share of calls taking slow_latency instead, the
+long tail that hedged calls are meant to cut.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+
+def estimate_tokens(text):
+    # Gemini averages about four characters per token for English prompts
+    return max(1, len(text) // 4)
+
+
+class StubMessage:
+    def __init__(self, content, input_tokens=0):
+        self.content = content
+        self.tool_calls = []
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": estimate_tokens(content),
+                               "total_tokens": input_tokens + estimate_tokens(content)}
+
+
+class StubLLM:
+    """
+    Returns a distinct one-hour booking per call (spread over working hours of consecutive days),
+    so load tests exercise both the free and the busy paths of the agent.
+    A malformed_rate share of first answers (not repair requests) has a date the schema rejects.
+    """
+
+    def __init__(self, latency=0.0, start_date=date(2030, 1, 7), malformed_rate=0.0, seed=None,
+                 jitter=0.0, slow_rate=0.0, slow_latency=0.0):
+        self.latency = latency
+        self.start_date = start_date
+        self.malformed_rate = malformed_rate
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _next_params(self):
+        with self._lock:
+            n = next(self._counter)
+            self.calls += 1
+        day = self.start_date + timedelta(days=n // 8)
+        hour = 9 + n % 8
+        return {
+            "summary": f"Load test meeting {n}",
+            "date": day.isoformat(),
+            "start_time": f"{hour:02d}:00",
+            "end_time": f"{hour + 1:02d}:00",
+            "description": "MISSING",
+        }
+
+    def _answer(self, messages):
+        params = self._next_params()
+        # A repair request carries the rejected answer as an AI message
+        repair = any(getattr(m, "type", None) == "ai" for m in messages)
+        with self._lock:
+            malformed = not repair and self._random.random() < self.malformed_rate
+        if malformed:
+            params["date"] = "the " + params["date"][8:] + "th"
+        prompt = "".join(str(getattr(m, "content", m)) for m in messages)
+        return StubMessage(json.dumps(params), estimate_tokens(prompt))
+
+    def _delay(self):
+        with self._lock:
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                return self.slow_latency
+            return self.latency * self._random.lognormvariate(0, self.jitter) if self.jitter else self.latency
+
+    def invoke(self, messages, **kwargs):
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return self._answer(messages)
+
+    async def ainvoke(self, messages, **kwargs):
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._answer(messages)
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        return StubStructuredLLM(self, schema, include_raw)
+
+
+class StubStructuredLLM:
+    """
+    The stub bound to a pydantic schema, answering like a langchain structured-output runnable.
+    """
+
+    def __init__(self, llm, schema, include_raw):
+        self.llm = llm
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def _parse(self, message):
+        try:
+            parsed, error = self.schema.model_validate_json(message.content), None
+        except ValueError as e:
+            parsed, error = None, e
+        if self.include_raw:
+            return {"raw": message, "parsed": parsed, "parsing_error": error}
+        if error is not None:
+            raise error
+        return parsed
+
+    def invoke(self, messages, **kwargs):
+        return self._parse(self.llm.invoke(messages, **kwargs))
+
+    async def ainvoke(self, messages, **kwargs):
+        return self._parse(await self.llm.ainvoke(messages, **kwargs))
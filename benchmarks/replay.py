@@ -0,0 +1,358 @@
+"""
+Replays a JSONL corpus against /chat and /book at a fixed concurrency and reports throughput and
+latency percentiles, so regressions show up before a deploy rather than in production.
+
+Corpus lines with a "message" go to /chat; lines with "summary", "start" and "end" go to /book.
+Generated bookings on distinct slots can be mixed in with --bookings. By default the app runs
+in-process with StubLLM and the fake Calendar server (optionally answering a share of calls with
+429); with --url the corpus is replayed against a running server instead.
+
+With --stream, /chat requests go to /chat/stream instead and the time to the first streamed event
+(TTFB) is reported next to the full latency; in-process, the app is then served over a local
+uvicorn socket, since the ASGI test transport buffers whole responses.
+
+The LLM extraction line reports the share of Gemini answers that did not fit the extraction schema,
+how many the single repair attempt fixed, and tokens per extraction (from /metrics). Against the
+stub, --llm-malformed-rate makes a share of first answers invalid.
+
+Results can be saved with --output and compared with a saved run via --baseline; the exit status
+is 1 when a gate (--max-p95-ms, --max-error-rate, --tolerance against the baseline) is exceeded.
+
+Usage:  python -m benchmarks.replay --chats 200 --bookings 200 --concurrency 32
+        python -m benchmarks.replay --output base.json  (then, after a change)
+        python -m benchmarks.replay --baseline base.json --tolerance 0.2
+        python -m benchmarks.replay --stream --chats 200 --bookings 0
+        python -m benchmarks.replay --chats 400 --bookings 0 --llm-malformed-rate 0.1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+DEFAULT_CORPUS = 'benchmarks/corpus/chat_messages.jsonl'
+# /chat reports backend failures as a 200 with an apology; count those as errors too
+CHAT_ERROR_PREFIX = "Sorry, something went wrong"
+
+
+def load_corpus(paths):
+    """
+    Returns [(path, payload)] for every line of the corpus files.
+    """
+    requests = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if "message" in item:
+                    requests.append(("/chat", {"message": item["message"]}))
+                elif {"summary", "start", "end"} <= item.keys():
+                    requests.append(("/book", item))
+    return requests
+
+
+def build_requests(corpus, chats, bookings, seed):
+    """
+    Cycles the corpus up to the requested counts, adds generated bookings and shuffles the mix.
+    """
+    from benchmarks.bench_async_load import booking_payloads
+
+    chat_items = [item for item in corpus if item[0] == "/chat"]
+    book_items = [item for item in corpus if item[0] == "/book"]
+    requests = list(itertools.islice(itertools.cycle(chat_items), chats)) if chat_items else []
+    requests += book_items
+    requests += [("/book", payload) for payload in booking_payloads(bookings, 0)]
+    random.Random(seed).shuffle(requests)
+    return requests
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def outcome(path, response):
+    """
+    Returns (label, error): the HTTP status plus the booking status for /book, and whether it failed.
+    """
+    if response.status_code != 200:
+        return str(response.status_code), response.status_code >= 500 or response.status_code == 429
+    if path == "/book":
+        return f"200 {response.json().get('status')}", False
+    if response.json().get("response", "").startswith(CHAT_ERROR_PREFIX):
+        return "200 error reply", True
+    return "200", False
+
+
+async def send_stream(client, payload, headers, started):
+    """
+    POSTs a chat turn to /chat/stream and reads the SSE stream; returns (label, error, ttfb).
+    """
+    ttfb = None
+    event = None
+    final = None
+    async with client.stream("POST", "/chat/stream", json=payload, headers=headers) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return str(response.status_code), response.status_code >= 500, time.perf_counter() - started
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                final = (event, json.loads(line[len("data: "):]))
+    if final is None:
+        return "200 incomplete stream", True, ttfb
+    if final[0] == "error":
+        return "200 error event", True, ttfb
+    if final[1].get("response", "").startswith(CHAT_ERROR_PREFIX):
+        return "200 error reply", True, ttfb
+    return "200", False, ttfb
+
+
+async def replay(client, requests, concurrency, stream=False):
+    """
+    Sends requests from `concurrency` workers; returns (elapsed, {path: [(latency, outcome, error, ttfb)]}).
+    Every request carries its own Idempotency-Key, so repeated corpus lines are not replayed from
+    the idempotency store. With stream, chat turns use /chat/stream; for other requests the TTFB is
+    the full latency.
+    """
+    queue = asyncio.Queue()
+    for item in requests:
+        queue.put_nowait(item)
+    results = {}
+
+    async def worker():
+        while not queue.empty():
+            path, payload = queue.get_nowait()
+            headers = {"Idempotency-Key": uuid.uuid4().hex}
+            started = time.perf_counter()
+            ttfb = None
+            try:
+                if stream and path == "/chat":
+                    path = "/chat/stream"
+                    label, error, ttfb = await send_stream(client, payload, headers, started)
+                else:
+                    response = await client.post(path, json=payload, headers=headers)
+                    label, error = outcome(path, response)
+            except Exception as e:
+                label, error = type(e).__name__, True
+            latency = time.perf_counter() - started
+            results.setdefault(path, []).append((latency, label, error, latency if ttfb is None else ttfb))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, results
+
+
+def summarize(elapsed, results):
+    report = {}
+    for path, samples in sorted(results.items()):
+        latencies = sorted(latency for latency, _, _, _ in samples)
+        ttfbs = sorted(ttfb for _, _, _, ttfb in samples)
+        outcomes = {}
+        for _, label, _, _ in samples:
+            outcomes[label] = outcomes.get(label, 0) + 1
+        errors = sum(error for _, _, error, _ in samples)
+        report[path] = {
+            "count": len(samples),
+            "errors": errors,
+            "error_rate": errors / len(samples),
+            "throughput_rps": len(samples) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000,
+            "ttfb_p50_ms": percentile(ttfbs, 0.50) * 1000,
+            "ttfb_p95_ms": percentile(ttfbs, 0.95) * 1000,
+            "outcomes": dict(sorted(outcomes.items())),
+        }
+    return report
+
+
+def print_extraction(extraction):
+    """
+    LLM extraction quality: answers that did not fit the schema, how many the repair fixed, and tokens.
+    """
+    if not extraction or not extraction.get("extractions"):
+        return
+    print(f"\nLLM extractions: n={extraction['extractions']}  calls={extraction['llm_calls']}  "
+          f"parse failures={extraction['parse_failures']} ({extraction['parse_failure_rate']:.1%})  "
+          f"repaired={extraction['repaired']}  failed={extraction['failed']}  "
+          f"tokens/extraction={extraction['tokens_per_extraction']:.0f}")
+
+
+def print_report(report, stages=None):
+    for path, row in report.items():
+        print(f"{path:<12} n={row['count']:<5} {row['throughput_rps']:8.1f} req/s  p50={row['p50_ms']:7.1f}ms  "
+              f"p95={row['p95_ms']:7.1f}ms  p99={row['p99_ms']:7.1f}ms  max={row['max_ms']:7.1f}ms  "
+              f"errors={row['errors']}")
+        if path.endswith("/stream"):
+            print(f"{'':13}ttfb p50={row['ttfb_p50_ms']:7.1f}ms  p95={row['ttfb_p95_ms']:7.1f}ms")
+        print(" " * 13 + "  ".join(f"{label}: {n}" for label, n in row['outcomes'].items()))
+    if stages:
+        print("\nstage breakdown (server-side, from /metrics):")
+        for stage, row in stages.items():
+            print(f"  {stage:<28} n={row['count']:<6} p50={row['p50_ms']:8.1f}ms  p95={row['p95_ms']:8.1f}ms  "
+                  f"errors={row['errors']}")
+
+
+def check_gates(report, args, baseline=None):
+    """
+    Returns the list of failed gates.
+    """
+    failures = []
+    for path, row in report.items():
+        if args.max_p95_ms is not None and row['p95_ms'] > args.max_p95_ms:
+            failures.append(f"{path} p95 {row['p95_ms']:.1f}ms > {args.max_p95_ms:.1f}ms")
+        if args.max_error_rate is not None and row['error_rate'] > args.max_error_rate:
+            failures.append(f"{path} error rate {row['error_rate']:.3f} > {args.max_error_rate:.3f}")
+        base = (baseline or {}).get(path)
+        if base is None:
+            continue
+        if row['p95_ms'] > base['p95_ms'] * (1 + args.tolerance):
+            failures.append(f"{path} p95 {row['p95_ms']:.1f}ms vs baseline {base['p95_ms']:.1f}ms")
+        if row['throughput_rps'] < base['throughput_rps'] * (1 - args.tolerance):
+            failures.append(f"{path} throughput {row['throughput_rps']:.1f} vs baseline {base['throughput_rps']:.1f} req/s")
+    return failures
+
+
+async def run_remote(args, requests):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        elapsed, results = await replay(client, requests, args.concurrency, args.stream)
+        try:
+            snapshot = (await client.get("/metrics")).json()
+        except Exception:
+            snapshot = {}
+    return elapsed, results, snapshot.get("stages"), snapshot.get("sources", {}).get("extraction")
+
+
+@contextlib.asynccontextmanager
+async def serve_app(app, over_socket):
+    """
+    Yields httpx.AsyncClient arguments reaching app: the ASGI transport, or a uvicorn server on a
+    free local port when responses must really be streamed.
+    """
+    import httpx
+
+    if not over_socket:
+        yield {"transport": httpx.ASGITransport(app=app), "base_url": "http://replay"}
+        return
+    import socket
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off",
+                                           log_level="warning", access_log=False))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield {"base_url": f"http://127.0.0.1:{port}", "limits": httpx.Limits(max_connections=None)}
+    finally:
+        server.should_exit = True
+        await task
+
+
+async def run_in_process(args, requests):
+    import httpx
+    from google.auth.credentials import AnonymousCredentials
+
+    from benchmarks.fake_calendar import FakeCalendarServer
+    from benchmarks.fake_gemini import StubLLM
+    from backend import calendar_client, calendar_utils
+    from backend.metrics import metrics
+    from agent import booking_agent
+    from backend.main import app
+
+    booking_agent.set_llm(StubLLM(latency=args.llm_latency, malformed_rate=args.llm_malformed_rate, seed=args.seed))
+    calendar_utils.CALENDAR_ID = 'replay@example.com'
+
+    with FakeCalendarServer(latency=args.calendar_latency, rate_limit=args.rate_limit, seed=args.seed) as server:
+        calendar_client.set_client_pool(calendar_client.CalendarClientPool(
+            credentials=AnonymousCredentials(), api_root=server.url, size=calendar_utils.CALENDAR_MAX_WORKERS))
+        metrics.reset()
+        async with serve_app(app, args.stream) as client_kwargs:
+            async with httpx.AsyncClient(timeout=args.timeout, **client_kwargs) as client:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed, results = await replay(client, requests, args.concurrency, args.stream)
+        snapshot = metrics.snapshot()
+        print(f"fake calendar calls: {dict(sorted(server.state.request_counts.items()))}")
+    return elapsed, results, snapshot["stages"], snapshot["sources"].get("extraction")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--corpus', nargs='+', default=[DEFAULT_CORPUS])
+    arg_parser.add_argument('--chats', type=int, default=200, help="/chat requests, cycling the corpus messages")
+    arg_parser.add_argument('--bookings', type=int, default=200, help="Generated /book requests on distinct slots")
+    arg_parser.add_argument('--concurrency', type=int, default=32)
+    arg_parser.add_argument('--url', help="Replay against a running server instead of the in-process app")
+    arg_parser.add_argument('--timeout', type=float, default=120)
+    arg_parser.add_argument('--llm-latency', type=float, default=0.3)
+    arg_parser.add_argument('--llm-malformed-rate', type=float, default=0.0,
+                            help="Share of stub LLM answers that don't fit the extraction schema")
+    arg_parser.add_argument('--calendar-latency', type=float, default=0.02)
+    arg_parser.add_argument('--rate-limit', type=float, default=0.0,
+                            help="Share of fake Calendar calls answered with 429")
+    arg_parser.add_argument('--calendar-qps', type=float, default=0,
+                            help="Client-side Calendar calls per second per calendar (0 = unlimited)")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--stream', action='store_true', help="Send chat turns to /chat/stream and report TTFB")
+    arg_parser.add_argument('--stages', action='store_true', help="Also print the per-stage breakdown")
+    arg_parser.add_argument('--output', help="Write the results as JSON")
+    arg_parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 increase / throughput drop against the baseline")
+    arg_parser.add_argument('--max-p95-ms', type=float)
+    arg_parser.add_argument('--max-error-rate', type=float)
+    args = arg_parser.parse_args()
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["CALENDAR_QPS_PER_CALENDAR"] = str(args.calendar_qps)
+    # The fake server has no project quota
+    os.environ.setdefault("CALENDAR_PROJECT_QPS", "0")
+
+    requests = build_requests(load_corpus(args.corpus), args.chats, args.bookings, args.seed)
+    mode = args.url or (f"in-process  llm latency={args.llm_latency * 1000:.0f}ms  "
+                        f"calendar latency={args.calendar_latency * 1000:.0f}ms  rate limit={args.rate_limit:.0%}")
+    print(f"{len(requests)} requests  concurrency={args.concurrency}  {mode}")
+    runner = run_remote if args.url else run_in_process
+    elapsed, results, stages, extraction = asyncio.run(runner(args, requests))
+    report = summarize(elapsed, results)
+    print_report(report, stages if args.stages else None)
+    print_extraction(extraction)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"concurrency": args.concurrency, "endpoints": report, "stages": stages,
+                       "extraction": extraction}, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)["endpoints"]
+    failures = check_gates(report, args, baseline)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,57 @@
 import streamlit as st
 import requests
+import json
+import os
+import uuid
 import streamlit.components.v1 as components
 
 st.set_page_config(page_title="AI Calendar Chat", page_icon="📅", layout="centered")
 
+BACKEND_URL = "https://calendar-backend-c3xn.onrender.com"
+# The tenant's key, for a backend serving several calendars (TENANTS_FILE)
+BACKEND_API_KEY = os.getenv("BACKEND_API_KEY")
+
+@st.cache_resource
+def http_session():
+    """
+    One pooled HTTP session for the whole app, so each message reuses a warm TLS connection.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if BACKEND_API_KEY:
+        session.headers["X-API-Key"] = BACKEND_API_KEY
+    return session
+
+def stream_chat(message, session_id, idempotency_key, on_stage):
+    """
+    Sends a message to /chat/stream and calls on_stage(text) for every progress event.
+    Returns the final {"response", "session_id"}; raises on an error event or a broken stream.
+    """
+    response = http_session().post(
+        f"{BACKEND_URL}/chat/stream",
+        json={"message": message, "session_id": session_id},
+        headers={"Idempotency-Key": idempotency_key, "Accept": "text/event-stream"},
+        stream=True,
+        timeout=(10, 60),
+    )
+    with response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "stage":
+                    on_stage(data["text"])
+                elif event == "done":
+                    return data
+                elif event == "error":
+                    raise RuntimeError(data.get("message", "Agent error"))
+    raise requests.ConnectionError("The response stream ended early.")
+
 # --- Custom CSS ---
 st.markdown("""
     <style>
@@ -102,18 +150,31 @@ with col2:
 # --- Handle Sending Message ---
 if send_btn and user_input.strip():
     st.session_state.messages.append({"role": "user", "content": user_input})
-    with st.spinner("AI is thinking..."):
+    # One key per sent message: retries of this message are deduplicated by the backend
+    idempotency_key = uuid.uuid4().hex
+    # Progress lines appear as the backend reaches each step, instead of a spinner until the end
+    status = st.empty()
+    stages = []
+
+    def show_stage(text):
+        stages.append(text)
+        status.markdown("\n\n".join(f"🤖 _{line}_" for line in stages))
+
+    status.markdown("🤖 _AI is thinking..._")
+    for attempt in range(2):
         try:
-            BACKEND_URL = "https://calendar-backend-c3xn.onrender.com"
-            response = requests.post(
-                f"{BACKEND_URL}/chat",
-                json={"message": user_input},
-                timeout=60
-            )
-            response.raise_for_status()
-            ai_reply = response.json().get("response", "No response received.")
+            data = stream_chat(user_input, st.session_state.get("session_id"), idempotency_key, show_stage)
+            ai_reply = data.get("response", "No response received.")
+            # The backend keeps the conversation state; follow-ups only need the session id
+            st.session_state.session_id = data.get("session_id")
+            break
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # The same Idempotency-Key makes the retry return the first attempt's result
+            ai_reply = f"Error: {e}"
         except Exception as e:
             ai_reply = f"Error: {e}"
+            break
+    status.empty()
     st.session_state.messages.append({"role": "assistant", "content": ai_reply})
     st.rerun()
 
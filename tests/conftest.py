@@ -0,0 +1,139 @@
+"""
+Shared fixtures. The app runs in-process against the benchmarks' fake Calendar server and a scripted
+stand-in for Gemini, so the suite needs no credentials or network access. Every test gets its own
+calendar id, reservation ledger, idempotency store and extraction cache.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import re
+
+import pytest
+
+# Read by the backend modules at import time
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("WARMUP_MODE", "off")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("CALENDAR_QPS_PER_CALENDAR", "0")
+os.environ.setdefault("CALENDAR_PROJECT_QPS", "0")
+
+from benchmarks.fake_gemini import StubMessage  # noqa: E402
+
+_calendar_ids = itertools.count(1)
+
+
+class ScriptedLLM:
+    """
+    Answers an extraction prompt with the fields known so far, updated by what the new messages
+    say: "<Summary> on YYYY-MM-DD" sets the summary and date, "from HH:MM to HH:MM" the times.
+    Fields nobody mentioned are 'MISSING'. Offers no structured-output mode, so answers are parsed
+    as text.
+    """
+
+    def invoke(self, messages, **kwargs):
+        text = messages[-1].content
+        params = {"summary": "MISSING", "date": "MISSING", "start_time": "MISSING", "end_time": "MISSING",
+                  "description": "", "recurrence": ""}
+        known = re.search(r"Event details known so far: (\{.*\})\n", text)
+        if known:
+            params.update(json.loads(known.group(1)))
+        for summary, day in re.findall(r"(\w+) on (\d{4}-\d{2}-\d{2})", text):
+            params.update(summary=summary, date=day)
+        for start, end in re.findall(r"from (\d\d:\d\d) to (\d\d:\d\d)", text):
+            params.update(start_time=start, end_time=end)
+        return StubMessage(json.dumps(params))
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages)
+
+
+class FakeCalendar:
+    """
+    The fake server and the calendar id the test books on.
+    """
+
+    def __init__(self, server, calendar_id):
+        self.server = server
+        self.calendar_id = calendar_id
+
+    def events(self):
+        return [e for e in self.server.state.events.get(self.calendar_id, []) if e["status"] != "cancelled"]
+
+    def add_event(self, **body):
+        return self.server.state.insert(self.calendar_id, body)
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    from google.auth.credentials import AnonymousCredentials
+
+    from benchmarks.fake_calendar import FakeCalendarServer
+    from backend import calendar_client, calendar_utils, main
+    from backend.calendar_client import CalendarClientPool
+    from backend.idempotency import IdempotencyStore
+    from backend.reservations import ReservationLedger
+
+    calendar_id = f"test{next(_calendar_ids)}@example.com"
+    monkeypatch.setattr(calendar_utils, "CALENDAR_ID", calendar_id)
+    monkeypatch.setattr(calendar_utils, "ledger", ReservationLedger())
+    monkeypatch.setattr(main, "idempotency_store", IdempotencyStore())
+    with FakeCalendarServer() as server:
+        calendar_client.set_client_pool(CalendarClientPool(credentials=AnonymousCredentials(), api_root=server.url,
+                                                           size=2))
+        yield FakeCalendar(server, calendar_id)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    from agent import booking_agent
+    from agent.extraction_cache import ExtractionCache
+
+    scripted = ScriptedLLM()
+    monkeypatch.setattr(booking_agent, "_llm", scripted)
+    monkeypatch.setattr(booking_agent, "extraction_cache", ExtractionCache(path=None))
+    return scripted
+
+
+@pytest.fixture
+def api(calendar, llm):
+    """
+    api(scenario) runs `async def scenario(client)` against the app and returns its result.
+    """
+    import httpx
+
+    from benchmarks.replay import serve_app
+    from backend.main import app
+
+    def run(scenario):
+        async def main():
+            async with serve_app(app, False) as kwargs:
+                async with httpx.AsyncClient(timeout=30, **kwargs) as client:
+                    return await scenario(client)
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def tenants(calendar, monkeypatch):
+    """
+    Configures tenants "a" and "b" (API keys "key-a" and "key-b"), each with a calendar of its own
+    on the fake server. Returns them by id.
+    """
+    from google.auth.credentials import AnonymousCredentials
+
+    from backend.calendar_client import CalendarClientPool
+    from backend.tenants import Tenant, tenant_registry
+
+    # The app's middleware holds on to the registry itself, so it is emptied rather than replaced
+    for name in ("_tenants", "_by_key", "_states", "_slots", "_running", "_waiting"):
+        monkeypatch.setattr(tenant_registry, name, type(getattr(tenant_registry, name))())
+    monkeypatch.setattr(tenant_registry, "pool_factory", lambda tenant: CalendarClientPool(
+        credentials=AnonymousCredentials(), api_root=calendar.server.url, size=2))
+    configured = {}
+    for tenant_id in ("a", "b"):
+        configured[tenant_id] = Tenant(tenant_id, f"{tenant_id}-{calendar.calendar_id}", api_keys=[f"key-{tenant_id}"])
+        tenant_registry.add(configured[tenant_id])
+    return configured
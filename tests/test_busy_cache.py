@@ -0,0 +1,109 @@
+from backend.busy_cache import BusyCache, BusyIntervalIndex
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_index_covers_a_range_split_across_adjacent_windows():
+    index = BusyIntervalIndex()
+    index.replace_window(0, 100, [(10, 20)], fetched_at=5)
+    index.replace_window(100, 200, [(150, 160)], fetched_at=7)
+    assert index.covers(50, 150, min_fetched=5)
+    assert index.overlaps(0, 200) == [(10, 20), (150, 160)]
+    # One of the windows is older than asked for
+    assert not index.covers(50, 150, min_fetched=6)
+    assert index.covers(120, 180, min_fetched=6)
+
+
+def test_index_does_not_cover_a_gap_between_windows():
+    index = BusyIntervalIndex()
+    index.replace_window(0, 100, [], fetched_at=5)
+    index.replace_window(120, 200, [], fetched_at=5)
+    assert not index.covers(50, 150, min_fetched=0)
+    assert not index.covers(90, 110, min_fetched=0)
+    assert not index.covers(250, 300, min_fetched=0)
+
+
+def test_refetched_window_replaces_what_was_known_there():
+    index = BusyIntervalIndex()
+    index.replace_window(0, 100, [(10, 20), (60, 80)], fetched_at=1)
+    index.replace_window(50, 150, [(120, 130)], fetched_at=2)
+    assert index.overlaps(0, 150) == [(10, 20), (120, 130)]
+    assert index.covers(0, 150, min_fetched=1)
+    assert not index.covers(0, 150, min_fetched=2)
+
+
+def test_overlaps_clips_and_merges_touching_intervals():
+    index = BusyIntervalIndex()
+    index.replace_window(0, 100, [(10, 20), (20, 30), (40, 200)], fetched_at=1)
+    assert index.overlaps(15, 50) == [(15, 30), (40, 50)]
+    assert index.overlaps(0, 100)[-1] == (40, 100)
+
+
+def test_expire_drops_stale_windows_and_their_intervals():
+    index = BusyIntervalIndex()
+    index.replace_window(0, 100, [(10, 20)], fetched_at=1)
+    index.replace_window(200, 300, [(210, 220)], fetched_at=5)
+    index.expire(min_fetched=3, max_intervals=100)
+    assert index.overlaps(0, 300) == [(210, 220)]
+    assert not index.covers(0, 100, min_fetched=0)
+    assert index.covers(200, 300, min_fetched=0)
+
+
+def test_expire_drops_oldest_windows_over_the_interval_cap():
+    index = BusyIntervalIndex()
+    index.replace_window(0, 100, [(10, 20), (30, 40)], fetched_at=1)
+    index.replace_window(200, 300, [(210, 220)], fetched_at=2)
+    index.expire(min_fetched=0, max_intervals=3)
+    assert not index.covers(0, 100, min_fetched=0)
+    assert index.overlaps(0, 300) == [(210, 220)]
+
+
+def test_cache_entries_expire_after_the_ttl():
+    clock = Clock()
+    cache = BusyCache(ttl=60, clock=clock)
+    cache.store("cal", 0, 100, [(10, 20)])
+    assert cache.lookup("cal", 0, 100) == [(10, 20)]
+    clock.now += 61
+    assert cache.lookup("cal", 0, 100) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_with_zero_ttl_is_disabled():
+    cache = BusyCache(ttl=0)
+    cache.store("cal", 0, 100, [])
+    assert cache.lookup("cal", 0, 100) is None
+
+
+def test_cache_evicts_the_least_recently_used_calendar():
+    cache = BusyCache(ttl=60, max_calendars=2, clock=Clock())
+    cache.store("a", 0, 100, [])
+    cache.store("b", 0, 100, [])
+    assert cache.lookup("a", 0, 100) == []
+    cache.store("c", 0, 100, [])
+    assert cache.lookup("b", 0, 100) is None
+    assert cache.lookup("a", 0, 100) == []
+    assert cache.lookup("c", 0, 100) == []
+
+
+def test_add_busy_writes_through_inside_a_covered_window():
+    cache = BusyCache(ttl=60, clock=Clock())
+    cache.store("cal", 0, 100, [(10, 20)])
+    cache.add_busy("cal", 15, 30)
+    assert cache.lookup("cal", 0, 100) == [(10, 30)]
+
+
+def test_add_busy_outside_a_covered_window_is_ignored():
+    cache = BusyCache(ttl=60, clock=Clock())
+    cache.add_busy("unknown", 10, 20)
+    assert cache.lookup("unknown", 0, 100) is None
+    cache.store("cal", 0, 100, [])
+    cache.add_busy("cal", 200, 300)
+    assert cache._calendars["cal"].overlaps(0, 400) == []
+    assert cache.lookup("cal", 0, 100) == []
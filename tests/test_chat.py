@@ -0,0 +1,30 @@
+from backend import main
+from backend.idempotency import IdempotencyStore
+
+
+def test_chat_retry_with_the_same_key_replays_the_reply(api, calendar):
+    message = {"message": "Book Review on 2031-06-02 from 10:00 to 11:00"}
+
+    async def scenario(client):
+        first = await client.post("/chat", json=message, headers={"Idempotency-Key": "k1"})
+        retry = await client.post("/chat", json=message, headers={"Idempotency-Key": "k1"})
+        return first.json(), retry.json()
+
+    first, retry = api(scenario)
+    assert retry["response"] == first["response"]
+    assert calendar.server.state.request_counts["insert"] == 1
+    assert len(calendar.events()) == 1
+
+
+def test_chat_retry_after_the_stored_reply_expired_finds_the_event(api, calendar, monkeypatch):
+    message = {"message": "Book Review on 2031-06-02 from 10:00 to 11:00"}
+
+    async def scenario(client):
+        first = await client.post("/chat", json=message, headers={"Idempotency-Key": "k1"})
+        monkeypatch.setattr(main, "idempotency_store", IdempotencyStore())
+        retry = await client.post("/chat", json=message, headers={"Idempotency-Key": "k2"})
+        return first.json(), retry.json()
+
+    first, retry = api(scenario)
+    assert retry["response"].splitlines()[0] == first["response"].splitlines()[0]
+    assert len(calendar.events()) == 1
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend import busy_cache as busy_cache_module
+from backend import calendar_utils, main
+from backend.calendar_client import get_client_pool
+from backend.idempotency import IdempotencyStore
+
+START = datetime(2031, 7, 1, 10, tzinfo=timezone.utc)
+END = START + timedelta(hours=1)
+
+
+def test_retry_of_the_same_booking_returns_the_existing_event(calendar):
+    first = calendar_utils.create_event(START, END, "Sync", timezone="UTC", event_id="abc123")
+    again = calendar_utils.create_event(START, END, "Sync", timezone="UTC", event_id="abc123")
+    assert again["id"] == first["id"]
+    assert len(calendar.events()) == 1
+
+
+def test_id_of_another_event_is_a_conflict(calendar):
+    calendar_utils.create_event(START, END, "Sync", timezone="UTC", event_id="abc123")
+    with pytest.raises(calendar_utils.EventIdConflict):
+        calendar_utils.create_event(START, END, "Lunch", timezone="UTC", event_id="abc123")
+    with pytest.raises(calendar_utils.EventIdConflict):
+        calendar_utils.create_event(START + timedelta(days=1), END + timedelta(days=1), "Sync", timezone="UTC",
+                                    event_id="abc123")
+    assert [e["summary"] for e in calendar.events()] == ["Sync"]
+
+
+def test_deleted_booking_is_restored(calendar):
+    event = calendar_utils.create_event(START, END, "Sync", timezone="UTC", event_id="abc123")
+    with get_client_pool().service() as service:
+        service.events().delete(calendarId=calendar.calendar_id, eventId=event["id"]).execute()
+    assert calendar.events() == []
+    restored = calendar_utils.create_event(START, END, "Sync", timezone="UTC", event_id="abc123")
+    assert restored["status"] == "confirmed"
+    assert [e["id"] for e in calendar.events()] == ["abc123"]
+
+
+def test_book_key_reused_for_another_booking_is_rejected(api, calendar, monkeypatch):
+    booking = {"summary": "A", "start": "2031-06-03T10:00:00+00:00", "end": "2031-06-03T11:00:00+00:00"}
+    other = {"summary": "B", "start": "2031-06-04T10:00:00+00:00", "end": "2031-06-04T11:00:00+00:00"}
+
+    async def scenario(client):
+        first = await client.post("/book", json=booking, headers={"Idempotency-Key": "k1"})
+        # The stored result has expired; only the event id still ties the key to the first booking
+        monkeypatch.setattr(main, "idempotency_store", IdempotencyStore())
+        busy_cache_module.busy_cache.invalidate(calendar.calendar_id)
+        reused = await client.post("/book", json=other, headers={"Idempotency-Key": "k1"})
+        return first, reused
+
+    first, reused = api(scenario)
+    assert first.status_code == 200
+    assert reused.status_code == 409
+    assert [e["summary"] for e in calendar.events()] == ["A"]
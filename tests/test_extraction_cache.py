@@ -0,0 +1,79 @@
+from datetime import date
+
+from agent import extraction_cache as extraction_cache_module
+from agent.extraction_cache import ExtractionCache, templatize
+
+TODAY = date(2031, 6, 2)
+MESSAGE = "Book standup 2031-06-03 10:00-10:30"
+PARAMS = {"summary": "Standup", "date": "2031-06-03", "start_time": "10:00", "end_time": "10:30",
+          "description": "", "recurrence": ""}
+
+
+def test_exact_key_ignores_case_spacing_and_trailing_punctuation():
+    cache = ExtractionCache(path=None, templates=False)
+    cache.store(MESSAGE, PARAMS, TODAY)
+    assert cache.lookup("  book   STANDUP 2031-06-03 10:00-10:30!", TODAY) == PARAMS
+    assert cache.lookup("Book standup 2031-06-04 10:00-10:30", TODAY) is None
+    assert cache.stats()["template_hits"] == 0
+
+
+def test_lookup_returns_a_copy():
+    cache = ExtractionCache(path=None)
+    cache.store(MESSAGE, PARAMS, TODAY)
+    cache.lookup(MESSAGE, TODAY)["summary"] = "Changed"
+    assert cache.lookup(MESSAGE, TODAY)["summary"] == "Standup"
+
+
+def test_template_key_substitutes_new_dates_and_times():
+    cache = ExtractionCache(path=None)
+    cache.store(MESSAGE, PARAMS, TODAY)
+    params = cache.lookup("Book standup 2031-06-05 11:00-11:30", TODAY)
+    assert params == {**PARAMS, "date": "2031-06-05", "start_time": "11:00", "end_time": "11:30"}
+    assert cache.stats()["template_hits"] == 1
+
+
+def test_templatize_leaves_ambiguous_times_in_the_template():
+    template, tokens = templatize("book call 2031-06-03 at 3:00 until 15:30")
+    assert template == "book call <d> at 3:00 until <t>"
+    assert [value for _, _, value in tokens] == ["2031-06-03", "15:30"]
+
+
+def test_extraction_with_a_computed_time_is_not_templated():
+    # The end time comes from "for 2 hours", not from a token of the message
+    cache = ExtractionCache(path=None)
+    message = "Book review 2031-06-03 at 10:00 for 2 hours"
+    cache.store(message, {**PARAMS, "summary": "Review", "end_time": "12:00"}, TODAY)
+    assert cache.lookup("Book review 2031-06-04 at 11:00 for 2 hours", TODAY) is None
+    assert cache.lookup(message, TODAY)["end_time"] == "12:00"
+
+
+def test_extraction_copying_a_token_into_the_summary_is_not_templated():
+    cache = ExtractionCache(path=None)
+    cache.store("Book 10:00 standup 2031-06-03 10:00-10:30", {**PARAMS, "summary": "10:00 standup"}, TODAY)
+    assert cache.lookup("Book 11:00 standup 2031-06-03 11:00-11:30", TODAY) is None
+
+
+def test_entries_are_keyed_on_today():
+    cache = ExtractionCache(path=None)
+    cache.store("Book standup tomorrow 10:00-10:30", PARAMS, TODAY)
+    assert cache.lookup("Book standup tomorrow 10:00-10:30", TODAY) == PARAMS
+    assert cache.lookup("Book standup tomorrow 10:00-10:30", date(2031, 6, 3)) is None
+
+
+def test_persisted_entries_survive_a_restart_until_the_cache_version_changes(tmp_path, monkeypatch):
+    path = str(tmp_path / "extractions.db")
+    ExtractionCache(path=path).store(MESSAGE, PARAMS, TODAY)
+    assert ExtractionCache(path=path).lookup(MESSAGE, TODAY) == PARAMS
+    monkeypatch.setattr(extraction_cache_module, "CACHE_VERSION", "next")
+    assert ExtractionCache(path=path).lookup(MESSAGE, TODAY) is None
+
+
+def test_lru_bound_and_disabled_cache():
+    cache = ExtractionCache(path=None, max_entries=2, templates=False)
+    for i in range(3):
+        cache.store(f"message {i}", PARAMS, TODAY)
+    assert cache.lookup("message 0", TODAY) is None
+    assert cache.lookup("message 2", TODAY) == PARAMS
+    disabled = ExtractionCache(path=None, enabled=False)
+    disabled.store(MESSAGE, PARAMS, TODAY)
+    assert disabled.lookup(MESSAGE, TODAY) is None
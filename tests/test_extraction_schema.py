@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from agent import booking_agent
+from agent.extraction_cache import ExtractionCache
+from agent.extraction_schema import MISSING, EventDetails, ExtractionStats, decode_json_object, parse_event_details
+from benchmarks.fake_gemini import StubMessage
+
+# Not a message the fast path can read, so Gemini is asked
+MESSAGE = "Set up the quarterly review with finance"
+GOOD = {"summary": "Quarterly review", "date": "2031-06-03", "start_time": "10:00", "end_time": "11:00"}
+
+
+def test_blank_fields_are_missing_and_missing_optional_fields_are_empty():
+    details = EventDetails(summary="  ", date=None, description="MISSING", recurrence="null")
+    assert details.model_dump() == {"summary": MISSING, "date": MISSING, "start_time": MISSING,
+                                    "end_time": MISSING, "description": "", "recurrence": ""}
+
+
+def test_times_are_normalized_to_two_digit_hours():
+    details = EventDetails(date=" 2031-06-03 ", start_time="9:05", end_time=" 17:30 ")
+    assert (details.date, details.start_time, details.end_time) == ("2031-06-03", "09:05", "17:30")
+
+
+@pytest.mark.parametrize("fields", [
+    {"date": "2031-02-30"},
+    {"date": "tomorrow"},
+    {"start_time": "24:00"},
+    {"end_time": "10:60"},
+    {"start_time": "3pm"},
+])
+def test_invalid_dates_and_times_are_rejected(fields):
+    with pytest.raises(ValidationError):
+        EventDetails(**fields)
+
+
+@pytest.mark.parametrize("text", [
+    '{"summary": "Sync"}',
+    'Sure! Here it is:\n```json\n{"summary": "Sync"}\n```',
+    'The {braces} come first, then {"summary": "Sync"} and more text',
+])
+def test_decode_json_object_finds_the_object_in_prose_and_fences(text):
+    assert decode_json_object(text) == {"summary": "Sync"}
+
+
+def test_decode_json_object_keeps_nested_objects_and_skips_non_objects():
+    assert decode_json_object('[1, 2] {"a": {"b": [1, {"c": 2}]}}') == {"a": {"b": [1, {"c": 2}]}}
+    for text in ("", "no json here", "[1, 2]", '{"summary": "unterminated'):
+        with pytest.raises(ValueError):
+            decode_json_object(text)
+
+
+def test_parse_event_details_validates_the_decoded_object():
+    assert parse_event_details(json.dumps(GOOD)).summary == "Quarterly review"
+    with pytest.raises(ValueError):
+        parse_event_details('{"date": "06/03/2031"}')
+
+
+class SequenceLLM:
+    """
+    Answers each call with the next of answers, keeping the prompts it was sent.
+    """
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def invoke(self, messages, **kwargs):
+        self.prompts.append(messages)
+        return StubMessage(self.answers.pop(0))
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages)
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = ExtractionStats()
+    monkeypatch.setattr(booking_agent, "extraction_stats", stats)
+    monkeypatch.setattr(booking_agent, "extraction_cache", ExtractionCache(path=None))
+    return stats
+
+
+def extract(model, monkeypatch):
+    monkeypatch.setattr(booking_agent, "_llm", model)
+    return booking_agent.extract_event_parameters([{"role": "user", "content": MESSAGE}], timezone="UTC")
+
+
+def test_valid_answer_is_used_as_is(stats, monkeypatch):
+    model = SequenceLLM(json.dumps(GOOD))
+    params, _ = extract(model, monkeypatch)
+    assert params["start_time"] == "10:00"
+    assert len(model.prompts) == 1
+    assert stats.snapshot()["parse_failures"] == 0
+
+
+def test_malformed_answer_is_repaired_once(stats, monkeypatch):
+    model = SequenceLLM(json.dumps({**GOOD, "date": "2031-06-31"}), json.dumps(GOOD))
+    params, raw = extract(model, monkeypatch)
+    assert params["date"] == "2031-06-03"
+    assert json.loads(raw) == GOOD
+    # The repair request shows Gemini its answer and what was wrong with it
+    repair = model.prompts[1]
+    assert repair[:-2] == model.prompts[0]
+    assert "2031-06-31" in repair[-2].content
+    assert "not valid" in repair[-1].content
+    assert stats.snapshot()["repaired"] == 1
+
+
+def test_answer_still_malformed_after_the_repair_fails_cleanly(stats, monkeypatch):
+    model = SequenceLLM("I cannot help with that.", json.dumps({**GOOD, "start_time": "25:00"}), json.dumps(GOOD))
+    params, raw = extract(model, monkeypatch)
+    assert params == {}
+    assert raw.startswith("[extract_event_parameters Exception]")
+    assert "HH:MM" in raw
+    # No second repair
+    assert len(model.prompts) == 2
+    snapshot = stats.snapshot()
+    assert (snapshot["failed"], snapshot["repaired"], snapshot["llm_calls"]) == (1, 0, 2)
+
+
+def test_async_extraction_repairs_too(stats, monkeypatch):
+    model = SequenceLLM("not json", json.dumps(GOOD))
+    monkeypatch.setattr(booking_agent, "_llm", model)
+    params, _ = asyncio.run(booking_agent.aextract_event_parameters([{"role": "user", "content": MESSAGE}],
+                                                                    timezone="UTC"))
+    assert params["summary"] == "Quarterly review"
+    assert stats.snapshot()["repaired"] == 1
+
+
+class StructuredLLM(SequenceLLM):
+    """
+    Offers a structured-output mode answering {"raw", "parsed", "parsing_error"}, as Gemini does.
+    """
+
+    def with_structured_output(self, schema, include_raw=False):
+        model = self
+
+        class Bound:
+            def invoke(self, messages, **kwargs):
+                message = model.invoke(messages)
+                try:
+                    return {"raw": message, "parsed": parse_event_details(message.content), "parsing_error": None}
+                except ValueError as e:
+                    return {"raw": message, "parsed": None, "parsing_error": e}
+
+        return Bound()
+
+
+def test_structured_output_parsing_error_is_repaired(stats, monkeypatch):
+    model = StructuredLLM(json.dumps({**GOOD, "end_time": "noon"}), json.dumps(GOOD))
+    params, _ = extract(model, monkeypatch)
+    assert params["end_time"] == "11:00"
+    assert len(model.prompts) == 2
+    assert stats.snapshot()["repaired"] == 1
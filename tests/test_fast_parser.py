@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+
+from agent import fast_parser
+from agent.fast_parser import parse_booking_message, try_fast_path
+
+# A Monday
+TODAY = date(2031, 6, 2)
+
+
+@pytest.mark.parametrize("message, summary, day, start, end, description", [
+    ("Book team sync 2031-07-10 15:00-16:00", "Team sync", "2031-07-10", "15:00", "16:00", ""),
+    ("Schedule dentist tomorrow at 3pm for 1 hour for stomach ache",
+     "Dentist", "2031-06-03", "15:00", "16:00", "stomach ache"),
+    ("lunch with the client next friday from 12:30 to 1:30pm",
+     "Lunch with the client", "2031-06-06", "12:30", "13:30", ""),
+    ("Book review on June 5th 10am-11am", "Review", "2031-06-05", "10:00", "11:00", ""),
+    ("Sync tomorrow 11 to 1pm", "Sync", "2031-06-03", "11:00", "13:00", ""),
+    ("Call tomorrow at noon for half an hour", "Call", "2031-06-03", "12:00", "12:30", ""),
+])
+def test_well_formed_messages_are_parsed_confidently(message, summary, day, start, end, description):
+    params, confidence = parse_booking_message(message, TODAY)
+    assert params == {"summary": summary, "date": day, "start_time": start, "end_time": end,
+                      "description": description}
+    assert confidence == 1.0
+
+
+@pytest.mark.parametrize("message", [
+    "What do I have tomorrow?",
+    "Cancel the sync tomorrow at 3pm",
+    "Standup every weekday at 9:00 for 15 minutes",
+    "Meeting 5/6 10:00-11:00",
+    "Meeting tomorrow",
+    "Meeting tomorrow at 10:00",
+    "Sync 2031-07-10 2031-07-11 10:00-11:00",
+    "Book call 2031-02-30 10:00-11:00",
+    "Plan 2031-07-10 10:00-11:00 and 14:00-15:00",
+    "Review tomorrow 18:00-17:00",
+    "",
+])
+def test_messages_it_cannot_read_are_rejected(message):
+    assert parse_booking_message(message, TODAY) == (None, 0.0)
+
+
+@pytest.mark.parametrize("message", [
+    # 3 to 4 could be night or afternoon
+    "Team sync on 2031-07-10 from 3 to 4",
+    # A time-like word is left over in the summary
+    "Sync tomorrow 10:00-11:00 morning",
+])
+def test_ambiguous_messages_get_low_confidence(message):
+    params, confidence = parse_booking_message(message, TODAY)
+    assert params is not None
+    assert confidence < fast_parser.FAST_PATH_MIN_CONFIDENCE
+
+
+def history(message):
+    return [{"role": "user", "content": "earlier message"}, {"role": "assistant", "content": "ok"},
+            {"role": "user", "content": message}]
+
+
+def test_fast_path_answers_confident_messages_from_the_latest_user_turn():
+    params, raw = try_fast_path(history("Book team sync 2031-07-10 15:00-16:00"), TODAY)
+    assert params["summary"] == "Team sync"
+    assert raw.startswith("[fast-path")
+
+
+@pytest.mark.parametrize("message", ["Team sync on 2031-07-10 from 3 to 4", "What do I have tomorrow?"])
+def test_fast_path_falls_back_to_the_llm(message):
+    assert try_fast_path(history(message), TODAY) is None
+
+
+def test_fast_path_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(fast_parser, "FAST_PATH_ENABLED", False)
+    assert try_fast_path(history("Book team sync 2031-07-10 15:00-16:00"), TODAY) is None
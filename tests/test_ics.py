@@ -0,0 +1,147 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.ics import event_from_vevent, fold, import_events, iter_lines, iter_vevents, parse_line
+
+
+def vevent(*lines):
+    return ["BEGIN:VEVENT", *lines, "END:VEVENT"]
+
+
+def calendar_file(*events):
+    return "\r\n".join(["BEGIN:VCALENDAR", "VERSION:2.0", *[line for event in events for line in event],
+                        "END:VCALENDAR"]) + "\r\n"
+
+
+def parse(text, timezone="UTC"):
+    [item] = [event_from_vevent(event, timezone) for event in iter_vevents(iter_lines([text]))]
+    return item
+
+
+def parse_all(text):
+    return [event_from_vevent(event)["body"] for event in iter_vevents(iter_lines([text]))]
+
+
+def test_folded_lines_are_unfolded_across_chunk_boundaries():
+    text = "SUMMARY:A long\r\n  title\r\nDESCRIPTION:first\r\n\tsecond\nUID:1\r\n"
+    data = text.encode("utf-8-sig")
+    chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+    assert list(iter_lines(chunks)) == ["SUMMARY:A long title", "DESCRIPTION:firstsecond", "UID:1"]
+    assert list(iter_lines([text])) == list(iter_lines(chunks))
+
+
+def test_multibyte_characters_split_between_chunks_are_decoded():
+    data = "SUMMARY:Café Zoë\r\n".encode()
+    assert list(iter_lines([data[:12], data[12:]])) == ["SUMMARY:Café Zoë"]
+
+
+def test_fold_round_trips_through_iter_lines():
+    line = "DESCRIPTION:" + "é" * 100
+    folded = fold(line)
+    assert all(len(part.encode()) <= 75 for part in folded.split("\r\n"))
+    assert list(iter_lines([folded + "\r\n"])) == [line]
+
+
+def test_parse_line_keeps_separators_inside_quoted_parameters():
+    assert parse_line('ATTENDEE;CN="Doe; John":mailto:john@example.com') == (
+        "ATTENDEE", {"CN": "Doe; John"}, "mailto:john@example.com")
+    with pytest.raises(ValueError):
+        parse_line("no separator here")
+
+
+def test_alarms_and_timezone_definitions_are_skipped():
+    text = calendar_file(["BEGIN:VTIMEZONE", "TZID:Custom", "END:VTIMEZONE"],
+                         vevent("SUMMARY:Sync", "BEGIN:VALARM", "SUMMARY:Reminder", "END:VALARM", "UID:1"))
+    assert list(iter_vevents(iter_lines([text]))) == [{"SUMMARY": [({}, "Sync")], "UID": [({}, "1")]}]
+
+
+def test_tzid_start_is_read_in_that_zone():
+    item = parse(calendar_file(vevent("UID:1", "SUMMARY:Sync", "DTSTART;TZID=Europe/Berlin:20310603T100000",
+                                      "DURATION:PT1H30M")))
+    assert item["body"]["start"] == {"dateTime": "2031-06-03T10:00:00", "timeZone": "Europe/Berlin"}
+    assert item["body"]["end"] == {"dateTime": "2031-06-03T11:30:00", "timeZone": "Europe/Berlin"}
+    assert item["windows"] == [(datetime(2031, 6, 3, 8, tzinfo=timezone.utc).timestamp(),
+                                datetime(2031, 6, 3, 9, 30, tzinfo=timezone.utc).timestamp())]
+
+
+def test_unknown_tzid_and_floating_times_are_read_in_the_import_timezone():
+    for start in ('DTSTART;TZID="W. Europe Standard Time":20310603T100000', "DTSTART:20310603T100000"):
+        item = parse(calendar_file(vevent("UID:1", start, "DTEND:20310603T110000")), "America/New_York")
+        assert item["body"]["start"] == {"dateTime": "2031-06-03T10:00:00", "timeZone": "America/New_York"}
+        assert item["windows"][0][0] == datetime(2031, 6, 3, 14, tzinfo=timezone.utc).timestamp()
+
+
+def test_date_values_make_an_all_day_event():
+    item = parse(calendar_file(vevent("UID:1", "SUMMARY:Holiday", "DTSTART;VALUE=DATE:20310603")), "Europe/Paris")
+    assert item["body"]["start"] == {"date": "2031-06-03"}
+    assert item["body"]["end"] == {"date": "2031-06-04"}
+    assert item["windows"] == [(datetime(2031, 6, 2, 22, tzinfo=timezone.utc).timestamp(),
+                                datetime(2031, 6, 3, 22, tzinfo=timezone.utc).timestamp())]
+
+
+def test_escaped_text_and_cancelled_or_transparent_events():
+    item = parse(calendar_file(vevent("UID:1", r"SUMMARY:Sync\, then lunch\; maybe", r"DESCRIPTION:a\nb",
+                                      "DTSTART:20310603T100000Z", "DTEND:20310603T110000Z", "TRANSP:TRANSPARENT")))
+    assert item["body"]["summary"] == "Sync, then lunch; maybe"
+    assert item["body"]["description"] == "a\nb"
+    assert item["windows"] == []
+    assert parse(calendar_file(vevent("UID:1", "DTSTART:20310603T100000Z", "STATUS:CANCELLED"))) is None
+
+
+@pytest.mark.parametrize("lines", [
+    ["SUMMARY:No start"],
+    ["DTSTART:2031-06-03"],
+    ["DTSTART:20310603T100000Z", "DTEND:20310603T090000Z"],
+    ["DTSTART:20310603T100000Z", "DURATION:P"],
+])
+def test_events_that_cannot_be_imported_raise_value_error(lines):
+    with pytest.raises(ValueError):
+        parse(calendar_file(vevent("UID:1", *lines)))
+
+
+def events_file(count):
+    return calendar_file(*[vevent(f"UID:event-{i}", f"SUMMARY:Event {i}", f"DTSTART:203106{i + 1:02d}T100000Z",
+                                  f"DTEND:203106{i + 1:02d}T110000Z") for i in range(count)])
+
+
+def run_import(text, skip=0):
+    return list(import_events(iter_vevents(iter_lines([text])), "UTC", skip=skip, chunk_size=2))
+
+
+def test_import_reports_progress_per_chunk(calendar):
+    updates = run_import(events_file(5))
+    assert [(u["done"], u["imported"], u["complete"]) for u in updates] == [(2, 2, False), (4, 4, False),
+                                                                           (5, 5, True)]
+    assert len(calendar.events()) == 5
+
+
+def test_resumed_import_does_not_duplicate_events(calendar):
+    text = events_file(5)
+    # The client saw done=2, but the second chunk made it to the calendar before the connection dropped
+    first_run = import_events(iter_vevents(iter_lines([text])), "UTC", chunk_size=2)
+    assert [next(first_run)["done"], next(first_run)["done"]] == [2, 4]
+    first_run.close()
+    updates = run_import(text, skip=2)
+    assert updates[-1] == {"done": 5, "imported": 3, "conflicts": 0, "errors": 0, "cancelled": 0,
+                           "complete": True, "failed": []}
+    assert sorted(e["summary"] for e in calendar.events()) == [f"Event {i}" for i in range(5)]
+    # A full rerun finds every event already there
+    assert run_import(text)[-1]["imported"] == 5
+    assert len(calendar.events()) == 5
+
+
+def test_import_and_export_endpoints_stream_through_the_calendar_executor(api, calendar):
+    text = events_file(3)
+
+    async def scenario(client):
+        resumed = await client.post("/import/ics", params={"skip": 1}, content=text.encode())
+        exported = await client.get("/export/ics", params={"start": "2031-06-01T00:00:00Z",
+                                                           "end": "2031-07-01T00:00:00Z"})
+        return resumed, exported
+
+    resumed, exported = api(scenario)
+    assert [json.loads(line)["done"] for line in resumed.text.splitlines()] == [3]
+    assert exported.headers["content-type"].startswith("text/calendar")
+    assert [e["summary"] for e in parse_all(exported.text)] == ["Event 1", "Event 2"]
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+from backend.idempotency import booking_event_id, request_key
+from backend.tenants import Tenant, use_tenant
+
+START = datetime(2031, 5, 5, 10, tzinfo=timezone.utc)
+END = START + timedelta(hours=1)
+
+
+def test_booking_event_id_ignores_how_the_booking_was_written():
+    paris = timezone(timedelta(hours=2))
+    assert booking_event_id("me@example.com", START, END, "Team sync") == booking_event_id(
+        "me@example.com", START.astimezone(paris), END.astimezone(paris), "  Team   sync ", "")
+    assert booking_event_id("me@example.com", START, END, "Sync", "RRULE:FREQ=WEEKLY") == booking_event_id(
+        "me@example.com", START, END, "Sync", " rrule:freq=weekly ")
+
+
+def test_booking_event_id_differs_per_booking():
+    base = booking_event_id("me@example.com", START, END, "Sync")
+    others = [booking_event_id("me@example.com", START, END, "Lunch"),
+              booking_event_id("me@example.com", START + timedelta(days=1), END + timedelta(days=1), "Sync"),
+              booking_event_id("me@example.com", START, END + timedelta(minutes=30), "Sync"),
+              booking_event_id("other@example.com", START, END, "Sync"),
+              booking_event_id("me@example.com", START, END, "Sync", "RRULE:FREQ=DAILY")]
+    assert base not in others
+    assert len(set(others)) == len(others)
+
+
+def test_request_key_is_scoped_per_endpoint_and_tenant():
+    payload = {"message": "hello"}
+    assert request_key("chat", "k1", payload) != request_key("book", "k1", payload)
+    assert request_key("chat", None, payload) == request_key("chat", None, dict(payload))
+    with use_tenant(Tenant("a", "a@example.com")):
+        key_a = request_key("chat", "k1", payload)
+        derived_a = request_key("chat", None, payload)
+    with use_tenant(Tenant("b", "b@example.com")):
+        assert request_key("chat", "k1", payload) != key_a
+        assert request_key("chat", None, payload) != derived_a
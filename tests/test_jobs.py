@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from backend import main
+from backend.jobs import JobQueue, JobStore, SQLiteJobStore, job_id_for, new_job
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, clock):
+    if request.param == "memory":
+        return JobStore(clock=clock)
+    return SQLiteJobStore(str(tmp_path / "jobs.db"), clock=clock)
+
+
+def test_job_id_follows_key_and_payload():
+    payload = {"summary": "Sync", "start": "2031-05-05T10:00:00+00:00"}
+    assert job_id_for("book:k1", payload) == job_id_for("book:k1", dict(reversed(payload.items())))
+    assert job_id_for("book:k1", payload) != job_id_for("book:k1", {**payload, "summary": "Lunch"})
+    assert job_id_for("book:k1", payload) != job_id_for("book:k2", payload)
+
+
+def submit(store, clock, job_id, kind="book", calendar_id="cal"):
+    clock.now += 1
+    store.add(new_job(job_id, kind, {"n": job_id}, calendar_id, clock.now))
+
+
+def claim(store, limit=10, lease=60):
+    return [job["id"] for job in store.claim({"book"}, limit, lease)]
+
+
+def test_claim_batches_jobs_of_one_kind_and_calendar(store, clock):
+    submit(store, clock, "1")
+    submit(store, clock, "2", calendar_id="other")
+    submit(store, clock, "3")
+    submit(store, clock, "4", kind="chat")
+    submit(store, clock, "5", kind="chat")
+    submit(store, clock, "6")
+    assert claim(store) == ["1", "3", "6"]
+    assert claim(store) == ["2"]
+    # Kinds that are not batched are claimed one at a time
+    assert claim(store) == ["4"]
+    assert claim(store) == ["5"]
+    assert claim(store) == []
+    assert store.counts() == {"running": 6}
+
+
+def test_claim_takes_at_most_limit_jobs_oldest_first(store, clock):
+    for job_id in "123":
+        submit(store, clock, job_id)
+    assert claim(store, limit=2) == ["1", "2"]
+    assert claim(store, limit=2) == ["3"]
+
+
+def test_expired_lease_is_claimed_by_another_worker(tmp_path, clock):
+    path = str(tmp_path / "jobs.db")
+    first, second = SQLiteJobStore(path, clock=clock), SQLiteJobStore(path, clock=clock)
+    submit(first, clock, "1")
+    assert claim(first, lease=10) == ["1"]
+    clock.now += 9
+    assert claim(second) == []
+    clock.now += 2
+    assert claim(second) == ["1"]
+
+
+def test_renewed_lease_is_not_claimed(tmp_path, clock):
+    path = str(tmp_path / "jobs.db")
+    first, second = SQLiteJobStore(path, clock=clock), SQLiteJobStore(path, clock=clock)
+    submit(first, clock, "1")
+    claim(first, lease=10)
+    clock.now += 9
+    first.renew(["1"], 10)
+    clock.now += 9
+    assert claim(second) == []
+    first.finish("1", "done", {"ok": True})
+    clock.now += 60
+    assert claim(second) == []
+    assert second.get("1")["result"] == {"ok": True}
+
+
+def test_running_job_keeps_its_lease_past_the_lease_length(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    calls = []
+
+    async def slow(payload):
+        calls.append(payload)
+        await asyncio.sleep(0.5)
+        return "ok"
+
+    async def main():
+        queue = JobQueue(SQLiteJobStore(path), workers=1, lease=0.15, poll_interval=0.01, batch_window=0)
+        queue.register("slow", slow)
+        queue.submit("slow", {}, "1")
+        runner = asyncio.create_task(queue.run_forever())
+        try:
+            await asyncio.sleep(0.3)
+            # Twice the lease has passed; a worker sharing the file must still not take the job over
+            assert SQLiteJobStore(path).claim(set(), 1, 0.15) == []
+            return await queue.wait("1", 5)
+        finally:
+            runner.cancel()
+
+    job = asyncio.run(main())
+    assert job["status"] == "done"
+    assert job["result"] == "ok"
+    assert len(calls) == 1
+
+
+def test_job_of_another_tenant_is_not_found(api, tenants, monkeypatch):
+    queue = JobQueue(JobStore())
+    queue.register("book", main.run_book_jobs, batch=True)
+    monkeypatch.setattr(main, "job_queue", queue)
+    booking = {"summary": "A", "start": "2031-06-03T10:00:00+00:00", "end": "2031-06-03T11:00:00+00:00"}
+
+    async def scenario(client):
+        submitted = await client.post("/book", json=booking, headers={"Prefer": "respond-async",
+                                                                      "X-API-Key": "key-a"})
+        location = submitted.headers["Location"]
+        own = await client.get(location, headers={"X-API-Key": "key-a"})
+        other = await client.get(location, headers={"X-API-Key": "key-b"})
+        return submitted, own, other
+
+    submitted, own, other = api(scenario)
+    assert submitted.status_code == 202
+    assert own.status_code == 200
+    assert own.json()["job_id"] == submitted.json()["job_id"]
+    assert other.status_code == 404
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+from agent.llm_gateway import LLM_HEDGE_MIN_SAMPLES, LLMGateway, LLMOverloaded, LLMTimeout
+
+
+class FakeModel:
+    """
+    Answers "<prompt> answered" after latency seconds; latencies, if given, set the latency of
+    each call in turn (the last one repeats).
+    """
+
+    def __init__(self, latency=0.0, latencies=()):
+        self.latency = latency
+        self.latencies = list(latencies)
+        self.calls = []
+        self.cancelled = 0
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        latency = self.latencies.pop(0) if len(self.latencies) > 1 else (self.latencies or [self.latency])[0]
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"{messages[-1]} answered after {latency}"
+
+
+def gateway(**kwargs):
+    options = dict(max_concurrency=4, max_queued=10, queue_deadline=5, timeout=5, hedge=False)
+    options.update(kwargs)
+    return LLMGateway(**options)
+
+
+def call_all(llm_gateway, model, prompts, **kwargs):
+    async def main():
+        return await asyncio.gather(*[llm_gateway.ainvoke(model, [prompt], **kwargs) for prompt in prompts],
+                                    return_exceptions=True)
+    return asyncio.run(main())
+
+
+def test_identical_prompts_in_flight_share_one_call():
+    llm_gateway, model = gateway(), FakeModel(latency=0.1)
+    results = call_all(llm_gateway, model, ["book a sync"] * 5 + ["book lunch"])
+    assert results[:5] == ["book a sync answered after 0.1"] * 5
+    assert len(model.calls) == 2
+    assert llm_gateway.stats()["coalesced"] == 4
+
+
+def test_prompts_are_not_coalesced_once_answered_or_when_asked_not_to():
+    llm_gateway, model = gateway(), FakeModel()
+    assert llm_gateway.invoke(model, ["book a sync"]) == llm_gateway.invoke(model, ["book a sync"])
+    call_all(llm_gateway, model, ["book a sync"] * 3, coalesce=False)
+    assert len(model.calls) == 5
+    assert llm_gateway.stats()["coalesced"] == 0
+
+
+def test_calls_beyond_the_admission_queue_are_rejected():
+    llm_gateway, model = gateway(max_concurrency=1, max_queued=1), FakeModel(latency=0.2)
+    results = call_all(llm_gateway, model, ["first", "second", "third"])
+    assert results[:2] == ["first answered after 0.2", "second answered after 0.2"]
+    assert isinstance(results[2], LLMOverloaded)
+    stats = llm_gateway.stats()
+    assert (stats["rejected"], stats["max_waiting"]) == (1, 1)
+    assert [call[0] for call in model.calls] == ["first", "second"]
+
+
+def test_call_waiting_past_the_queue_deadline_is_rejected():
+    llm_gateway, model = gateway(max_concurrency=1, queue_deadline=0.05), FakeModel(latency=0.3)
+    results = call_all(llm_gateway, model, ["first", "second"])
+    assert results[0] == "first answered after 0.3"
+    assert isinstance(results[1], LLMOverloaded)
+
+
+def test_slow_call_times_out():
+    llm_gateway, model = gateway(timeout=0.1), FakeModel(latency=5)
+    with pytest.raises(LLMTimeout):
+        llm_gateway.invoke(model, ["slow"])
+    assert llm_gateway.stats()["timeouts"] == 1
+    # The abandoned attempt is cancelled rather than left running
+    time.sleep(0.05)
+    assert model.cancelled == 1
+
+
+def warm_up(llm_gateway, latency=0.01):
+    model = FakeModel(latency=latency)
+    for i in range(LLM_HEDGE_MIN_SAMPLES):
+        llm_gateway.invoke(model, [f"warm-up {i}"])
+
+
+def test_hedge_is_sent_after_the_p95_and_the_first_answer_wins():
+    llm_gateway = gateway(hedge=True, hedge_budget=1.0)
+    assert llm_gateway.hedge_delay() is None
+    warm_up(llm_gateway)
+    assert llm_gateway.hedge_delay() == pytest.approx(0.01, abs=0.05)
+    # The first attempt stalls; its hedge answers at once
+    model = FakeModel(latencies=[5, 0.0])
+    started = time.monotonic()
+    assert llm_gateway.invoke(model, ["stalls"]) == "stalls answered after 0.0"
+    assert time.monotonic() - started < 1
+    assert len(model.calls) == 2
+    stats = llm_gateway.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_no_hedge_without_a_free_slot_or_budget():
+    for options in ({"max_concurrency": 1, "hedge_budget": 1.0}, {"hedge_budget": 0.0}):
+        llm_gateway = gateway(hedge=True, hedge_after=0.02, **options)
+        model = FakeModel(latency=0.1)
+        assert llm_gateway.invoke(model, ["slow"]) == "slow answered after 0.1"
+        assert len(model.calls) == 1
+        assert llm_gateway.stats()["hedged"] == 0
+
+
+def test_caller_going_away_cancels_the_call_unless_others_wait_for_it():
+    llm_gateway, model = gateway(), FakeModel(latency=0.3)
+
+    async def main():
+        alone = asyncio.ensure_future(llm_gateway.ainvoke(model, ["alone"]))
+        shared = [asyncio.ensure_future(llm_gateway.ainvoke(model, ["shared"])) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        alone.cancel()
+        shared[0].cancel()
+        await asyncio.sleep(0.05)
+        return model.cancelled, await shared[1]
+
+    cancelled, answer = asyncio.run(main())
+    assert cancelled == 1
+    assert answer == "shared answered after 0.3"
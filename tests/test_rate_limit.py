@@ -0,0 +1,217 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from backend import calendar_utils
+from backend.rate_limit import RateLimiter, RateLimitExceeded, TokenBucket, deadline, is_retryable
+from benchmarks.fake_calendar import FakeCalendarState
+
+START = datetime(2031, 7, 1, 10, tzinfo=timezone.utc)
+END = START + timedelta(hours=1)
+
+
+class Clock:
+    """
+    A monotonic clock that only moves when something sleeps.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def http_error(status, retry_after=None, reason=None):
+    headers = {"status": str(status)}
+    if retry_after is not None:
+        headers["retry-after"] = str(retry_after)
+    content = {"error": {"code": status, "errors": [{"reason": reason}] if reason else []}}
+    return HttpError(httplib2.Response(headers), json.dumps(content).encode())
+
+
+def limiter(clock, **kwargs):
+    options = dict(project_qps=0, calendar_qps=10, calendar_burst=2, max_retries=3, backoff_base=0.5,
+                   backoff_max=32, default_deadline=20)
+    options.update(kwargs)
+    return RateLimiter(clock=clock, sleep=clock.sleep, **options)
+
+
+def test_bucket_spends_its_burst_then_goes_into_debt():
+    clock = Clock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+    assert [bucket.reserve(1) for _ in range(2)] == [0.0, 0.0]
+    # Each later caller waits behind the debt of the ones before it
+    assert bucket.reserve(1) == pytest.approx(0.1)
+    assert bucket.reserve(1) == pytest.approx(0.2)
+    # The debt is paid back at the refill rate
+    clock.now += 0.15
+    assert bucket.reserve(1) == pytest.approx(0.15)
+
+
+def test_bucket_refuses_a_reservation_past_the_deadline_and_takes_nothing():
+    clock = Clock()
+    bucket = TokenBucket(rate=1, burst=1, clock=clock)
+    bucket.reserve(1)
+    assert bucket.reserve(1, deadline=clock.now + 0.5) is None
+    assert bucket.reserve(1, deadline=clock.now + 1) == pytest.approx(1.0)
+
+
+def test_bucket_refills_up_to_its_burst_and_honours_blocks():
+    clock = Clock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+    clock.now += 60
+    assert [bucket.reserve(1) for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve(1) > 0
+    bucket.refund(1)
+    bucket.block(5)
+    assert bucket.reserve(1) == pytest.approx(5.0)
+
+
+def test_acquire_sleeps_the_longest_wait_of_its_buckets():
+    clock = Clock()
+    rate_limiter = limiter(clock, project_qps=1, project_burst=1)
+    rate_limiter.acquire("a")
+    rate_limiter.acquire("b")
+    assert clock.sleeps == [pytest.approx(1.0)]
+    assert rate_limiter.stats()["delayed"] == 1
+
+
+def test_acquire_past_the_deadline_raises_and_refunds_the_other_buckets():
+    clock = Clock()
+    rate_limiter = limiter(clock, project_qps=100, project_burst=1, calendar_qps=1, calendar_burst=1)
+    rate_limiter.acquire("a")
+    clock.now += 0.5
+    with pytest.raises(RateLimitExceeded):
+        rate_limiter.acquire("a", deadline=clock.now + 0.1)
+    # The project token taken before the calendar bucket refused was given back
+    rate_limiter.acquire("b", deadline=clock.now)
+    assert clock.sleeps == []
+    assert rate_limiter.stats()["rejected"] == 1
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (http_error(429), True),
+    (http_error(503), True),
+    (http_error(403, reason="rateLimitExceeded"), True),
+    (http_error(403, reason="quotaExceeded"), False),
+    (http_error(404), False),
+    (ValueError("not an HTTP error"), False),
+])
+def test_retryable_errors(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_retry_after_blocks_the_calendar_instead_of_sleeping():
+    clock = Clock()
+    rate_limiter = limiter(clock)
+    assert rate_limiter.retry_wait(http_error(429, retry_after=3), 0, "a", deadline=clock.now + 20)
+    assert clock.sleeps == []
+    rate_limiter.acquire("a")
+    assert clock.sleeps == [pytest.approx(3.0)]
+    # Other calendars are not held back
+    rate_limiter.acquire("b")
+    assert len(clock.sleeps) == 1
+
+
+def test_retry_without_buckets_sleeps_the_retry_after():
+    clock = Clock()
+    rate_limiter = limiter(clock, calendar_qps=0)
+    assert rate_limiter.retry_wait(http_error(503, retry_after=2), 0, "a")
+    assert clock.sleeps == [2.0]
+
+
+def test_retry_past_the_deadline_raises_with_the_retry_after():
+    clock = Clock()
+    rate_limiter = limiter(clock)
+    with pytest.raises(RateLimitExceeded) as raised:
+        rate_limiter.retry_wait(http_error(429, retry_after=30), 0, "a", deadline=clock.now + 20)
+    assert raised.value.retry_after == 30
+
+
+def test_no_retry_when_not_retryable_or_out_of_attempts():
+    clock = Clock()
+    rate_limiter = limiter(clock)
+    assert not rate_limiter.retry_wait(http_error(404), 0, "a")
+    assert not rate_limiter.retry_wait(http_error(429), 3, "a")
+
+
+def test_call_retries_until_it_succeeds():
+    clock = Clock()
+    rate_limiter = limiter(clock, backoff_base=0.01)
+    answers = [http_error(503), http_error(429, retry_after=1), "ok"]
+
+    def func():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert rate_limiter.call(func, "a") == "ok"
+    assert rate_limiter.stats()["retries"] == 2
+
+
+def test_call_stops_at_the_deadline_of_its_scope():
+    clock = Clock()
+    rate_limiter = limiter(clock, max_retries=10)
+
+    def failing():
+        raise http_error(429, retry_after=4)
+
+    with deadline(10):
+        # deadline() uses the real monotonic clock; line the fake one up with it
+        clock.now = time.monotonic()
+        with pytest.raises(RateLimitExceeded):
+            rate_limiter.call(failing, "a")
+    assert sum(clock.sleeps) <= 10
+
+
+def test_nested_deadline_never_extends_the_outer_one():
+    with deadline(1) as outer:
+        with deadline(60) as inner:
+            assert inner == outer
+        with deadline(0.5) as shorter:
+            assert shorter < outer
+
+
+@pytest.fixture
+def flaky_inserts(monkeypatch):
+    """
+    Makes the first two inserts that go through answer 503 anyway, as a Calendar backend error can.
+    """
+    dispatch = FakeCalendarState.dispatch
+    failed = []
+
+    def flaky(self, method, path, body):
+        status, payload = dispatch(self, method, path, body)
+        if method == 'POST' and path.split('?')[0].endswith('/events') and status == 200 and len(failed) < 2:
+            failed.append(path)
+            return 503, {"error": {"code": 503, "message": "Backend Error"}}
+        return status, payload
+
+    monkeypatch.setattr(FakeCalendarState, "dispatch", flaky)
+    return failed
+
+
+def test_insert_retried_after_a_5xx_is_created_once(calendar, flaky_inserts):
+    event = calendar_utils.create_event(START, END, "Solo", timezone="UTC")
+    assert event["summary"] == "Solo"
+    assert flaky_inserts
+    assert len(calendar.events()) == 1
+
+
+def test_batch_insert_retried_after_a_5xx_is_created_once(calendar, flaky_inserts):
+    body = calendar_utils.build_event_body(START, END, "Batch", timezone="UTC")
+    [result] = calendar_utils.insert_events_batch([body])
+    assert result["summary"] == "Batch"
+    assert flaky_inserts
+    assert len(calendar.events()) == 1
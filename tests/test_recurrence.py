@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend import calendar_utils
+from backend.recurrence import find_conflicts, iter_occurrences, normalize_rrule
+from backend.timezones import get_zone
+
+NEW_YORK = get_zone("America/New_York")
+# A Monday
+START = datetime(2031, 6, 2, 10, tzinfo=NEW_YORK)
+END = START + timedelta(hours=1)
+
+
+def starts(occurrences):
+    return [datetime.fromtimestamp(start, NEW_YORK) for start, _ in occurrences]
+
+
+def test_floating_until_is_read_in_the_zone_and_converted_to_utc():
+    # 18:00 in New York during DST is 22:00 UTC
+    assert normalize_rrule("freq=weekly;until=20310630T180000", NEW_YORK) == \
+        "RRULE:FREQ=WEEKLY;UNTIL=20310630T220000Z"
+    # A date-only UNTIL ends with that day, here 03:59:59 UTC the next day
+    assert normalize_rrule("RRULE:FREQ=DAILY;UNTIL=20311215", NEW_YORK) == \
+        "RRULE:FREQ=DAILY;UNTIL=20311216T045959Z"
+    assert normalize_rrule("FREQ=DAILY;UNTIL=20310630T180000Z", NEW_YORK) == \
+        "RRULE:FREQ=DAILY;UNTIL=20310630T180000Z"
+
+
+def test_until_in_the_zone_keeps_its_last_occurrence():
+    rule = normalize_rrule("FREQ=DAILY;UNTIL=20310604T100000", NEW_YORK)
+    assert starts(iter_occurrences(rule, START, END)) == [START + timedelta(days=i) for i in range(3)]
+
+
+@pytest.mark.parametrize("rule", ["", "COUNT=3", "FREQ=SOMETIMES", "FREQ=DAILY;UNTIL=tomorrow",
+                                  "RRULE:FREQ=DAILY\nRRULE:FREQ=WEEKLY"])
+def test_invalid_rules_raise_value_error(rule):
+    with pytest.raises(ValueError):
+        normalize_rrule(rule, NEW_YORK)
+
+
+def test_count_ends_the_series_before_the_horizon():
+    occurrences = list(iter_occurrences("RRULE:FREQ=WEEKLY;COUNT=3", START, END, until=START + timedelta(days=90)))
+    assert starts(occurrences) == [START + timedelta(weeks=i) for i in range(3)]
+    assert all(end - start == 3600 for start, end in occurrences)
+
+
+def test_horizon_truncates_a_longer_series():
+    occurrences = iter_occurrences("RRULE:FREQ=WEEKLY;COUNT=52", START, END, until=START + timedelta(days=21))
+    assert starts(occurrences) == [START + timedelta(weeks=i) for i in range(3)]
+    open_ended = iter_occurrences("RRULE:FREQ=DAILY", START, END, until=START + timedelta(days=10), limit=4)
+    assert len(list(open_ended)) == 4
+
+
+def test_occurrences_keep_their_wall_clock_time_across_dst():
+    start = datetime(2031, 10, 27, 9, tzinfo=NEW_YORK)
+    occurrences = starts(iter_occurrences("RRULE:FREQ=WEEKLY;COUNT=3", start, start + timedelta(hours=1)))
+    assert [o.hour for o in occurrences] == [9, 9, 9]
+    assert occurrences[2].utcoffset() != occurrences[0].utcoffset()
+
+
+def test_start_is_an_occurrence_even_if_the_rule_skips_it():
+    # The series starts on a Monday but repeats on Wednesdays
+    occurrences = starts(iter_occurrences("RRULE:FREQ=WEEKLY;BYDAY=WE;COUNT=2", START, END))
+    assert occurrences == [START, START + timedelta(days=2)]
+
+
+def test_conflict_on_a_later_occurrence_is_found():
+    occurrences = [(day * 100, day * 100 + 10) for day in range(6)]
+    busy = [(5, 8), (305, 320), (350, 360), (495, 505)]
+    conflicts = list(find_conflicts(occurrences, busy))
+    assert conflicts == [((0, 10), [(5, 8)]), ((300, 310), [(305, 320)]), ((500, 510), [(495, 505)])]
+    # Busy time that only touches an occurrence is no conflict
+    assert list(find_conflicts(occurrences, [(10, 100), (210, 300)])) == []
+
+
+def test_series_busy_on_its_fourth_occurrence_is_not_booked(calendar):
+    fourth = START + timedelta(weeks=3)
+    calendar.add_event(summary="Offsite", start={"dateTime": fourth.astimezone(timezone.utc).isoformat()},
+                       end={"dateTime": (fourth + timedelta(minutes=30)).astimezone(timezone.utc).isoformat()})
+    result = calendar_utils.book_recurring_if_free(START.replace(tzinfo=None).isoformat(),
+                                                   END.replace(tzinfo=None).isoformat(), "Weekly",
+                                                   timezone="America/New_York", recurrence="FREQ=WEEKLY;COUNT=6")
+    assert result["status"] == "busy"
+    assert result["occurrences"] == 6
+    assert result["conflicts"] == [{"start": fourth.isoformat(), "end": (fourth + timedelta(hours=1)).isoformat()}]
+    assert [e["summary"] for e in calendar.events()] == ["Offsite"]
@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+
+from backend.reservations import ReservationLedger, SQLiteReservationLedger
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_ledger(request, tmp_path, clock):
+    def make():
+        if request.param == "memory":
+            return ReservationLedger(lease_ttl=30, commit_ttl=60, clock=clock)
+        return SQLiteReservationLedger(str(tmp_path / "leases.db"), lease_ttl=30, commit_ttl=60, clock=clock)
+    return make
+
+
+def test_overlapping_reserve_is_rejected(make_ledger):
+    ledger = make_ledger()
+    lease, conflict = ledger.reserve("cal", 100, 200, owner="evt1")
+    assert lease is not None and conflict is None
+    for start, end in [(100, 200), (150, 160), (50, 101), (199, 300), (0, 1000)]:
+        assert ledger.reserve("cal", start, end) == (None, (100, 200, "evt1"))
+
+
+def test_adjacent_and_other_calendar_reserves_are_allowed(make_ledger):
+    ledger = make_ledger()
+    ledger.reserve("cal", 100, 200)
+    assert ledger.reserve("cal", 200, 300)[0] is not None
+    assert ledger.reserve("cal", 0, 100)[0] is not None
+    assert ledger.reserve("other", 100, 200)[0] is not None
+    assert ledger.active("cal") == 3
+    assert ledger.active() == 4
+
+
+def test_released_lease_frees_the_slot(make_ledger):
+    ledger = make_ledger()
+    lease, _ = ledger.reserve("cal", 100, 200)
+    ledger.release(lease)
+    assert ledger.reserve("cal", 100, 200)[0] is not None
+
+
+def test_committed_lease_is_not_released_and_outlives_the_lease_ttl(make_ledger, clock):
+    ledger = make_ledger()
+    lease, _ = ledger.reserve("cal", 100, 200, owner="evt1")
+    ledger.commit(lease)
+    ledger.release(lease)
+    clock.now += 45
+    assert ledger.reserve("cal", 100, 200) == (None, (100, 200, "evt1"))
+    clock.now += 20
+    assert ledger.reserve("cal", 100, 200)[0] is not None
+
+
+def test_expired_lease_no_longer_blocks(make_ledger, clock):
+    ledger = make_ledger()
+    ledger.reserve("cal", 100, 200)
+    clock.now += 31
+    assert ledger.active("cal") == 0
+    assert ledger.reserve("cal", 150, 250)[0] is not None
+
+
+def test_sweep_drops_expired_leases_nothing_overlapped(clock):
+    ledger = ReservationLedger(lease_ttl=30, clock=clock)
+    ledger.SWEEP_EVERY = 4
+    for i in range(3):
+        ledger.reserve("cal", i * 100, i * 100 + 50)
+    clock.now += 31
+    ledger.reserve("other", 0, 10)
+    assert len(ledger._leases) == 1
+    assert ledger._calendars["cal"] == ([], [], [])
+
+
+def test_concurrent_reserves_of_one_slot_have_one_winner(make_ledger):
+    ledger = make_ledger()
+    results = []
+    barrier = threading.Barrier(8)
+
+    def reserve():
+        barrier.wait()
+        results.append(ledger.reserve("cal", 100, 200)[0])
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(lease is not None for lease in results) == 1
+
+
+def test_sqlite_ledgers_on_one_file_see_each_others_leases(tmp_path, clock):
+    path = str(tmp_path / "leases.db")
+    first = SQLiteReservationLedger(path, lease_ttl=30, commit_ttl=60, clock=clock)
+    second = SQLiteReservationLedger(path, lease_ttl=30, commit_ttl=60, clock=clock)
+    lease, _ = first.reserve("cal", 100, 200, owner="evt1")
+    assert second.reserve("cal", 150, 250) == (None, (100, 200, "evt1"))
+    first.commit(lease)
+    second.release(lease)
+    assert second.active("cal") == 1
+    clock.now += 61
+    assert second.reserve("cal", 150, 250)[0] is not None
+    assert first.reserve("cal", 100, 200)[1] == (150, 250, None)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from backend import main
+from backend.sessions import SESSION_TURN_LEASE, SessionBusy, SessionStore, SQLiteSessionStore
+
+
+def test_session_turn_repeating_an_earlier_message_is_not_replayed(api, calendar):
+    async def scenario(client):
+        reply = (await client.post("/chat", json={"message": "Meeting on 2031-05-05"})).json()
+        session = {"session_id": reply["session_id"]}
+        await client.post("/chat", json={"message": "from 10:00 to 11:00", **session})
+        await client.post("/chat", json={"message": "Lunch on 2031-05-06", **session})
+        return (await client.post("/chat", json={"message": "from 10:00 to 11:00", **session})).json()
+
+    reply = api(scenario)
+    assert "Lunch" in reply["response"]
+    assert sorted(e["summary"] for e in calendar.events()) == ["Lunch", "Meeting"]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return SessionStore() if request.param == "memory" else SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+
+def test_session_belongs_to_its_tenant(store):
+    session = store.get("s1", "a")
+    session.params = {"summary": "Sync"}
+    store.save(session)
+    assert store.get("s1", "a").params == {"summary": "Sync"}
+    other = store.get("s1", "b")
+    assert other.session_id != "s1"
+    assert other.tenant_id == "b"
+
+
+async def take_turn(store, session_id, message, pause=0.01):
+    async with store.turn(session_id):
+        session = store.get(session_id)
+        session.add_turn("user", message)
+        # The LLM and Calendar calls of the turn
+        await asyncio.sleep(pause)
+        session.add_turn("assistant", f"reply to {message}")
+        store.save(session)
+
+
+def test_concurrent_turns_of_a_session_are_serialized(store):
+    async def main():
+        await asyncio.gather(*(take_turn(store, "s1", f"message {i}") for i in range(3)))
+
+    asyncio.run(main())
+    lines = list(store.get("s1").lines)
+    assert len(lines) == 6
+    assert [line.startswith("User: ") for line in lines] == [True, False] * 3
+    assert store._turns._locks == {}
+
+
+def test_turn_waiting_too_long_is_rejected(store):
+    store.turn_timeout = 0.05
+
+    async def main():
+        return await asyncio.gather(take_turn(store, "s1", "slow", pause=0.3), take_turn(store, "s1", "next"),
+                                    return_exceptions=True)
+
+    slow, rejected = asyncio.run(main())
+    assert slow is None
+    assert isinstance(rejected, SessionBusy)
+    assert len(store.get("s1").lines) == 2
+
+
+def test_new_sessions_do_not_wait(store):
+    async def main():
+        async with store.turn(None):
+            async with store.turn(None):
+                return True
+
+    assert asyncio.run(main())
+
+
+def test_sqlite_turns_are_serialized_across_workers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    workers = [SQLiteSessionStore(path), SQLiteSessionStore(path)]
+
+    async def main():
+        await asyncio.gather(*(take_turn(workers[i % 2], "s1", f"message {i}") for i in range(4)))
+
+    asyncio.run(main())
+    assert len(workers[0].get("s1").lines) == 8
+
+
+def test_sqlite_claim_of_a_dead_worker_expires(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    dead = SQLiteSessionStore(path)
+    assert dead._claim_turn("s1", "dead-token")
+    live = SQLiteSessionStore(path, turn_timeout=0.1)
+    with pytest.raises(SessionBusy):
+        asyncio.run(take_turn(live, "s1", "hello"))
+    clock = [time.time() + SESSION_TURN_LEASE + 1]
+    live._clock = lambda: clock[0]
+    asyncio.run(take_turn(live, "s1", "hello"))
+    assert len(live.get("s1").lines) == 2
+
+
+def test_concurrent_chat_turns_of_a_session_keep_every_message(api, monkeypatch):
+    store = SessionStore()
+    monkeypatch.setattr(main, "session_store", store)
+
+    async def scenario(client):
+        session = {"session_id": "s1"}
+        return await asyncio.gather(*(client.post("/chat", json={"message": message, **session})
+                                      for message in ["Meeting on 2031-05-05", "from 10:00 to 11:00"]))
+
+    replies = api(scenario)
+    assert [reply.status_code for reply in replies] == [200, 200]
+    assert len(store.get("s1").lines) == 4
@@ -0,0 +1,82 @@
+from datetime import datetime, time as dt_time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from backend.slots import find_free_slots, merge_intervals
+
+UTC = timezone.utc
+# A Monday
+MONDAY = datetime(2031, 6, 2, tzinfo=UTC)
+
+
+def at(hour, minute=0, day=MONDAY, zone=UTC):
+    return datetime.combine(day.date(), dt_time(hour, minute), zone).timestamp()
+
+
+def as_local(slots, zone=UTC):
+    return [(datetime.fromtimestamp(s, zone).strftime("%a %H:%M"), datetime.fromtimestamp(e, zone).strftime("%H:%M"))
+            for s, e in slots]
+
+
+def test_merge_intervals_merges_overlapping_and_touching():
+    assert merge_intervals([(5, 8), (1, 3), (2, 4), (4, 5), (10, 12)]) == [(1, 8), (10, 12)]
+    assert merge_intervals([(1, 10), (2, 3)]) == [(1, 10)]
+    assert merge_intervals([]) == []
+
+
+def test_overlapping_busy_intervals_are_skipped_as_one():
+    busy = [(at(9), at(10)), (at(9, 30), at(11)), (at(10, 45), at(11, 15))]
+    slots = find_free_slots(busy, MONDAY, MONDAY + timedelta(days=1), timedelta(hours=1), limit=2)
+    # The first start after 11:15 on the 15-minute grid
+    assert as_local(slots) == [("Mon 11:15", "12:15"), ("Mon 12:15", "13:15")]
+
+
+def test_slots_fit_exactly_at_the_working_window_edges():
+    busy = [(at(10), at(17))]
+    slots = find_free_slots(busy, MONDAY, MONDAY + timedelta(days=1), timedelta(hours=1))
+    assert as_local(slots) == [("Mon 09:00", "10:00"), ("Mon 17:00", "18:00")]
+
+
+def test_slot_that_would_end_after_work_moves_to_the_next_day():
+    busy = [(at(9), at(17, 30))]
+    slots = find_free_slots(busy, MONDAY, MONDAY + timedelta(days=2), timedelta(hours=1), limit=1)
+    assert as_local(slots) == [("Tue 09:00", "10:00")]
+
+
+def test_range_start_inside_the_working_day_is_aligned_to_the_grid():
+    start = datetime(2031, 6, 2, 13, 7, tzinfo=UTC)
+    slots = find_free_slots([], start, start + timedelta(hours=3), timedelta(minutes=30), limit=2)
+    assert as_local(slots) == [("Mon 13:15", "13:45"), ("Mon 13:45", "14:15")]
+
+
+def test_weekends_are_skipped_unless_included():
+    saturday = datetime(2031, 6, 7, tzinfo=UTC)
+    end = saturday + timedelta(days=3)
+    assert as_local(find_free_slots([], saturday, end, timedelta(hours=1), limit=1)) == [("Mon 09:00", "10:00")]
+    assert as_local(find_free_slots([], saturday, end, timedelta(hours=1), limit=1, include_weekends=True)) == [
+        ("Sat 09:00", "10:00")]
+
+
+def test_working_windows_crossing_utc_midnight_follow_the_local_day():
+    # 09:00-18:00 in Auckland (UTC+12 in June) is 21:00 the day before to 06:00 UTC
+    auckland = ZoneInfo("Pacific/Auckland")
+    start = datetime(2031, 6, 2, tzinfo=auckland)
+    busy = [(at(9, day=start, zone=auckland), at(17, day=start, zone=auckland))]
+    slots = find_free_slots(busy, start, start + timedelta(days=2), timedelta(hours=1), limit=2)
+    assert as_local(slots, auckland) == [("Mon 17:00", "18:00"), ("Tue 09:00", "10:00")]
+    assert as_local(slots, UTC) == [("Mon 05:00", "06:00"), ("Mon 21:00", "22:00")]
+
+
+def test_grid_is_aligned_to_local_midnight_in_offset_zones():
+    kolkata = ZoneInfo("Asia/Kolkata")
+    start = datetime(2031, 6, 2, 9, 10, tzinfo=kolkata)
+    slots = find_free_slots([], start, start + timedelta(hours=2), timedelta(minutes=30), limit=1)
+    assert as_local(slots, kolkata) == [("Mon 09:15", "09:45")]
+
+
+@pytest.mark.parametrize("duration, granularity", [(timedelta(0), timedelta(minutes=15)),
+                                                   (timedelta(hours=1), timedelta(0))])
+def test_non_positive_duration_or_granularity_is_rejected(duration, granularity):
+    with pytest.raises(ValueError):
+        find_free_slots([], MONDAY, MONDAY + timedelta(days=1), duration, granularity=granularity)
@@ -0,0 +1,30 @@
+import json
+
+ICS = ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+       "BEGIN:VEVENT\r\nUID:review\r\nSUMMARY:Review\r\nDTSTART:20310603T100000Z\r\nDTEND:20310603T110000Z\r\n"
+       "END:VEVENT\r\nEND:VCALENDAR\r\n")
+
+
+def summaries(calendar, calendar_id):
+    return [e["summary"] for e in calendar.server.state.events.get(calendar_id, []) if e["status"] != "cancelled"]
+
+
+def test_imports_under_two_api_keys_land_on_their_own_calendars(api, calendar, tenants):
+    async def scenario(client):
+        return [await client.post("/import/ics", content=ICS.encode(), headers={"X-API-Key": key})
+                for key in ("key-a", "key-b")]
+
+    responses = api(scenario)
+    # The same file on the other tenant's calendar is no conflict
+    assert [json.loads(r.text.splitlines()[-1])["imported"] for r in responses] == [1, 1]
+    assert summaries(calendar, tenants["a"].calendar_id) == ["Review"]
+    assert summaries(calendar, tenants["b"].calendar_id) == ["Review"]
+    assert calendar.events() == []
+
+
+def test_requests_without_a_known_key_are_refused(api, tenants):
+    async def scenario(client):
+        return [await client.post("/import/ics", content=ICS.encode(), headers=headers)
+                for headers in ({}, {"X-API-Key": "unknown"})]
+
+    assert [r.status_code for r in api(scenario)] == [401, 401]